@@ -1,14 +1,17 @@
 __author__ = "Fox Cunning"
 
+from abc import ABC, abstractmethod
+from typing import Optional
+
 import pyo
 
+from APU.noise import noise_sequence
+from APU.units import CPU_FREQ, STEP_CYCLES, Envelope, FrameSequencer, LengthCounter, Sweep
+
 # Lookup tables
 _NOISE_VOLUME = [0., .06, .12, .18, .24, .30, .36, .42, .48, .54, .6, .66, .72, .78, .84, .9]
 _PULSE_VOLUME = [0., .03, .06, .09, .12, .15, .18, .21, .24, .27, .3, .33, .36, .39, .42, .45]
 
-_LENGTH_COUNTER_LOAD = [10, 254, 20, 2, 40, 4, 80, 6, 160, 8, 60, 10, 14, 12, 26, 14,
-                        12, 16, 24, 18, 48, 20, 96, 22, 192, 24, 72, 26, 16, 28, 32, 30]
-
 """
 _NOISE_FREQ = [4811.2, 2405.6, 1202.8, 601.4, 300.7, 200.5, 150.4, 120.3,
                95.3, 75.8, 50.6, 37.9, 25.3, 18.9, 9.5, 4.7]
@@ -26,29 +29,92 @@ _NOISE_FREQ = [[12.933, 6.466, 3.233, 1.616, .808, .538, .404, .323,
 
 # ----------------------------------------------------------------------------------------------------------------------
 
-class PulseChannel:
+class _Channel(ABC):
+    """
+    Length counter, and cached output parameters shared by all the channels.
+    The pyo output is only updated when its volume or frequency actually change.
+    """
 
     def __init__(self):
-        # Register 0: $4000 / $4004
-        self.duty_cycle: int = 0
-        self.length_ctr_halt: bool = False
-        self.constant_volume: bool = False
-        self.volume_envelope: int = 0
+        self.length_ctr: LengthCounter = LengthCounter()
 
-        # Register 1: $4001 / $4005
-        self.sweep_enabled: bool = False
-        self.sweep_period: int = 0
-        self.sweep_negate: bool = False
-        self.sweep_shift: int = 0
+        self.output: Optional[pyo.PyoObject] = None
+        self._volume: float = 0.
+        self._freq: float = 0.
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def _set_volume(self, volume: float) -> None:
+        if volume != self._volume:
+            self._volume = volume
+            self.output.setMul(volume)
+
+    # ------------------------------------------------------------------------------------------------------------------
 
-        # Register 2: $4002 / $4006
-        self.timer_low: int = 0
+    def _set_freq(self, freq: float) -> None:
+        if freq != self._freq:
+            self._freq = freq
+            self.output.setFreq(freq)
 
-        # Register 3: $4003 / $4007
-        self.timer_high: int = 0
-        self.length_ctr_load = 0
+    # ------------------------------------------------------------------------------------------------------------------
+
+    @abstractmethod
+    def _update_volume(self) -> None:
+        """
+        Sets the output volume according to the channel's current state
+        """
+
+    # ------------------------------------------------------------------------------------------------------------------
 
-        self._length_ctr: int = 0
+    def set_enabled(self, enabled: bool) -> None:
+        """
+        Enables / disables the channel, as done by writing to $4015
+        """
+        self.length_ctr.set_enabled(enabled)
+        self._update_volume()
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def write_reg1(self, value: int) -> None:
+        pass
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def half_frame(self) -> None:
+        """
+        Clocks the Length Counter (if not halted).
+        """
+        self.length_ctr.clock()
+        self._update_volume()
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def quarter_frame(self) -> None:
+        pass
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+
+class PulseChannel(_Channel):
+
+    def __init__(self, ones_complement: bool = False):
+        """
+        Parameters
+        ----------
+        ones_complement: bool
+            True for the first pulse channel, see Sweep
+        """
+        super().__init__()
+
+        # Register 0: $4000 / $4004
+        self.duty_cycle: int = 2
+        self.envelope: Envelope = Envelope()
+
+        # Register 1: $4001 / $4005
+        self.sweep: Sweep = Sweep(ones_complement)
+
+        # Registers 2 and 3: $4002 / $4006 and $4003 / $4007
+        self.timer: int = 0
 
         # Create one table per duty cycle value
         self.sequence = [[(0, 0.), (7, 0.), (8, 1.), (16, 1.), (17, 0.)],  # 12.5% Duty
@@ -56,13 +122,28 @@ class PulseChannel:
                          [(0, 0.), (7, 0.), (8, 1.), (40, 1.), (41, 0.)],  # 50% Duty
                          [(0, 1.), (7, 1.), (8, 0.), (16, 0.), (17, 1.)]]  # 75% Duty
 
-        self.linear_table = pyo.LinTable(self.sequence[2], size=64)
+        self.linear_table = pyo.LinTable(self.sequence[self.duty_cycle], size=64)
 
         # Pulse wave output
         self.output = pyo.Osc(self.linear_table, 0, interp=1, mul=0)
 
     # ------------------------------------------------------------------------------------------------------------------
 
+    def _update_volume(self) -> None:
+        # Periods under 8, or sweeping out of range, silence the channel
+        if self.length_ctr.active and not self.sweep.muting(self.timer):
+            self._set_volume(_PULSE_VOLUME[self.envelope.volume])
+        else:
+            self._set_volume(0.)
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def _update_timer(self) -> None:
+        self._set_freq(CPU_FREQ / ((self.timer + 1) << 4))
+        self._update_volume()
+
+    # ------------------------------------------------------------------------------------------------------------------
+
     def write_reg0(self, value: int) -> None:
         """
         Writes a value to register 0 ($4000 / $4004)
@@ -73,39 +154,29 @@ class PulseChannel:
             Byte value to write to the register
         """
         duty = value >> 6
-        self.linear_table.replace(self.sequence[duty])
-
-        self.length_ctr_halt = (value & 0x20) > 0
-        if self.length_ctr_halt:
-            self.length_ctr_load = 0
+        if duty != self.duty_cycle:
+            self.duty_cycle = duty
+            self.linear_table.replace(self.sequence[duty])
 
-        self.constant_volume = (value & 0x10) > 0
-        self.volume_envelope = value & 0x0F
+        self.length_ctr.halt = (value & 0x20) > 0
+        self.envelope.write(value)
 
-        if self.constant_volume:
-            self.output.setMul(_PULSE_VOLUME[self.volume_envelope])
-        else:
-            # TODO Envelope
-            pass
+        self._update_volume()
 
     # ------------------------------------------------------------------------------------------------------------------
 
     def write_reg1(self, value: int) -> None:
         """
-        Writes a value to register 0 ($4000 / $4004)
+        Writes a value to register 1 ($4001 / $4005)
 
         Parameters
         ----------
         value: int
             Byte value to write to the register
         """
-        self.sweep_enabled = (value & 0x80) > 0
+        self.sweep.write(value)
 
-        self.sweep_period = (value >> 4) & 0x07
-
-        self.sweep_negate = (value & 0x08) > 0
-
-        self.sweep_shift = value & 0x07
+        self._update_volume()
 
     # ------------------------------------------------------------------------------------------------------------------
 
@@ -118,9 +189,9 @@ class PulseChannel:
         value: int
             Byte value to write to the register
         """
-        self.timer_low = value
+        self.timer = (self.timer & 0x700) | value
 
-        self.output.setFreq(1789773 / (((value | self.timer_high) + 1) << 4))
+        self._update_timer()
 
     # ------------------------------------------------------------------------------------------------------------------
 
@@ -133,12 +204,11 @@ class PulseChannel:
         value: int
             Byte value to write to the register
         """
-        self.timer_high = (value & 0x07) << 8
-        self.length_ctr_load = value >> 3
-
-        self.output.setFreq(1789773 / (((self.timer_high | self.timer_low) + 1) << 4))
+        self.timer = ((value & 0x07) << 8) | (self.timer & 0xFF)
+        self.length_ctr.load(value)
+        self.envelope.restart()
 
-        # TODO Restart envelope, if enabled
+        self._update_timer()
 
     # ------------------------------------------------------------------------------------------------------------------
 
@@ -146,33 +216,34 @@ class PulseChannel:
         """
         Clocks the Sweep Unit and Length Counter (if enabled).
         """
-        pass
+        self.length_ctr.clock()
+        self.timer = self.sweep.clock(self.timer)
+
+        self._update_timer()
 
     # ------------------------------------------------------------------------------------------------------------------
 
     def quarter_frame(self) -> None:
         """
-        Clocks the Envelope for this channel (if enabled).
+        Clocks the Envelope for this channel.
         """
-        pass
+        self.envelope.clock()
+
+        self._update_volume()
 
 
 # ----------------------------------------------------------------------------------------------------------------------
 
-class TriangleChannel:
+class TriangleChannel(_Channel):
     def __init__(self):
+        super().__init__()
+
         # Register 0 ($4008)
-        self.control_flag: bool = False
         self.linear_ctr_reload_value: int = 0
 
-        # Register 2 ($400A)
-        self.timer_low: int = 0
+        # Registers 2 and 3 ($400A, $400B)
+        self.timer: int = 0
 
-        # Register 3 ($400B)
-        self.timer_high: int = 0
-        self.length_ctr_load: int = 0
-
-        self._length_ctr: int = 0
         self._linear_ctr: int = 0
         self._linear_ctr_reload_flag: bool = False
 
@@ -188,20 +259,20 @@ class TriangleChannel:
 
     # ------------------------------------------------------------------------------------------------------------------
 
-    def half_frame(self) -> None:
-        """
-        Clocks the Length Counter (if enabled).
-        """
-        if not self.control_flag:
-            if self._length_ctr > 0:
-                self._length_ctr -= 1
+    @property
+    def control_flag(self) -> bool:
+        # The same bit halts the length counter
+        return self.length_ctr.halt
 
-        if self._linear_ctr == 0 and self._length_ctr == 0:
-            # Mute channel when the counter has reached zero
-            if self.output.mul > 0:
-                self.output.setMul(0)
-        elif self.output.mul == 0:
-            self.output.setMul(self.volume)
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def _update_volume(self) -> None:
+        # The sequencer stops when either counter is zero: mute the channel instead of holding its last level.
+        # Ultrasonic periods are silenced too.
+        if self.length_ctr.active and self._linear_ctr > 0 and self.timer > 1:
+            self._set_volume(self.volume)
+        else:
+            self._set_volume(0.)
 
     # ------------------------------------------------------------------------------------------------------------------
 
@@ -217,6 +288,8 @@ class TriangleChannel:
         if not self.control_flag:
             self._linear_ctr_reload_flag = False
 
+        self._update_volume()
+
     # ------------------------------------------------------------------------------------------------------------------
 
     def write_reg0(self, value: int) -> None:
@@ -231,20 +304,11 @@ class TriangleChannel:
             C = Linear Counter Control Flag / Length Counter Halt Flag
              RRR RRRR = Linear Counter Reload Value
         """
-        self.control_flag = (value & 0x80) > 0
-        self._length_ctr = 0
-
-        # self.output.setMul(self.volume)
-
+        self.length_ctr.halt = (value & 0x80) > 0
         self.linear_ctr_reload_value = value & 0x7F
 
     # ------------------------------------------------------------------------------------------------------------------
 
-    def write_reg1(self, value: int) -> None:
-        pass
-
-    # ------------------------------------------------------------------------------------------------------------------
-
     def write_reg2(self, value: int) -> None:
         """
         Writes a value to register 2 ($400A)
@@ -254,9 +318,10 @@ class TriangleChannel:
         value: int
             Byte value to write to the register
         """
-        self.timer_low = value
+        self.timer = (self.timer & 0x700) | value
 
-        self.output.setFreq(1789773 / (((value | self.timer_high) + 1) << 5))
+        self._set_freq(CPU_FREQ / ((self.timer + 1) << 5))
+        self._update_volume()
 
     # ------------------------------------------------------------------------------------------------------------------
 
@@ -269,72 +334,45 @@ class TriangleChannel:
         value: int
             Byte value to write to the register
         """
-        self.timer_high = (value & 0x07) << 8
-        self.length_ctr_load = _LENGTH_COUNTER_LOAD[value >> 3]
-
-        self.output.setFreq(1789773 / (((self.timer_high | self.timer_low) + 1) << 5))
-
+        self.timer = ((value & 0x07) << 8) | (self.timer & 0xFF)
+        self.length_ctr.load(value)
         self._linear_ctr_reload_flag = True
-        if not self.control_flag:
-            self._length_ctr = self.length_ctr_load
-            # self.output.setMul(self.volume)
+
+        self._set_freq(CPU_FREQ / ((self.timer + 1) << 5))
+        self._update_volume()
 
 
 # ----------------------------------------------------------------------------------------------------------------------
 
-class NoiseChannel:
+class NoiseChannel(_Channel):
     def __init__(self):
+        super().__init__()
+
         # Register 0 ($400C)
-        self.length_ctr_halt: bool = False
-        self.constant_volume: bool = False
-        self.volume_envelope: int = 0
+        self.envelope: Envelope = Envelope()
 
-        # Register 1 ($400E)
+        # Register 2 ($400E)
         self.mode: int = 0
         self.period: int = 0
 
-        # Register 2 ($400F)
-        self.length_ctr_load: int = 0
-
-        self._length_ctr: int = 0
-
-        # Nasty tricks will have to be used here...
-
-        print("Generating noise wave tables...")
-
-        seq_0 = []
-        sr = 1
-        prev_val = -1
-        for i in range(0, 32767 * 2, 2):
-            val = (sr & 1) ^ 1
-            if val != prev_val:
-                seq_0.append((i, val))
-                seq_0.append((i + 1, val))
-
-            feedback = ((sr & 1) ^ ((sr >> 1) & 1)) % 2
-            sr = (sr >> 1) | (feedback << 14)
-
-        seq_1 = []
-        prev_val = -1
-        for i in range(0, 93 * 2, 2):
-            val = (sr & 1) ^ 1
-            if val != prev_val:
-                seq_1.append((i, val))
-                seq_1.append((i + 1, val))
-
-            feedback = ((sr & 1) ^ ((sr >> 6) & 1)) % 2
-            sr = (sr >> 1) | (feedback << 14)
-
+        # One table per mode, one sample per shift register step
         self.table = []
-        self.table.append(pyo.LinTable(seq_0, 32767 * 2))
-        self.table.append(pyo.LinTable(seq_1, 93 * 2))
-
-        print("...done!")
+        for mode in range(2):
+            sequence = noise_sequence(mode)
+            self.table.append(pyo.DataTable(size=len(sequence), init=[float(b) for b in sequence]))
 
         self.output = pyo.Osc(self.table[0], freq=0, phase=0, interp=1, mul=0)
 
     # ------------------------------------------------------------------------------------------------------------------
 
+    def _update_volume(self) -> None:
+        if self.length_ctr.active:
+            self._set_volume(_NOISE_VOLUME[self.envelope.volume])
+        else:
+            self._set_volume(0.)
+
+    # ------------------------------------------------------------------------------------------------------------------
+
     def write_reg0(self, value: int) -> None:
         """
         Writes a value to Register 0 ($400C)
@@ -343,23 +381,10 @@ class NoiseChannel:
         value: int
             Byte value to write to the register
         """
-        self.length_ctr_halt = (value & 0x20) > 0
-        if self.length_ctr_halt:
-            self.length_ctr_load = 0
-
-        self.constant_volume = (value & 0x10) > 0
-        self.volume_envelope = value & 0x0F
+        self.length_ctr.halt = (value & 0x20) > 0
+        self.envelope.write(value)
 
-        if self.constant_volume:
-            self.output.setMul(_NOISE_VOLUME[self.volume_envelope])
-        else:
-            # TODO Envelope
-            pass
-
-    # ------------------------------------------------------------------------------------------------------------------
-
-    def write_reg1(self, value: int) -> None:
-        pass
+        self._update_volume()
 
     # ------------------------------------------------------------------------------------------------------------------
 
@@ -380,7 +405,7 @@ class NoiseChannel:
         if old_mode != self.mode:
             self.output.setTable(self.table[self.mode])
 
-        self.output.setFreq(_NOISE_FREQ[self.mode][self.period])
+        self._set_freq(_NOISE_FREQ[self.mode][self.period])
 
     # ------------------------------------------------------------------------------------------------------------------
 
@@ -393,45 +418,104 @@ class NoiseChannel:
         value: int
             Byte value to write to the register
         """
-        self.length_ctr_load = value >> 3
+        self.length_ctr.load(value)
+        self.envelope.restart()
 
-        # TODO Restart envelope
+        self._update_volume()
 
     # ------------------------------------------------------------------------------------------------------------------
 
-    def half_frame(self) -> None:
+    def quarter_frame(self) -> None:
         """
-        Clocks the Sweep Unit and Length Counter (if enabled).
+        Clocks the Envelope for this channel.
         """
-        pass
+        self.envelope.clock()
+
+        self._update_volume()
+
+
+class APU:
 
     # ------------------------------------------------------------------------------------------------------------------
 
-    def quarter_frame(self) -> None:
+    def __init__(self, server: Optional[pyo.Server] = None):
         """
-        Clocks the Envelope for this channel (if enabled).
+        The channels are only created the first time they are used, so that the sound server does not need to be
+        booted until something is actually played.
+
+        Parameters
+        ----------
+        server: Optional[pyo.Server]
+            The sound server, booted on first use if needed; if None, it must be booted before using the channels
         """
-        pass
+        self._server: Optional[pyo.Server] = server
+        self._triangle_volume: float = 1.
 
+        self._pulse_0: Optional[PulseChannel] = None
+        self._pulse_1: Optional[PulseChannel] = None
+        self._triangle: Optional[TriangleChannel] = None
+        self._noise: Optional[NoiseChannel] = None
+        self.pattern: Optional[pyo.Pattern] = None
 
-# ----------------------------------------------------------------------------------------------------------------------
+        self.frame_sequencer: FrameSequencer = FrameSequencer()
 
-class APU:
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def _create_channels(self) -> None:
+        """
+        Boots the sound server if needed, then creates the channels and the frame sequencer clock.
+        """
+        if self._server is not None and not self._server.getIsBooted():
+            self._server.boot()
+
+        self._pulse_0 = PulseChannel(ones_complement=True)
+        self._pulse_1 = PulseChannel()
+        self._triangle = TriangleChannel()
+        self._triangle.volume = self._triangle_volume
+        self._noise = NoiseChannel()
+        self.pattern = pyo.Pattern(self.clock, time=STEP_CYCLES / CPU_FREQ)
 
     # ------------------------------------------------------------------------------------------------------------------
 
-    def __init__(self):
-        self._ticks: int = 0
+    @property
+    def pulse_0(self) -> PulseChannel:
+        if self._pulse_0 is None:
+            self._create_channels()
+        return self._pulse_0
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    @property
+    def pulse_1(self) -> PulseChannel:
+        if self._pulse_1 is None:
+            self._create_channels()
+        return self._pulse_1
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    @property
+    def triangle(self) -> TriangleChannel:
+        if self._triangle is None:
+            self._create_channels()
+        return self._triangle
 
-        self.pulse_0: PulseChannel = PulseChannel()
-        self.pulse_1: PulseChannel = PulseChannel()
-        self.triangle: TriangleChannel = TriangleChannel()
-        self.noise: NoiseChannel = NoiseChannel()
-        self.pattern: pyo.Pattern = pyo.Pattern(self.clock, time=0.004)
+    # ------------------------------------------------------------------------------------------------------------------
+
+    @property
+    def noise(self) -> NoiseChannel:
+        if self._noise is None:
+            self._create_channels()
+        return self._noise
 
     # ------------------------------------------------------------------------------------------------------------------
 
     def reset(self) -> None:
+        if self.pattern is None:
+            # Nothing to reset: new channels start muted
+            return
+
+        self.write(0x4015, 0x0F)
+        self.write(0x4017, 0)
         self.pulse_0.write_reg0(0x30)
         self.pulse_0.write_reg1(0)
         self.pulse_0.write_reg2(0)
@@ -449,6 +533,33 @@ class APU:
 
     # ------------------------------------------------------------------------------------------------------------------
 
+    def write(self, address: int, value: int) -> None:
+        """
+        Writes a value to one of the APU registers
+
+        Parameters
+        ----------
+        address: int
+            Register address, $4000 to $400F for channel registers, $4015 for the status register or $4017 for the
+            frame counter
+        value: int
+            Byte value to write to the register
+        """
+        if address == 0x4015:
+            self.pulse_0.set_enabled((value & 0x01) > 0)
+            self.pulse_1.set_enabled((value & 0x02) > 0)
+            self.triangle.set_enabled((value & 0x04) > 0)
+            self.noise.set_enabled((value & 0x08) > 0)
+
+        elif address == 0x4017:
+            self._clock_units(*self.frame_sequencer.write(value))
+
+        else:
+            channel = [self.pulse_0, self.pulse_1, self.triangle, self.noise][((address - 0x4000) >> 2) & 3]
+            [channel.write_reg0, channel.write_reg1, channel.write_reg2, channel.write_reg3][address & 3](value)
+
+    # ------------------------------------------------------------------------------------------------------------------
+
     def play(self) -> None:
         if not self.pulse_0.output.isOutputting():
             self.pulse_0.output.out()
@@ -464,6 +575,9 @@ class APU:
     # ------------------------------------------------------------------------------------------------------------------
 
     def stop(self) -> None:
+        if self.pattern is None:
+            return
+
         if self.pattern.isPlaying():
             self.pattern.stop()
         if self.pulse_0.output.isOutputting():
@@ -479,24 +593,22 @@ class APU:
 
     def clock(self) -> None:
         """
-        250 Hz clock: call this 250 times / sec, or every 0.004 seconds (4ms).
+        Frame sequencer clock: call this every 7457.5 CPU cycles, or ~240 times / sec.
         """
+        self._clock_units(*self.frame_sequencer.step())
+
+    # ------------------------------------------------------------------------------------------------------------------
 
-        # Clock envelopes
-        self.pulse_0.quarter_frame()
-        self.pulse_1.quarter_frame()
-        self.triangle.quarter_frame()
-        self.noise.quarter_frame()
+    def _clock_units(self, quarter_frame: bool, half_frame: bool) -> None:
+        channels = [self.pulse_0, self.pulse_1, self.triangle, self.noise]
 
-        self._ticks += 1
-        if self._ticks > 3:
-            self._ticks = 0
+        if quarter_frame:
+            for channel in channels:
+                channel.quarter_frame()
 
-        elif self._ticks == 1 or self._ticks == 3:
-            self.pulse_0.half_frame()
-            self.pulse_1.half_frame()
-            self.triangle.half_frame()
-            self.noise.half_frame()
+        if half_frame:
+            for channel in channels:
+                channel.half_frame()
 
     # ------------------------------------------------------------------------------------------------------------------
 
@@ -506,4 +618,6 @@ class APU:
         elif value < 0.:
             value = 0.
 
-        self.triangle.volume = value
+        self._triangle_volume = value
+        if self._triangle is not None:
+            self._triangle.volume = value
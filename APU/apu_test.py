@@ -1,10 +1,12 @@
 """
 A small test program for the APU emulator module.
+Run it from the editor's folder with: python -m APU.apu_test
 """
 
 import pyo
 
-from APU import APU
+from APU.APU import APU
+from APU.units import CPU_FREQ, STEP_CYCLES
 
 _PULSE_REG0 = [0x3C, 0x3A, 0x3A, 0x3A, 0x38, 0x38, 0x30, 0x30]
 _PULSE_REG2 = [0x44, 0x54, 0x44, 0x04, 0x04, 0x04, 0x04, 0x04]
@@ -46,13 +48,13 @@ def write_values(apu_instance: APU):
 if __name__ == '__main__':
     server = pyo.Server(48000, nchnls=1).boot()
 
-    apu = APU()
+    apu = APU(server)
 
     # DEBUG
     # test = pyo.LFO(freq=200, type=2, mul=0.5).out()
 
     # 240 Hz clock
-    pattern = pyo.Pattern(function=apu.clock, time=0.004).play()
+    pattern = pyo.Pattern(function=apu.clock, time=STEP_CYCLES / CPU_FREQ).play()
 
     # Period = $3F8 -> Frequency should be 110 Hz
     apu.pulse_0.write_reg0(0x30)
@@ -0,0 +1,47 @@
+__author__ = "Fox Cunning"
+
+from functools import lru_cache
+
+# Length of the sequence produced by the noise channel's shift register, for each mode
+NOISE_SEQUENCE_LENGTH = [32767, 93]
+
+# Bit XOR-ed with bit 0 to produce the feedback, for each mode
+_FEEDBACK_TAP = [1, 6]
+
+# Turns shift register bits into output values: the channel is silent when bit 0 is set
+_OUTPUT = bytes([1, 0]) + bytes(254)
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+
+@lru_cache(maxsize=2)
+def noise_sequence(mode: int) -> bytes:
+    """
+    Generates the output of the noise channel's 15-bit shift register over a full period, starting from its power-up
+    value of 1. The result is cached, so this only runs once per mode.
+
+    Each new bit is bit 0 XOR bit 1 (or bit 6 in mode 1) of the register, shifted in at the top: that is, bit n + 15
+    of the sequence is bit n XOR bit n + tap. This allows generating up to 15 - tap bits at a time.
+
+    Parameters
+    ----------
+    mode: int
+        0 for the long sequence (32767 steps), 1 for the short one (93 steps)
+
+    Returns
+    -------
+    bytes
+        The output (0 or 1) of the channel at each step
+    """
+    length = NOISE_SEQUENCE_LENGTH[mode]
+    tap = _FEEDBACK_TAP[mode]
+    block = 15 - tap
+
+    bits = bytearray(length + 15 + block)
+    bits[0] = 1
+
+    for n in range(0, length, block):
+        value = int.from_bytes(bits[n:n + block], "big") ^ int.from_bytes(bits[n + tap:n + tap + block], "big")
+        bits[n + 15:n + 15 + block] = value.to_bytes(block, "big")
+
+    return bytes(bits[:length]).translate(_OUTPUT)
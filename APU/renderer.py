@@ -0,0 +1,517 @@
+"""
+Offline APU emulation: renders register writes straight into sample buffers or WAV files, without a sound server.
+
+The channels have the same write_reg0..3 interface as the live APU channels, so the same register streams can drive
+either of them. Time is measured in CPU cycles, and samples are generated between register writes and frame counter
+clocks, so that the result does not depend on how fast the host machine is.
+"""
+
+__author__ = "Fox Cunning"
+
+import wave
+from abc import ABC, abstractmethod
+from functools import lru_cache
+from typing import Iterable, List, Sequence, Tuple
+
+import numpy as np
+
+from APU.noise import noise_sequence
+from APU.units import CPU_FREQ, STEP_CYCLES, Envelope, FrameSequencer, LengthCounter, Sweep
+
+# CPU cycles per video frame (the music driver runs once per NMI)
+FRAME_CYCLES = 29780.5
+
+# Output of the pulse sequencer at each of its 8 steps, one row per duty cycle value
+_DUTY_SEQUENCE = np.array([[0, 1, 0, 0, 0, 0, 0, 0],     # 12.5%
+                           [0, 1, 1, 0, 0, 0, 0, 0],     # 25%
+                           [0, 1, 1, 1, 1, 0, 0, 0],     # 50%
+                           [1, 0, 0, 1, 1, 1, 1, 1]],    # 25% negated
+                          dtype=np.float32)
+
+# Output of the triangle sequencer at each of its 32 steps
+_TRIANGLE_SEQUENCE = np.array(list(range(15, -1, -1)) + list(range(16)), dtype=np.float32)
+
+# Noise timer periods (NTSC), in CPU cycles
+_NOISE_PERIOD = [4, 8, 16, 32, 64, 96, 128, 160, 202, 254, 380, 508, 762, 1016, 2034, 4068]
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+
+@lru_cache(maxsize=2)
+def _noise_sequence(mode: int) -> np.ndarray:
+    """
+    Parameters
+    ----------
+    mode: int
+        0 for the long (32767 steps) sequence, 1 for the short (93 steps) one
+
+    Returns
+    -------
+    np.ndarray
+        Output of the channel (0 or 1) at each step
+    """
+    return np.frombuffer(noise_sequence(mode), dtype=np.uint8).astype(np.float32)
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+
+class _Channel(ABC):
+    """
+    Length counter and register interface shared by all the channels
+    """
+
+    def __init__(self):
+        self.length_ctr: LengthCounter = LengthCounter()
+
+        # Position in the channel's sequence, as a fraction of a step
+        self._phase: float = 0.
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def set_enabled(self, enabled: bool) -> None:
+        """
+        Enables / disables the channel, as done by writing to $4015
+        """
+        self.length_ctr.set_enabled(enabled)
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def half_frame(self) -> None:
+        """
+        Clocks the Length Counter (if not halted).
+        """
+        self.length_ctr.clock()
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def quarter_frame(self) -> None:
+        pass
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def write_reg1(self, value: int) -> None:
+        pass
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    @abstractmethod
+    def render(self, count: int, sample_rate: int) -> np.ndarray:
+        """
+        Generates the channel's output for a number of samples, with the current register values
+
+        Returns
+        -------
+        np.ndarray
+            Output levels (0-15), one per sample
+        """
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+
+class PulseChannel(_Channel):
+
+    def __init__(self, ones_complement: bool = False):
+        """
+        Parameters
+        ----------
+        ones_complement: bool
+            True for the first pulse channel, see Sweep
+        """
+        super().__init__()
+
+        # Register 0: $4000 / $4004
+        self.duty_cycle: int = 0
+        self.envelope: Envelope = Envelope()
+
+        # Register 1: $4001 / $4005
+        self.sweep: Sweep = Sweep(ones_complement)
+
+        # Registers 2 and 3: $4002 / $4006 and $4003 / $4007
+        self.timer: int = 0
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def write_reg0(self, value: int) -> None:
+        self.duty_cycle = value >> 6
+        self.length_ctr.halt = (value & 0x20) > 0
+        self.envelope.write(value)
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def write_reg1(self, value: int) -> None:
+        self.sweep.write(value)
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def write_reg2(self, value: int) -> None:
+        self.timer = (self.timer & 0x700) | value
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def write_reg3(self, value: int) -> None:
+        """
+        Writes a value to register 3 ($4003 / $4007)
+
+        The sequencer is not restarted here, as the editor writes the period to all registers every frame.
+        """
+        self.timer = ((value & 0x07) << 8) | (self.timer & 0xFF)
+        self.length_ctr.load(value)
+        self.envelope.restart()
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def quarter_frame(self) -> None:
+        """
+        Clocks the Envelope.
+        """
+        self.envelope.clock()
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def half_frame(self) -> None:
+        """
+        Clocks the Length Counter and Sweep Unit.
+        """
+        self.length_ctr.clock()
+        self.timer = self.sweep.clock(self.timer)
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def render(self, count: int, sample_rate: int) -> np.ndarray:
+        period = self.timer
+        volume = self.envelope.volume
+        # Periods under 8, or sweeping out of range, silence the channel
+        if not self.length_ctr.active or self.sweep.muting(period) or volume == 0:
+            return np.zeros(count, dtype=np.float32)
+
+        # The sequencer advances one step every 2 * (period + 1) CPU cycles
+        step = CPU_FREQ / ((period + 1) << 1) / sample_rate
+        positions = self._phase + step * np.arange(count)
+        self._phase = (self._phase + step * count) % 8
+
+        return _DUTY_SEQUENCE[self.duty_cycle][positions.astype(np.int64) & 7] * volume
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+
+class TriangleChannel(_Channel):
+
+    def __init__(self):
+        super().__init__()
+
+        # Register 0 ($4008)
+        self.linear_ctr_reload_value: int = 0
+
+        # Registers 2 and 3 ($400A, $400B)
+        self.timer: int = 0
+
+        self._linear_ctr: int = 0
+        self._linear_ctr_reload_flag: bool = False
+
+        # Last output level, held while the sequencer is stopped
+        self._level: float = 0.
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    @property
+    def control_flag(self) -> bool:
+        # The same bit halts the length counter
+        return self.length_ctr.halt
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def quarter_frame(self) -> None:
+        """
+        Clocks the linear counter.
+        """
+        if self._linear_ctr_reload_flag:
+            self._linear_ctr = self.linear_ctr_reload_value
+        elif self._linear_ctr > 0:
+            self._linear_ctr -= 1
+
+        if not self.control_flag:
+            self._linear_ctr_reload_flag = False
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def write_reg0(self, value: int) -> None:
+        self.length_ctr.halt = (value & 0x80) > 0
+        self.linear_ctr_reload_value = value & 0x7F
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def write_reg2(self, value: int) -> None:
+        self.timer = (self.timer & 0x700) | value
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def write_reg3(self, value: int) -> None:
+        self.timer = ((value & 0x07) << 8) | (self.timer & 0xFF)
+        self.length_ctr.load(value)
+        self._linear_ctr_reload_flag = True
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def render(self, count: int, sample_rate: int) -> np.ndarray:
+        period = self.timer
+        # The sequencer stops when either counter is zero, and the output stays at its last level.
+        # Ultrasonic periods are silenced, as most emulators do, instead of producing a constant level.
+        if not self.length_ctr.active or self._linear_ctr == 0 or period < 2:
+            return np.full(count, self._level, dtype=np.float32)
+
+        # The sequencer advances one step every (period + 1) CPU cycles
+        step = CPU_FREQ / (period + 1) / sample_rate
+        positions = self._phase + step * np.arange(count)
+        self._phase = (self._phase + step * count) % 32
+
+        output = _TRIANGLE_SEQUENCE[positions.astype(np.int64) & 31]
+        self._level = float(output[-1])
+        return output
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+
+class NoiseChannel(_Channel):
+
+    def __init__(self):
+        super().__init__()
+
+        # Register 0 ($400C)
+        self.envelope: Envelope = Envelope()
+
+        # Register 2 ($400E)
+        self.mode: int = 0
+        self.period: int = 0
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def write_reg0(self, value: int) -> None:
+        self.length_ctr.halt = (value & 0x20) > 0
+        self.envelope.write(value)
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def write_reg2(self, value: int) -> None:
+        mode = value >> 7
+        if mode != self.mode:
+            # Each mode has its own sequence: start the new one from the beginning
+            self._phase = 0.
+        self.mode = mode
+        self.period = value & 0x0F
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def write_reg3(self, value: int) -> None:
+        self.length_ctr.load(value)
+        self.envelope.restart()
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def quarter_frame(self) -> None:
+        """
+        Clocks the Envelope.
+        """
+        self.envelope.clock()
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def render(self, count: int, sample_rate: int) -> np.ndarray:
+        volume = self.envelope.volume
+        if not self.length_ctr.active or volume == 0:
+            return np.zeros(count, dtype=np.float32)
+
+        sequence = _noise_sequence(self.mode)
+        step = CPU_FREQ / _NOISE_PERIOD[self.period] / sample_rate
+        positions = self._phase + step * np.arange(count)
+        self._phase = (self._phase + step * count) % len(sequence)
+
+        return sequence[positions.astype(np.int64) % len(sequence)] * volume
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+
+class OfflineAPU:
+    """
+    Renders the output of the APU for a stream of register writes, one list of writes per frame.
+
+    Writes are (address, value) tuples, with addresses from $4000 to $4015, and are all performed at the start of the
+    frame, as the game's music driver does during NMI.
+    Output is mixed using the non-linear formulas from the NESDev Wiki, and is returned as float32 samples in the
+    range 0.0-1.0 (the DC offset is only removed when writing WAV files).
+    """
+
+    def __init__(self, sample_rate: int = 44100):
+        self.sample_rate: int = sample_rate
+
+        self.pulse_0: PulseChannel = PulseChannel(ones_complement=True)
+        self.pulse_1: PulseChannel = PulseChannel()
+        self.triangle: TriangleChannel = TriangleChannel()
+        self.noise: NoiseChannel = NoiseChannel()
+
+        self._channels: List[_Channel] = [self.pulse_0, self.pulse_1, self.triangle, self.noise]
+        self.frame_sequencer: FrameSequencer = FrameSequencer()
+
+        # CPU cycles elapsed, and samples generated so far
+        self._cycle: float = 0.
+        self._samples: int = 0
+
+        self._next_step: float = STEP_CYCLES
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def reset(self) -> None:
+        self.__init__(self.sample_rate)
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def write(self, address: int, value: int) -> None:
+        """
+        Writes a value to one of the APU registers
+
+        Parameters
+        ----------
+        address: int
+            Register address, $4000-$4013 for channel registers, $4015 for the status register or $4017 for the
+            frame counter
+        value: int
+            Byte value to write to the register
+        """
+        if address == 0x4015:
+            for c in range(4):
+                self._channels[c].set_enabled((value >> c) & 1 == 1)
+            return
+
+        if address == 0x4017:
+            # The sequencer restarts with the next step a full step away
+            self._next_step = self._cycle + STEP_CYCLES
+            self._clock_units(*self.frame_sequencer.write(value))
+            return
+
+        index = (address - 0x4000) >> 2
+        if 0 <= index < 4:
+            channel = self._channels[index]
+            [channel.write_reg0, channel.write_reg1, channel.write_reg2, channel.write_reg3][address & 3](value)
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def _clock_units(self, quarter_frame: bool, half_frame: bool) -> None:
+        if quarter_frame:
+            for channel in self._channels:
+                channel.quarter_frame()
+
+        if half_frame:
+            for channel in self._channels:
+                channel.half_frame()
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def _mix(self, count: int) -> np.ndarray:
+        pulse = self.pulse_0.render(count, self.sample_rate) + self.pulse_1.render(count, self.sample_rate)
+        triangle = self.triangle.render(count, self.sample_rate)
+        noise = self.noise.render(count, self.sample_rate)
+
+        with np.errstate(divide="ignore"):
+            pulse_out = np.where(pulse > 0, 95.88 / ((8128. / pulse) + 100.), 0.)
+            tnd = (triangle / 8227.) + (noise / 12241.)
+            tnd_out = np.where(tnd > 0, 159.79 / ((1. / tnd) + 100.), 0.)
+
+        return (pulse_out + tnd_out).astype(np.float32)
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def run(self, cycles: float) -> np.ndarray:
+        """
+        Advances time by a number of CPU cycles, clocking the frame counter as needed
+
+        Returns
+        -------
+        np.ndarray
+            The samples generated during that time
+        """
+        end = self._cycle + cycles
+        buffers = []
+
+        while self._cycle < end:
+            target = min(end, self._next_step)
+
+            last_sample = int(target * self.sample_rate / CPU_FREQ)
+            if last_sample > self._samples:
+                buffers.append(self._mix(last_sample - self._samples))
+                self._samples = last_sample
+
+            self._cycle = target
+            if target == self._next_step:
+                self._clock_units(*self.frame_sequencer.step())
+                self._next_step += STEP_CYCLES
+
+        if len(buffers) == 1:
+            return buffers[0]
+        return np.concatenate(buffers) if len(buffers) > 0 else np.zeros(0, dtype=np.float32)
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def run_frame(self, writes: Iterable[Tuple[int, int]] = ()) -> np.ndarray:
+        """
+        Performs the register writes for one frame, then renders that frame
+
+        Parameters
+        ----------
+        writes: Iterable[Tuple[int, int]]
+            (address, value) pairs
+
+        Returns
+        -------
+        np.ndarray
+            The samples generated during this frame
+        """
+        for address, value in writes:
+            self.write(address, value)
+
+        return self.run(FRAME_CYCLES)
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def render(self, frames: Iterable[Sequence[Tuple[int, int]]]) -> np.ndarray:
+        """
+        Renders a whole stream of register writes
+
+        Parameters
+        ----------
+        frames: Iterable[Sequence[Tuple[int, int]]]
+            For each frame, the list of (address, value) register writes performed at its start
+
+        Returns
+        -------
+        np.ndarray
+            All the samples generated, as float32 in the range 0.0-1.0
+        """
+        buffers = [self.run_frame(writes) for writes in frames]
+        return np.concatenate(buffers) if len(buffers) > 0 else np.zeros(0, dtype=np.float32)
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+
+def write_wav(file_name: str, samples: np.ndarray, sample_rate: int = 44100, amplitude: float = 1.) -> None:
+    """
+    Saves mono samples, as produced by OfflineAPU, to a 16-bit WAV file
+
+    Parameters
+    ----------
+    file_name: str
+        Path of the output file
+    samples: np.ndarray
+        Samples in the range 0.0-1.0
+    sample_rate: int
+        Sample rate, in Hz
+    amplitude: float
+        Output gain
+    """
+    if len(samples) > 0:
+        samples = samples - samples.mean()
+    data = np.clip(samples * amplitude * 32767, -32768, 32767).astype("<i2")
+
+    with wave.open(file_name, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(sample_rate)
+        wav.writeframes(data.tobytes())
@@ -0,0 +1,276 @@
+"""
+Envelope, sweep, length counter and frame sequencer units, shared by the live APU and the offline renderer.
+
+These only keep track of the units' state: the channels read their output after each register write or frame
+sequencer clock, and update their sound accordingly.
+"""
+
+__author__ = "Fox Cunning"
+
+from typing import Tuple
+
+# NTSC CPU clock rate, in Hz
+CPU_FREQ = 1789773
+
+# CPU cycles between two frame sequencer steps (~240 Hz)
+STEP_CYCLES = 7457.5
+
+_LENGTH_COUNTER_LOAD = [10, 254, 20, 2, 40, 4, 80, 6, 160, 8, 60, 10, 14, 12, 26, 14,
+                        12, 16, 24, 18, 48, 20, 96, 22, 192, 24, 72, 26, 16, 28, 32, 30]
+
+# (quarter frame, half frame) clocks generated at each step, for each sequencer mode
+_SEQUENCE = [[(True, False), (True, True), (True, False), (True, True)],                     # 4-step
+             [(True, False), (True, True), (True, False), (False, False), (True, True)]]    # 5-step
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+
+class FrameSequencer:
+    """
+    The APU's frame counter: generates quarter frame (envelopes, linear counter) and half frame (length counters,
+    sweep units) clocks, one step every STEP_CYCLES CPU cycles.
+    """
+
+    def __init__(self):
+        self.mode: int = 0
+        self._step: int = 0
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def write(self, value: int) -> Tuple[bool, bool]:
+        """
+        Writes a value to the frame counter register ($4017)
+
+        Parameters
+        ----------
+        value: int
+            Byte value to write to the register: bit 7 selects the 5-step mode, the IRQ inhibit flag is ignored
+
+        Returns
+        -------
+        Tuple[bool, bool]
+            Whether quarter frame and half frame units should be clocked immediately (only in 5-step mode)
+        """
+        self.mode = value >> 7
+        self._step = 0
+
+        return (True, True) if self.mode == 1 else (False, False)
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def step(self) -> Tuple[bool, bool]:
+        """
+        Advances the sequencer by one step
+
+        Returns
+        -------
+        Tuple[bool, bool]
+            Whether quarter frame and half frame units should be clocked
+        """
+        sequence = _SEQUENCE[self.mode]
+        clocks = sequence[self._step]
+        self._step = (self._step + 1) % len(sequence)
+
+        return clocks
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+
+class LengthCounter:
+    """
+    Silences a channel after a number of half frames, unless halted
+    """
+
+    def __init__(self):
+        self.enabled: bool = True
+        self.halt: bool = False
+        self.counter: int = 0
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def load(self, value: int) -> None:
+        """
+        Loads the counter from the top 5 bits of a value written to register 3, if the channel is enabled
+        """
+        if self.enabled:
+            self.counter = _LENGTH_COUNTER_LOAD[value >> 3]
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def set_enabled(self, enabled: bool) -> None:
+        """
+        Enables / disables the counter, as done by writing to $4015
+        """
+        self.enabled = enabled
+        if not enabled:
+            self.counter = 0
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def clock(self) -> None:
+        """
+        Half frame clock
+        """
+        if not self.halt and self.counter > 0:
+            self.counter -= 1
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    @property
+    def active(self) -> bool:
+        return self.counter > 0
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+
+class Envelope:
+    """
+    Volume unit of the pulse and noise channels: either a constant volume, or a decaying (and optionally looping)
+    sawtooth from 15 to 0.
+    """
+
+    def __init__(self):
+        self.loop: bool = False
+        self.constant_volume: bool = False
+        # Constant volume, or divider period
+        self.value: int = 0
+
+        self._start: bool = False
+        self._divider: int = 0
+        self._decay: int = 0
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def write(self, value: int) -> None:
+        """
+        Updates the envelope parameters from a value written to register 0: --LC VVVV
+        """
+        self.loop = (value & 0x20) > 0
+        self.constant_volume = (value & 0x10) > 0
+        self.value = value & 0x0F
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def restart(self) -> None:
+        """
+        Called when register 3 is written to: the decay restarts from 15 on the next quarter frame
+        """
+        self._start = True
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def clock(self) -> None:
+        """
+        Quarter frame clock
+        """
+        if self._start:
+            self._start = False
+            self._decay = 15
+            self._divider = self.value
+
+        elif self._divider == 0:
+            self._divider = self.value
+            if self._decay > 0:
+                self._decay -= 1
+            elif self.loop:
+                self._decay = 15
+
+        else:
+            self._divider -= 1
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    @property
+    def volume(self) -> int:
+        return self.value if self.constant_volume else self._decay
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+
+class Sweep:
+    """
+    Periodically adjusts a pulse channel's timer period
+    """
+
+    def __init__(self, ones_complement: bool = False):
+        """
+        Parameters
+        ----------
+        ones_complement: bool
+            True for the first pulse channel, which subtracts one more than the second when negating the change
+        """
+        self.ones_complement: bool = ones_complement
+
+        self.enabled: bool = False
+        self.period: int = 0
+        self.negate: bool = False
+        self.shift: int = 0
+
+        self._reload: bool = False
+        self._divider: int = 0
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def write(self, value: int) -> None:
+        """
+        Updates the sweep parameters from a value written to register 1: EPPP NSSS
+        """
+        self.enabled = (value & 0x80) > 0
+        self.period = (value >> 4) & 0x07
+        self.negate = (value & 0x08) > 0
+        self.shift = value & 0x07
+        self._reload = True
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def target(self, timer: int) -> int:
+        """
+        Parameters
+        ----------
+        timer: int
+            The channel's current timer period
+
+        Returns
+        -------
+        int
+            The period the channel would be set to on the next sweep
+        """
+        change = timer >> self.shift
+        if self.negate:
+            return max(0, timer - change - (1 if self.ones_complement else 0))
+        return timer + change
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def muting(self, timer: int) -> bool:
+        """
+        The channel is silenced if its period is too low, or the target is out of range, even with sweep disabled
+        """
+        return timer < 8 or self.target(timer) > 0x7FF
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def clock(self, timer: int) -> int:
+        """
+        Half frame clock
+
+        Parameters
+        ----------
+        timer: int
+            The channel's current timer period
+
+        Returns
+        -------
+        int
+            The new timer period
+        """
+        if self._divider == 0 and self.enabled and self.shift > 0 and not self.muting(timer):
+            timer = self.target(timer)
+
+        if self._divider == 0 or self._reload:
+            self._divider = self.period
+            self._reload = False
+        else:
+            self._divider -= 1
+
+        return timer
@@ -0,0 +1,365 @@
+__author__ = "Fox Cunning"
+
+from bisect import bisect_left, bisect_right, insort
+from dataclasses import dataclass
+from typing import Dict, List, Tuple
+
+from debug import log
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+
+@dataclass(init=True, repr=False)
+class FragmentationReport:
+    """
+    Free space statistics for an area
+
+    Attributes
+    ----------
+    total: int
+        Total size of the area, in bytes
+    free: int
+        Free bytes
+    largest: int
+        Size of the largest free block: nothing bigger than this can be allocated
+    blocks: int
+        Number of free blocks
+    """
+    total: int = 0
+    free: int = 0
+    largest: int = 0
+    blocks: int = 0
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    @property
+    def fragmentation(self) -> float:
+        """
+        0.0 if all the free space is in a single block, approaching 1.0 as it gets split into many small blocks
+        """
+        return 0.0 if self.free == 0 else 1.0 - (self.largest / self.free)
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def __repr__(self) -> str:
+        return (f"{self.free}/{self.total} bytes free in {self.blocks} block(s), largest: {self.largest} bytes, "
+                f"fragmentation: {self.fragmentation * 100:.1f}%")
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+
+class _Area:
+    """
+    Free blocks of a named area of a ROM bank.
+    Blocks are indexed by start address (for merging neighbours) and by size (for best-fit searches).
+
+    Lookups are binary searches, O(log n) in the number of free blocks, but inserting into and deleting from the
+    sorted lists is O(n). Areas are at most one 16 KB bank, split into a few dozen blocks at most, so the list
+    operations are cheap memory moves and a balanced tree would not be faster in practice.
+    """
+
+    def __init__(self, bank: int):
+        self.bank: int = bank
+        self.total: int = 0
+        # Sorted, non-overlapping address ranges that make up the area, including used memory
+        self.ranges: List[Tuple[int, int]] = []
+        # Sorted start addresses of free blocks, and the end (exclusive) of each one
+        self.starts: List[int] = []
+        self.ends: Dict[int, int] = {}
+        # Sorted (size, start) pairs
+        self.by_size: List[Tuple[int, int]] = []
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def add_block(self, start: int, end: int) -> None:
+        insort(self.starts, start)
+        self.ends[start] = end
+        insort(self.by_size, (end - start, start))
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def add_range(self, start: int, end: int) -> List[Tuple[int, int]]:
+        """
+        Adds an address range to the area
+
+        Returns
+        -------
+        List[Tuple[int, int]]
+            The parts of the range that were not already in the area
+        """
+        new_parts = []
+        merged_start = start
+        merged_end = end
+        ranges = []
+
+        for range_start, range_end in self.ranges:
+            if range_end < start or range_start > end:
+                ranges.append((range_start, range_end))
+                continue
+
+            # Overlapping or adjacent: only keep what falls outside existing ranges
+            if start < range_start:
+                new_parts.append((start, range_start))
+            start = max(start, range_end)
+            merged_start = min(merged_start, range_start)
+            merged_end = max(merged_end, range_end)
+
+        if start < end:
+            new_parts.append((start, end))
+
+        insort(ranges, (merged_start, merged_end))
+        self.ranges = ranges
+        return new_parts
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def remove_block(self, start: int) -> int:
+        """
+        Removes a free block, returning its end address
+        """
+        end = self.ends.pop(start)
+        del self.starts[bisect_left(self.starts, start)]
+        del self.by_size[bisect_left(self.by_size, (end - start, start))]
+        return end
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+
+class BankAllocator:
+    """
+    Keeps track of free space in ROM, so that editors can allocate and release memory for their data.
+
+    Space is organised in named areas (e.g. "text special", "maps 3"), each one made of one or more address ranges
+    of a single bank. Allocation uses a best-fit strategy: the smallest free block that is large enough is used,
+    the one with the lowest address if there is more than one.
+    All ranges are (start, end) tuples, where end is exclusive.
+    """
+
+    def __init__(self):
+        self._areas: Dict[str, _Area] = {}
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def clear(self) -> None:
+        """
+        Removes all areas, e.g. when a ROM is closed
+        """
+        self._areas.clear()
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def has_area(self, name: str) -> bool:
+        return name in self._areas
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def define_area(self, name: str, bank: int, ranges: List[Tuple[int, int]]) -> None:
+        """
+        Creates an area, or replaces an existing one, with all its space free
+
+        Parameters
+        ----------
+        name: str
+            Name of the area
+        bank: int
+            ROM bank number
+        ranges: List[Tuple[int, int]]
+            Address ranges that are part of this area, as (start, end) with end exclusive
+        """
+        self._areas[name] = _Area(bank)
+        for start, end in ranges:
+            self.extend_area(name, start, end)
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def extend_area(self, name: str, start: int, end: int) -> None:
+        """
+        Adds a new range of free memory to an existing area.
+        Any part of the range that already belongs to the area is left as it is, whether free or used.
+
+        Parameters
+        ----------
+        name: str
+            Name of the area
+        start: int
+            First address of the new range
+        end: int
+            End of the new range (exclusive)
+        """
+        area = self._areas[name]
+        if end <= start:
+            return
+
+        for part_start, part_end in area.add_range(start, end):
+            area.total = area.total + (part_end - part_start)
+            self.free(name, part_start, part_end - part_start)
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def reset_area(self, name: str, ranges: List[Tuple[int, int]]) -> None:
+        """
+        Marks all the memory in an area as free again, e.g. before re-allocating all of its contents
+        """
+        self.define_area(name, self._areas[name].bank, ranges)
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def bank(self, name: str) -> int:
+        return self._areas[name].bank
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def allocate(self, name: str, size: int) -> int:
+        """
+        Allocates a block of memory in the given area
+
+        Parameters
+        ----------
+        name: str
+            Name of the area
+        size: int
+            Size of the block, in bytes
+
+        Returns
+        -------
+        int
+            The address of the allocated block, or -1 if there is not enough contiguous free memory
+        """
+        area = self._areas[name]
+        if size < 1:
+            return -1
+
+        index = bisect_left(area.by_size, (size, -1))
+        if index >= len(area.by_size):
+            return -1
+
+        start = area.by_size[index][1]
+        end = area.remove_block(start)
+        if end > start + size:
+            area.add_block(start + size, end)
+
+        return start
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def reserve(self, name: str, address: int, size: int) -> bool:
+        """
+        Marks a specific block of memory as used, e.g. for data that is not going to be moved
+
+        Parameters
+        ----------
+        name: str
+            Name of the area
+        address: int
+            Start address of the block
+        size: int
+            Size of the block, in bytes
+
+        Returns
+        -------
+        bool
+            True if the block was free and is now reserved, False otherwise
+        """
+        area = self._areas[name]
+        index = bisect_right(area.starts, address) - 1
+        if index < 0 or size < 1:
+            return False
+
+        start = area.starts[index]
+        end = area.ends[start]
+        if address + size > end:
+            return False
+
+        area.remove_block(start)
+        if start < address:
+            area.add_block(start, address)
+        if address + size < end:
+            area.add_block(address + size, end)
+
+        return True
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def free(self, name: str, address: int, size: int) -> None:
+        """
+        Releases a block of memory, merging it with any adjacent free block
+
+        Parameters
+        ----------
+        name: str
+            Name of the area
+        address: int
+            Start address of the block
+        size: int
+            Size of the block, in bytes
+        """
+        area = self._areas[name]
+        if size < 1:
+            return
+
+        start = address
+        end = address + size
+
+        # Merge with the previous block if adjacent
+        index = bisect_left(area.starts, start)
+        if index > 0:
+            previous = area.starts[index - 1]
+            if area.ends[previous] > start:
+                log(3, "BankAllocator", f"Freeing already free memory at {area.bank:X}:{address:04X}.")
+                end = max(end, area.ends[previous])
+                start = previous
+                area.remove_block(previous)
+            elif area.ends[previous] == start:
+                start = previous
+                area.remove_block(previous)
+
+        # Merge with the following blocks if adjacent or overlapping
+        index = bisect_left(area.starts, start)
+        while index < len(area.starts) and area.starts[index] <= end:
+            end = max(end, area.remove_block(area.starts[index]))
+
+        area.add_block(start, end)
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def free_blocks(self, name: str) -> List[Tuple[int, int]]:
+        """
+        Returns
+        -------
+        List[Tuple[int, int]]
+            All the free blocks in an area, sorted by address, as (start, end) with end exclusive
+        """
+        area = self._areas[name]
+        return [(start, area.ends[start]) for start in area.starts]
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def fragmentation(self, name: str) -> FragmentationReport:
+        """
+        Parameters
+        ----------
+        name: str
+            Name of the area
+
+        Returns
+        -------
+        FragmentationReport
+            Free space statistics for the area
+        """
+        area = self._areas[name]
+        return FragmentationReport(total=area.total,
+                                   free=sum(size for size, _ in area.by_size),
+                                   largest=area.by_size[-1][0] if len(area.by_size) > 0 else 0,
+                                   blocks=len(area.by_size))
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def report(self) -> str:
+        """
+        Returns
+        -------
+        str
+            A human-readable summary of the free space in all the areas, one line each
+        """
+        return "\n".join([f"{name} (bank {area.bank:X}): {self.fragmentation(name)}"
+                          for name, area in self._areas.items()])
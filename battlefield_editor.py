@@ -14,6 +14,7 @@ from appJar.appjar import ItemLookupError
 from debug import log
 from palette_editor import PaletteEditor
 from rom import ROM
+from tilesets import BATTLEFIELD_TILESET, TilesetResolver
 from undo_redo import UndoRedo
 
 
@@ -21,10 +22,11 @@ class BattlefieldEditor:
 
     # ------------------------------------------------------------------------------------------------------------------
 
-    def __init__(self, app: gui, rom: ROM, palette_editor: PaletteEditor):
+    def __init__(self, app: gui, rom: ROM, palette_editor: PaletteEditor, tilesets: TilesetResolver):
         self.app = app
         self.rom = rom
         self.palette_editor = palette_editor
+        self.tilesets = tilesets
 
         self._unsaved_changes = False
 
@@ -70,13 +72,8 @@ class BattlefieldEditor:
         self._canvas_tiles: Canvas = Canvas()
         self._canvas_map: Canvas = Canvas()
 
-        # We keep track of how many tiles are modified with a single operation, for the undo/redo manager
-        self._modified_tiles: int = 0
-
+        # Tiles modified with a single operation are grouped into one undo/redo entry
         self._undo_redo: UndoRedo = UndoRedo()
-        # These keep count of how many actions to process in each single undo/redo
-        self._undo_actions: List[int] = []
-        self._redo_actions: List[int] = []
 
     # ------------------------------------------------------------------------------------------------------------------
 
@@ -134,10 +131,7 @@ class BattlefieldEditor:
         self.select_pattern(0)
 
         # Clear undo/redo history
-        self._modified_tiles = 0
         self._undo_redo.clear()
-        self._undo_actions = []
-        self._redo_actions = []
 
         self._update_undo_buttons()
 
@@ -221,82 +215,25 @@ class BattlefieldEditor:
     # ------------------------------------------------------------------------------------------------------------------
 
     def _load_patterns(self) -> None:
-        # First, create a list of pattern addresses using the "default" tileset
-        addresses: List[int] = []
-        for p in range(16):
-            addresses.append(0x8A40 + (p * 64))  # Each 2x2 tile is 64 bytes long
-
-        banks: List[int] = [0xA] * 16  # Bank $0A by default
-
         if self.rom.has_feature("map tilesets"):
-            # v1.09+ map tiles
-
-            # The same substitutions to Town maps apply
-            # The tables at $0A:B600 and $0B:B868 have the same format:
-            # Source address in ROM, destination address in PPU, number of bytes to transfer
-            address = 0xB642
-            pattern_address = self.rom.read_word(0xA, address)
-            tile_index = (self.rom.read_word(0xA, address + 2) - 0x1A40) >> 6
-            tile_count = self.rom.read_word(0xA, address + 4) >> 6
-            for t in range(tile_count):
-                addresses[tile_index] = pattern_address
-                pattern_address = pattern_address + 64
-                tile_index = tile_index + 1
-
-            # Further substitutions are in bank $0B
-            address = 0xB868
-            pattern_address = self.rom.read_word(0xB, address)
-            tile_index = (self.rom.read_word(0xB, address + 2) - 0x1A40) >> 6
-            tile_count = self.rom.read_word(0xB, address + 4) >> 6
-            for t in range(tile_count):
-                banks[tile_index] = 0xB
-                addresses[tile_index] = pattern_address
-                pattern_address = pattern_address + 64
-                tile_index = tile_index + 1
-
-            address = 0xB86E
-            pattern_address = self.rom.read_word(0xB, address)
-            tile_index = (self.rom.read_word(0xB, address + 2) - 0x1A40) >> 6
-            tile_count = self.rom.read_word(0xB, address + 4) >> 6
-            for t in range(tile_count):
-                banks[tile_index] = 0xB
-                addresses[tile_index] = pattern_address
-                pattern_address = pattern_address + 64
-                tile_index = tile_index + 1
-
-            address = 0xB874
-            pattern_address = self.rom.read_word(0xB, address)
-            tile_index = (self.rom.read_word(0xB, address + 2) - 0x1A40) >> 6
-            tile_count = self.rom.read_word(0xB, address + 4) >> 6
-            for t in range(tile_count):
-                banks[tile_index] = 0xB
-                addresses[tile_index] = pattern_address
-                pattern_address = pattern_address + 64
-                tile_index = tile_index + 1
-
-            address = 0xB87A
-            pattern_address = self.rom.read_word(0xB, address)
-            tile_index = (self.rom.read_word(0xB, address + 2) - 0x1A40) >> 6
-            tile_count = self.rom.read_word(0xB, address + 4) >> 6
-            for t in range(tile_count):
-                banks[tile_index] = 0xB
-                addresses[tile_index] = pattern_address
-                pattern_address = pattern_address + 64
-                tile_index = tile_index + 1
+            # v1.09+ map tiles: the same substitutions as Town maps, plus some more from bank $0B
+            sources = self.tilesets.sources(BATTLEFIELD_TILESET)
 
         else:
+            # Default tiles, each 2x2 tile is 64 bytes long
+            sources = [(0xA, 0x8A40 + (p * 64)) for p in range(16)]
+
             # TODO Hardcoded tile substitutions
             self.app.warningBox("Battlefield Editor", "Tile substitutions not implemented for this ROM.",
                                 parent="Battlefield_Editor")
             # TODO Detect vanilla game and use its hardcoded substitutions + "blank" ship tile
-            pass
 
         # Now we have a full list of pattern addresses, we can use it to create our images
         tile_index = 0
         map_palette = self.palette_editor.palettes[0]
         self._patterns_cache.clear()
 
-        for a in addresses:
+        for bank, a in sources:
             # Get palette index for this tile from table in ROM at 0D:856D
             palette_index = self.rom.read_byte(0x0D, 0x856D + tile_index) * 4
             colours = []
@@ -312,22 +249,22 @@ class BattlefieldEditor:
             tile.putpalette(colours)
 
             # Top-left pattern
-            pixels = bytes(bytearray(self.rom.read_pattern(banks[tile_index], a)))
+            pixels = bytes(bytearray(self.rom.read_pattern(bank, a)))
             image = Image.frombytes('P', (8, 8), pixels)
             image.putpalette(colours)
             tile.paste(image.resize((16, 16), Image.NONE), (0, 0))
             # Bottom-left pattern
-            pixels = bytes(bytearray(self.rom.read_pattern(banks[tile_index], a + 0x10)))
+            pixels = bytes(bytearray(self.rom.read_pattern(bank, a + 0x10)))
             image = Image.frombytes('P', (8, 8), pixels)
             image.putpalette(colours)
             tile.paste(image.resize((16, 16), Image.NONE), (0, 16))
             # Top-right pattern
-            pixels = bytes(bytearray(self.rom.read_pattern(banks[tile_index], a + 0x20)))
+            pixels = bytes(bytearray(self.rom.read_pattern(bank, a + 0x20)))
             image = Image.frombytes('P', (8, 8), pixels)
             image.putpalette(colours)
             tile.paste(image.resize((16, 16), Image.NONE), (16, 0))
             # Bottom-right pattern
-            pixels = bytes(bytearray(self.rom.read_pattern(banks[tile_index], a + 0x30)))
+            pixels = bytes(bytearray(self.rom.read_pattern(bank, a + 0x30)))
             image = Image.frombytes('P', (8, 8), pixels)
             image.putpalette(colours)
             tile.paste(image.resize((16, 16), Image.NONE), (16, 16))
@@ -569,14 +506,14 @@ class BattlefieldEditor:
     # ------------------------------------------------------------------------------------------------------------------
 
     def _update_undo_buttons(self) -> None:
-        if len(self._undo_actions) < 1:
+        if not self._undo_redo.can_undo():
             self.app.disableButton("BE_Button_Undo")
             self.app.setButtonTooltip("BE_Button_Undo", "Nothing to Undo")
         else:
             self.app.enableButton("BE_Button_Undo")
             self.app.setButtonTooltip("BE_Button_Undo", "Undo: " + self._undo_redo.get_undo_text())
 
-        if len(self._redo_actions) < 1:
+        if not self._undo_redo.can_redo():
             self.app.disableButton("BE_Button_Redo")
             self.app.setButtonTooltip("BE_Button_Redo", "Nothing to Redo")
         else:
@@ -685,27 +622,19 @@ class BattlefieldEditor:
     # ------------------------------------------------------------------------------------------------------------------
 
     def _undo(self, _event=None) -> None:
-        try:
-            count = self._undo_actions.pop()
-        except IndexError:
+        if not self._undo_redo.can_undo():
             return
 
-        self._undo_redo.undo(count)
-
-        self._redo_actions.append(count)
+        self._undo_redo.undo()
         self._update_undo_buttons()
 
     # ------------------------------------------------------------------------------------------------------------------
 
     def _redo(self, _event=None) -> None:
-        try:
-            count = self._redo_actions.pop()
-        except IndexError:
+        if not self._undo_redo.can_redo():
             return
 
-        self._undo_redo.redo(count)
-
-        self._undo_actions.append(count)
+        self._undo_redo.redo()
         self._update_undo_buttons()
 
     # ------------------------------------------------------------------------------------------------------------------
@@ -739,7 +668,6 @@ class BattlefieldEditor:
         old_tile = self._map_data[t]
 
         self._undo_redo(self._map_edit_tile, (t, self._selected_tile), (t, old_tile), text="Draw")
-        self._modified_tiles += 1
 
         # Move selection rectangle
         if self._map_rectangle > 0:
@@ -750,9 +678,7 @@ class BattlefieldEditor:
     # ------------------------------------------------------------------------------------------------------------------
 
     def _map_left_up(self, _event: any = None) -> None:
-        self._undo_actions.append(self._modified_tiles)
-        self._redo_actions = []
-        self._modified_tiles = 0
+        self._undo_redo.commit()
         self._update_undo_buttons()
 
     # ------------------------------------------------------------------------------------------------------------------
@@ -765,8 +691,9 @@ class BattlefieldEditor:
 
         self._last_edited = t
         old_tile = self._map_data[t]
-        self._modified_tiles += 1
 
+        # Everything drawn until the button is released will be undone in one step
+        self._undo_redo.begin("Draw")
         self._undo_redo(self._map_edit_tile, (t, self._selected_tile), (t, old_tile), text="Draw")
 
         # Move selection rectangle
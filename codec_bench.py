@@ -0,0 +1,265 @@
+"""
+Benchmark and round-trip checks for the map compression codecs (lzss.py and rle.py).
+
+Run it from the editor's directory:
+    python codec_bench.py [--iterations N] [--check-only]
+
+Every encoder is fed synthetic 64x64 4-bit maps, 16x16x8 dungeons and random buffers; the output is decoded again and
+compared to the input. The output of the default encoders is also hashed and compared to known digests, so that any
+change that alters the format (and therefore what ends up in the ROM) is caught.
+"""
+
+__author__ = "Fox Cunning"
+
+import argparse
+import hashlib
+import sys
+import time
+import tracemalloc
+from typing import Callable, Dict, List, Tuple
+
+import lzss
+import rle
+
+# SHA-256 of the concatenated output of the default encoders for the corpus generated by make_corpus(0x5EED, 64)
+_EXPECTED_DIGESTS = {
+    "LZSS": "ce99b7cad766e97701136daf6ec35fd308868924fcb70651cada7e66a767e350",
+    "RLE": "f8d29f00775b40a83430ec9e52ba72e6de29c32547f31b4e7a5ea772357875f1",
+}
+
+# Encoder and streaming decoder for each codec/mode
+CODECS: Dict[str, Tuple[Callable, Callable]] = {
+    "LZSS": (lambda data: lzss.encode(data).tobytes(order="A"), lzss.decode_stream),
+    "LZSS lazy": (lambda data: lzss.encode(data, lazy=True).tobytes(order="A"), lzss.decode_stream),
+    "LZSS optimal": (lambda data: lzss.encode(data, optimal=True).tobytes(order="A"), lzss.decode_stream),
+    "RLE": (lambda data: bytes(rle.encode(data)), rle.decode_stream),
+    "RLE optimal": (lambda data: bytes(rle.encode(data, optimal=True)), rle.decode_stream),
+}
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+
+class XorShift:
+    """
+    A tiny pseudo-random number generator, so that the generated data never depends on the Python version
+    """
+
+    def __init__(self, seed: int):
+        self._state: int = (seed & 0xFFFFFFFF) or 1
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def next(self) -> int:
+        x = self._state
+        x ^= (x << 13) & 0xFFFFFFFF
+        x ^= x >> 17
+        x ^= (x << 5) & 0xFFFFFFFF
+        self._state = x
+        return x
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def below(self, limit: int) -> int:
+        return self.next() % limit
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+
+def make_map(rng: XorShift) -> bytes:
+    """
+    Generates a 64x64 map of 4-bit tiles, made of rectangular areas of terrain, packed two tiles per byte
+    """
+    tiles = [rng.below(4)] * (64 * 64)
+
+    for _ in range(8 + rng.below(24)):
+        tile = rng.below(16)
+        left = rng.below(64)
+        top = rng.below(64)
+        width = 1 + rng.below(24)
+        height = 1 + rng.below(24)
+        for y in range(top, min(64, top + height)):
+            for x in range(left, min(64, left + width)):
+                tiles[x + (y << 6)] = tile
+
+    # Some scattered single tiles (trees, rocks, etc.)
+    for _ in range(rng.below(128)):
+        tiles[rng.below(64 * 64)] = rng.below(16)
+
+    return bytes([(tiles[i] << 4) | tiles[i + 1] for i in range(0, 64 * 64, 2)])
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+
+def make_dungeon(rng: XorShift) -> bytes:
+    """
+    Generates a 16x16 dungeon with 8 levels: walls with random corridors and a few special tiles
+    """
+    data = bytearray([0x0D] * 2048)
+
+    for level in range(8):
+        base = level << 8
+        x = rng.below(16)
+        y = rng.below(16)
+        for _ in range(64 + rng.below(64)):
+            data[base + x + (y << 4)] = 0x00
+            if rng.below(2):
+                x = (x + (1 if rng.below(2) else 15)) & 0x0F
+            else:
+                y = (y + (1 if rng.below(2) else 15)) & 0x0F
+
+        for _ in range(rng.below(6)):
+            data[base + rng.below(256)] = 1 + rng.below(12)
+
+    return bytes(data)
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+
+def make_random(rng: XorShift, size: int = 2048, symbols: int = 256) -> bytes:
+    """
+    Generates a buffer of random bytes, from an alphabet of the given size
+    """
+    return bytes([rng.below(symbols) for _ in range(size)])
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+
+def make_corpus(seed: int, count: int) -> List[bytes]:
+    """
+    Generates a list of samples of all kinds, including edge cases (empty data, very short buffers, long runs)
+    """
+    rng = XorShift(seed)
+    corpus = [bytes(), bytes(1), bytes(2), bytes(3), bytes(2048), bytes(range(256)) * 8]
+
+    for i in range(count):
+        kind = i % 4
+        if kind == 0:
+            corpus.append(make_map(rng))
+        elif kind == 1:
+            corpus.append(make_dungeon(rng))
+        elif kind == 2:
+            corpus.append(make_random(rng, 1 + rng.below(2048), 2 + rng.below(255)))
+        else:
+            # Runs of random length, to stress run/literal boundaries
+            data = bytearray()
+            while len(data) < 2048:
+                data.extend(bytes([rng.below(4)]) * (1 + rng.below(300 if rng.below(2) else 3)))
+            corpus.append(bytes(data[:2048]))
+
+    return corpus
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+
+def check_round_trip(corpus: List[bytes]) -> int:
+    """
+    Encodes and decodes each sample with every codec
+
+    Returns
+    -------
+    int
+        Number of failures
+    """
+    failures = 0
+    # Garbage after the compressed stream, as it would be found in ROM
+    trailing = bytes(range(255, -1, -1))
+
+    for index, sample in enumerate(corpus):
+        for name, (encode, decode_stream) in CODECS.items():
+            packed = encode(sample)
+            unpacked, used = decode_stream(memoryview(packed + trailing), len(sample))
+
+            if unpacked != sample:
+                print(f"FAIL: {name} round trip, sample #{index} ({len(sample)} bytes).")
+                failures = failures + 1
+            elif used != len(packed):
+                print(f"FAIL: {name} consumed {used} bytes instead of {len(packed)}, sample #{index}.")
+                failures = failures + 1
+
+            if name.endswith("optimal") and len(packed) > len(CODECS[name.split()[0]][0](sample)):
+                print(f"FAIL: {name} output larger than the default encoder's, sample #{index}.")
+                failures = failures + 1
+
+    return failures
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+
+def check_digests() -> int:
+    """
+    Checks that the default encoders still produce exactly the same output as before
+
+    Returns
+    -------
+    int
+        Number of failures
+    """
+    failures = 0
+    corpus = make_corpus(0x5EED, 64)
+
+    for name, expected in _EXPECTED_DIGESTS.items():
+        digest = hashlib.sha256()
+        for sample in corpus:
+            digest.update(CODECS[name][0](sample))
+
+        if digest.hexdigest() != expected:
+            print(f"FAIL: {name} output changed (digest {digest.hexdigest()}).")
+            failures = failures + 1
+
+    return failures
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+
+def benchmark(iterations: int) -> None:
+    """
+    Prints encoding/decoding throughput, compression ratio and peak memory use for each codec and kind of data
+    """
+    rng = XorShift(0xBE4C)
+    kinds = {
+        "map": [make_map(rng) for _ in range(iterations)],
+        "dungeon": [make_dungeon(rng) for _ in range(iterations)],
+        "random": [make_random(rng) for _ in range(iterations)],
+    }
+
+    print(f"{'Codec':<14}{'Data':<9}{'Encode KB/s':>12}{'Decode KB/s':>12}{'Ratio':>8}{'Peak KB':>9}")
+
+    for name, (encode, decode_stream) in CODECS.items():
+        for kind, samples in kinds.items():
+            size = sum(len(sample) for sample in samples)
+
+            start = time.perf_counter()
+            packed = [encode(sample) for sample in samples]
+            encode_time = time.perf_counter() - start
+
+            start = time.perf_counter()
+            for sample, data in zip(samples, packed):
+                decode_stream(memoryview(data), len(sample))
+            decode_time = time.perf_counter() - start
+
+            # Tracing slows everything down, so measure memory separately, encoding and decoding a single sample
+            tracemalloc.start()
+            decode_stream(memoryview(encode(samples[0])), len(samples[0]))
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+
+            ratio = sum(len(data) for data in packed) / size
+            print(f"{name:<14}{kind:<9}{size / 1024 / encode_time:>12.1f}{size / 1024 / decode_time:>12.1f}"
+                  f"{ratio:>8.3f}{peak / 1024:>9.1f}")
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark and check the map compression codecs.")
+    parser.add_argument("--iterations", type=int, default=16, help="samples of each kind to benchmark")
+    parser.add_argument("--check-only", action="store_true", help="only run the round-trip and output checks")
+    args = parser.parse_args()
+
+    errors = check_round_trip(make_corpus(0xC0DEC, 64)) + check_digests()
+    print(f"Round-trip checks: {'OK' if errors == 0 else f'{errors} failure(s)'}.")
+
+    if not args.check_only:
+        benchmark(args.iterations)
+
+    sys.exit(1 if errors > 0 else 0)
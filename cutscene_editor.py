@@ -76,13 +76,8 @@ class CutsceneEditor:
         # Last modified tile on the cutscene, used for drag-editing
         self._last_modified: Point2D = Point2D(-1, -1)
 
-        # We keep track of how many tiles are modified with a single operation, for the undo/redo manager
-        self._modified_tiles: int = 0
-
+        # Tiles modified with a single operation are grouped into one undo/redo entry
         self._undo_redo: UndoRedo = UndoRedo()
-        # These keep count of how many actions to process in each single undo/redo
-        self._undo_actions: List[int] = []
-        self._redo_actions: List[int] = []
 
         self.rom: ROM = rom
         self.palette_editor = palette_editor
@@ -146,8 +141,6 @@ class CutsceneEditor:
 
         self._unsaved_changes = False
 
-        self._modified_tiles = 0
-
         # TODO Create the widgets here and destroy them on window close to save memory
 
         # Resize the drawing area according to the size of the cutscene
@@ -621,39 +614,28 @@ class CutsceneEditor:
     # ------------------------------------------------------------------------------------------------------------------
 
     def undo(self, _event=None) -> None:
-        if len(self._undo_actions) < 1:
+        if not self._undo_redo.can_undo():
             return
 
-        count = self._undo_actions.pop()
-        self._redo_actions.append(count)
-
-        self._undo_redo.undo(count)
+        self._undo_redo.undo()
 
     # ------------------------------------------------------------------------------------------------------------------
 
     def redo(self, _event=None) -> None:
-        if len(self._redo_actions) < 1:
+        if not self._undo_redo.can_redo():
             return
 
-        count = self._redo_actions.pop()
-        self._undo_actions.append(count)
-
-        self._undo_redo.redo(count)
+        self._undo_redo.redo()
 
     # ------------------------------------------------------------------------------------------------------------------
 
     def _clear_undo_history(self) -> None:
         self._undo_redo.clear()
-        self._undo_actions = []
-        self._redo_actions = []
 
     # ------------------------------------------------------------------------------------------------------------------
 
     def _nametable_mouse_1_up(self, _event: any) -> None:
-        # self.info(f"*** DEBUG: Mouse up. Modified {self._modified_tiles} tiles. ")
-
-        self._undo_actions.append(self._modified_tiles)
-        self._modified_tiles = 0
+        self._undo_redo.commit()
 
         self._unsaved_changes = True
 
@@ -669,6 +651,9 @@ class CutsceneEditor:
         tile = (self._last_modified.x % 32) + (self._last_modified.y << 5)
         old_pattern, old_palette = self.nametable[tile], self.attributes[tile]
 
+        # Everything drawn until the button is released will be undone in one step
+        self._undo_redo.begin("Draw 1x1")
+
         # DO action
         self._undo_redo(self.edit_nametable_entry,
                         (self._last_modified.x, self._last_modified.y, self._selected_pattern),
@@ -676,8 +661,6 @@ class CutsceneEditor:
                         (self._last_modified.x, self._last_modified.y, old_pattern, old_palette),
                         text="Draw 1x1")
 
-        self._modified_tiles = 1
-
     # ------------------------------------------------------------------------------------------------------------------
 
     def _nametable_mouse_1_down_2x2(self, event: any) -> None:
@@ -695,6 +678,8 @@ class CutsceneEditor:
 
         # The selection should always be the top-left tile of a 2x2 "super-tile"
 
+        self._undo_redo.begin("Draw 2x2")
+
         # Bottom-Right (x + 1, y + 1)
         old_pattern, old_palette = self.nametable[tile + 33], self.attributes[tile + 33]
         self._undo_redo(self.edit_nametable_entry,
@@ -724,8 +709,6 @@ class CutsceneEditor:
                         (x, y, old_pattern, old_palette),
                         text="Draw 2x2")
 
-        self._modified_tiles = 4
-
     # ------------------------------------------------------------------------------------------------------------------
 
     def _nametable_mouse_1_drag(self, event: any) -> None:
@@ -750,7 +733,6 @@ class CutsceneEditor:
 
             self._undo_redo(self.edit_nametable_entry, (x, y, self._selected_pattern),
                             (x, y, old_pattern, old_palette))
-            self._modified_tiles += 1
 
     # ------------------------------------------------------------------------------------------------------------------
 
@@ -797,8 +779,6 @@ class CutsceneEditor:
                             (x, y, old_pattern, old_palette),
                             text="Draw 2x2")
 
-            self._modified_tiles += 4
-
     # ------------------------------------------------------------------------------------------------------------------
 
     def _nametable_mouse_3(self, event: any) -> None:
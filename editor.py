@@ -18,6 +18,7 @@ import os
 import shlex
 import subprocess
 import sys
+import threading
 
 import pyo
 
@@ -35,6 +36,7 @@ from debug import log
 from end_game_editor import EndGameEditor
 from enemy_editor import EnemyEditor
 from map_editor import MapEditor
+from map_validator import MapValidator
 from palette_editor import PaletteEditor
 from party_editor import PartyEditor
 from rom import ROM, feature_names
@@ -44,6 +46,7 @@ from text_editor import TextEditor, read_text
 
 # ----------------------------------------------------------------------------------------------------------------------
 from tile_editor import TileEditor
+from tilesets import TilesetResolver
 
 settings = EditorSettings()
 
@@ -392,6 +395,19 @@ def edit_text() -> None:
     text_editor.show_advanced_window(string_index, string_type)
 
 
+# ----------------------------------------------------------------------------------------------------------------------
+
+def validate_maps(validator: MapValidator) -> None:
+    """
+    Runs the map validation and logs the results; this is meant to be run in a separate thread
+    """
+    report = validator.run()
+    for problem in report.all_problems():
+        log(3, "Map Validator", problem)
+    for bank in report.banks:
+        log(4, "Map Validator", f"{bank}")
+
+
 # ----------------------------------------------------------------------------------------------------------------------
 
 # noinspection PyArgumentList
@@ -443,7 +459,12 @@ def save_rom(file_name: str) -> None:
             backup_name = file_name[:index] + ".bak"
         else:
             backup_name = file_name + ".bak"
-        rom.save(backup_name)
+
+        if rom.memory_mapped:
+            # Only store the areas that are about to be overwritten, as an IPS patch
+            rom.save_diff(backup_name + ".ips")
+        else:
+            rom.save(backup_name)
 
     if rom.save(file_name) is True:
         file_name = os.path.basename(file_name)
@@ -481,7 +502,7 @@ def open_rom(file_name: str) -> None:
     global tile_editor
 
     app.setStatusbar(f"Opening ROM file '{file_name}'", field=0)
-    val = rom.open(file_name)
+    val = rom.open(file_name, settings.get("memory mapped rom"))
     if val != "OK":
         app.setStatusbar(val)
         app.errorBox("ERROR", val)
@@ -574,8 +595,14 @@ def open_rom(file_name: str) -> None:
         app.setMeter("PE_Progress_Meter", 40)
         app.topLevel.update()
 
+        # Tile substitutions, shared by the map and battlefield editors
+        tilesets = TilesetResolver(rom)
+
         # Map editor
-        map_editor = MapEditor(rom, app, palette_editor, text_editor, enemy_editor, settings)
+        map_editor = MapEditor(rom, app, palette_editor, text_editor, enemy_editor, settings, tilesets)
+
+        # Check all the maps in the background, the results will be in the log
+        threading.Thread(target=validate_maps, args=(MapValidator(rom, map_editor),), daemon=True).start()
 
         # Read tables
         selected_map = 0
@@ -607,16 +634,16 @@ def open_rom(file_name: str) -> None:
         app.setMeter("PE_Progress_Meter", 60)
         app.topLevel.update()
 
-        app.setStatusbar("Booting sound server...")
+        # The server is only booted when something is played
         if sys.platform == "win32":
             sound_server: pyo.Server = pyo.Server(sr=settings.get("sample rate"), duplex=0, nchnls=1,
-                                                  winhost=settings.get("audio host"), buffersize=1024).boot()
+                                                  winhost=settings.get("audio host"), buffersize=1024)
         else:
             sound_server: pyo.Server = pyo.Server(sr=settings.get("sample rate"), duplex=0, nchnls=1,
-                                                  buffersize=1024).boot()
+                                                  buffersize=1024)
         sound_server.setAmp(0.5)
 
-        apu = APU()
+        apu = APU(sound_server)
 
         # Music editor
         music_editor = MusicEditor(app, rom, settings, apu, sound_server)
@@ -645,7 +672,7 @@ def open_rom(file_name: str) -> None:
         app.setOptionBox("ST_Option_SFX", 0)
 
         # Battlefield map editor
-        battlefield_editor = BattlefieldEditor(app, rom, palette_editor)
+        battlefield_editor = BattlefieldEditor(app, rom, palette_editor, tilesets)
         app.changeOptionBox("Battlefield_Option_Map", battlefield_editor.get_map_names(), 0, callFunction=False)
         music_list = music_editor.track_titles[0] + music_editor.track_titles[1]
         app.changeOptionBox("Battlefield_Option_Music", music_list, 0, callFunction=False)
@@ -21,6 +21,7 @@ class EditorSettings:
     SETTINGS_FILE: str = "settings.conf"
     KEYS = {"last rom path": "",
             "make backups": True,
+            "memory mapped rom": False,
             "close sub-window after saving": False,
             "emulator": "",
             "emulator parameters": "%f",
@@ -30,6 +31,7 @@ class EditorSettings:
             "last music export path": "",
             "editor fonts": "Consolas",
             "sync npc sprites": True,
+            "optimal compression": False,
             "fix envelope bug": True,
             "sample rate": 44100,
             "audio host": "directsound"
@@ -122,6 +124,12 @@ class EditorSettings:
     # ------------------------------------------------------------------------------------------------------------------
 
     def get(self, key: str) -> Union[int, bool, str]:
+        if key == "memory mapped rom" or key == "optimal compression":
+            try:
+                return self.config.getboolean("SETTINGS", key, fallback=False)
+            except ValueError:
+                return False
+
         if (key == "make backups" or key[:8] == "sync npc" or key[:12] == "fix envelope" or
                 key[:16] == "close sub-window"):
             try:
@@ -206,6 +214,9 @@ class EditorSettings:
                     app.label("SS_Label_3", "Default fonts*", sticky="E", row=2, column=0, font=11)
                     app.entry("Set_Editor_Fonts", self.get("editor fonts"), sticky="W", width=16,
                               row=2, column=1, font=10, change=self._settings_input)
+                    app.checkBox("Set_Memory_Mapped", self.get("memory mapped rom"),
+                                 text="Memory-map ROM files (faster saves, backups as IPS patches)*", sticky="W",
+                                 row=3, column=0, colspan=2, font=11, change=self._settings_input)
 
                 app.label("SS_Label_Emulator", "Emulator Settings", sticky="WE", fg=colour.DARK_BLUE,
                           row=2, column=0, font=font_bold)
@@ -227,6 +238,9 @@ class EditorSettings:
                 with app.frame("SS_Frame_Map_Editor", padding=[4, 2], sticky="NEW", row=6, column=0):
                     app.checkBox("Set_Sync_NPC_Sprites", self.get("sync npc sprites"), change=self._settings_input,
                                  row=0, column=0, font=10, text="Sync NPC Sprites")
+                    app.checkBox("Set_Optimal_Compression", self.get("optimal compression"),
+                                 change=self._settings_input, row=1, column=0, font=10,
+                                 text="Optimal map compression (slower, smaller maps)")
 
                 app.label("SS_Label_Audio", "Audio Settings", sticky="WE", fg=colour.DARK_BLUE,
                           row=7, column=0, font=font_bold)
@@ -308,9 +322,11 @@ class EditorSettings:
         self.app.setCheckBox("Set_Make_Backups", self.get("make backups"), False)
         self.app.setCheckBox("Set_Close_After", self.get("close sub-window after saving"), False)
         self.app.setEntry("Set_Editor_Fonts", self.get("editor fonts"), False)
+        self.app.setCheckBox("Set_Memory_Mapped", self.get("memory mapped rom"), False)
         self.app.setEntry("Set_Emulator_Path", self.get("emulator"), False)
         self.app.setEntry("Set_Emulator_Cmdline", self.get("emulator parameters"), False)
         self.app.setCheckBox("Set_Sync_NPC_Sprites", self.get("sync npc sprites"), False)
+        self.app.setCheckBox("Set_Optimal_Compression", self.get("optimal compression"), False)
         self.app.setCheckBox("Set_Fix_Envelope", self.get("fix envelope bug"), False)
         self.app.setEntry("Set_Sampling_Rate", self.get("sample rate"), False)
 
@@ -326,9 +342,11 @@ class EditorSettings:
         self.set("make backups", self.app.getCheckBox("Set_Make_Backups"))
         self.set("close sub-window after saving", self.app.getCheckBox("Set_Close_After"))
         self.set("editor fonts", self.app.getEntry("Set_Editor_Fonts"))
+        self.set("memory mapped rom", self.app.getCheckBox("Set_Memory_Mapped"))
         self.set("emulator", self.app.getEntry("Set_Emulator_Path").replace('\\', '/'))
         self.set("emulator parameters", self.app.getEntry("Set_Emulator_Cmdline"))
         self.set("sync npc sprites", self.app.getCheckBox("Set_Sync_NPC_Sprites"))
+        self.set("optimal compression", self.app.getCheckBox("Set_Optimal_Compression"))
         self.set("fix envelope bug", self.app.getCheckBox("Set_Fix_Envelope"))
         self.set("sample rate", int(self.app.getEntry("Set_Sampling_Rate")))
         if sys.platform.find("win") > -1:
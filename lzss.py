@@ -6,193 +6,403 @@ __credits__ = ["Fox Cunning", "Darren A.K.A. 'Phantasm'", "Michael Dipperstein (
 
 from debug import log
 
-from io import BytesIO
+from typing import List, Tuple, Union
 
 WINDOW_SIZE = 256
 MAX_UNENCODED = 2
 MAX_CODED = MAX_UNENCODED + 256
-HASH_SIZE = 1024
 
+# Cost of each token in bits, including its flag bit
+LITERAL_COST = 9
+MATCH_COST = 17
 
-class FlagData:
-    def __init__(self):
-        pass
 
-    flag_position: int = 0
-    flags: int = 0
-    next_encoded: int = 0
+# --- Match ---
 
-
-# --- update_flags() ---
-
-def update_flags(flag_data: FlagData, encoded_data: bytearray, writer: BytesIO):
-    if flag_data.flag_position == 0x80:
-        writer.write(flag_data.flags.to_bytes(1, "little"))
-        for i in range(flag_data.next_encoded):
-            writer.write(encoded_data[i].to_bytes(1, "little"))
-
-        flag_data.flags = 0
-        flag_data.flag_position = 1
-        flag_data.next_encoded = 0
-
-    else:
-        flag_data.flag_position = flag_data.flag_position << 1
-
-
-# --- EncodedString ---
-
-class EncodedString:
-    def __init__(self):
-        pass
-
-    offset: int = 0
-    length: int = 0
+class Match:
+    """
+    A back-reference into the sliding window
+    """
+    def __init__(self, offset: int = 0, length: int = 0):
+        self.offset: int = offset
+        self.length: int = length
 
 
-hash_table: list  # list = [0] * HASH_SIZE
+# --- match_length() ---
 
+def match_length(data: bytes, source: int, position: int, limit: int, known: int = 0) -> int:
+    """
+    Finds the length of the common prefix of two substrings, by comparing slices instead of single bytes
 
-# --- get_hash_key() ---
+    Parameters
+    ----------
+    data: bytes
+        The uncompressed data
+    source: int
+        Start of the earlier substring (inside the window)
+    position: int
+        Start of the substring being encoded
+    limit: int
+        Maximum length to check
+    known: int
+        Number of bytes already known to match
 
-def get_hash_key(data: any, offset: int) -> int:
-    """This method generates a hash key for a (MAX_UNENCODED + 1)
-       long string
+    Returns
+    -------
+    int
+        Number of matching bytes, up to limit
     """
-    hash_key: int = 0
+    if data[source:source + limit] == data[position:position + limit]:
+        return limit
+
+    # Binary search for the first mismatch: the first `low` bytes are known to match, `high` bytes are known not to
+    low = known
+    high = limit
+    while high - low > 1:
+        middle = (low + high) >> 1
+        if data[source + low:source + middle] == data[position + low:position + middle]:
+            low = middle
+        else:
+            high = middle
 
-    for i in range(0, MAX_UNENCODED + 1):
-        hash_key = (hash_key << 5) ^ data[offset]
-        hash_key = hash_key % HASH_SIZE
-        offset = offset + 1
+    return low
 
-    return hash_key
 
+# --- Encoder ---
 
-# --- find_match() ---
+class Encoder:
+    """
+    LZSS encoder using a hash chain index of the sliding window.
 
-def find_match(data: any, offset: int) -> EncodedString:
-    """This method searches through the data or the longest sequence matching the MAX_CODED
-       long string that is before the current offset
+    Each position is indexed by its first MAX_UNENCODED + 1 bytes: `chain` links each position to the previous one
+    starting with the same bytes, so a lookup only visits positions that really match the prefix, stopping as soon
+    as one falls out of the window.
+    All the state is local to the instance, so different encoders can run at the same time.
     """
-    match_data = EncodedString()
 
-    if offset > len(data) - (MAX_UNENCODED + 1):
-        return match_data
+    def __init__(self, lazy: bool = False, optimal: bool = False):
+        """
+        Parameters
+        ----------
+        lazy: bool
+            If True, before accepting a match, check whether the next position has a longer one and if so emit a
+            literal instead. This usually gives slightly smaller output, but it will differ from the original
+            greedy encoder.
+        optimal: bool
+            If True, choose literals and matches so that the total size of the output is minimal (see
+            optimal_parse()). Slower than the greedy encoder; overrides the lazy option.
+        """
+        self.lazy: bool = lazy
+        self.optimal: bool = optimal
+
+        self._data: bytes = bytes()
+        self._chain: List[int] = []
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def _index(self) -> None:
+        """
+        Builds the hash chain for the whole input
+        """
+        data = self._data
+        head = {}
+        chain = [-1] * len(data)
+
+        for i in range(len(data) - MAX_UNENCODED):
+            key = data[i:i + MAX_UNENCODED + 1]
+            chain[i] = head.get(key, -1)
+            head[key] = i
+
+        self._chain = chain
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def find_match(self, position: int) -> Match:
+        """
+        Searches the window for the longest sequence matching the data at the given position.
+        When more than one match of the same length is found, the earliest one is used.
+
+        Parameters
+        ----------
+        position: int
+            Position in the uncompressed data
+
+        Returns
+        -------
+        Match
+            The best match found; length will be zero if there is none
+        """
+        match = Match()
+        data = self._data
+
+        if position > len(data) - (MAX_UNENCODED + 1):
+            return match
+
+        limit = min(MAX_CODED, len(data) - position)
+        window_start = position - WINDOW_SIZE
+        chain = self._chain
+
+        # Collect the candidates, from the most recent position back to the start of the window
+        candidates = []
+        i = chain[position]
+        while i >= window_start and i >= 0:
+            candidates.append(i)
+            i = chain[i]
+
+        # Then try them from the oldest, so that the earliest of the longest matches wins
+        for i in reversed(candidates):
+            # Quick rejection: a candidate can only be longer if it also matches up to the current best length
+            known = match.length + 1
+            if data[i:i + known] == data[position:position + known]:
+                length = match_length(data, i, position, limit, known)
+                if length > match.length:
+                    match.length = length
+                    match.offset = i
+                    if length >= limit:
+                        break
+
+        return match
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def encode(self, data: any) -> memoryview:
+        """
+        Perform LZSS Algorithm Encoding
+
+        Parameters
+        ----------
+        data: any
+            Uncompressed data (bytes, bytearray or any iterable of ints)
+
+        Returns
+        -------
+        memoryview
+            The compressed data
+        """
+        self._data = bytes(data)
+        length = len(self._data)
+        if length == 0:
+            return memoryview(bytes(0))
+
+        self._index()
+
+        if self.optimal:
+            return memoryview(pack_tokens(self.optimal_parse()))
+
+        # Each token is either an int (literal) or a (offset, length) tuple
+        tokens = []
+
+        position = 0
+        match = self.find_match(position)
+
+        while position < length:
+
+            if match.length > MAX_UNENCODED and self.lazy and match.length < MAX_CODED:
+                # If the next byte starts a longer match, output this one as a literal
+                following = self.find_match(position + 1)
+                if following.length > match.length:
+                    tokens.append(self._data[position])
+                    position = position + 1
+                    match = following
+                    continue
+
+            # Write unencoded byte if match is not long enough
+            if match.length <= MAX_UNENCODED:
+                tokens.append(self._data[position])
+                position = position + 1
+
+            # Encode as offset and length
+            else:
+                offset = (position - 1) - match.offset
+                if offset > 255 or offset < 0:
+                    log(2, "LZSS encode", "Match Data Offset out of range!")
+                    return memoryview(bytes(0))
+
+                tokens.append((offset, match.length - (MAX_UNENCODED + 1)))
+                position = position + match.length
+
+            # Find next match
+            match = self.find_match(position)
+
+        return memoryview(pack_tokens(tokens))
+
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def optimal_parse(self) -> list:
+        """
+        Finds the sequence of literals and matches that produces the smallest output.
+
+        Working backwards from the end of the data, the cost of encoding everything from a position onwards is the
+        cheapest of: a literal followed by the rest, or a match of any length from 3 up to the longest one available
+        there, followed by the rest. Any prefix of a match is also a valid match from the same source, so only
+        the longest match of each position is needed.
+
+        Returns
+        -------
+        list
+            A list of tokens, in the format used by pack_tokens()
+        """
+        data = self._data
+        length = len(data)
+
+        matches = [self.find_match(position) for position in range(length)]
+
+        # cost[i] = bits needed to encode data[i:], choice[i] = length of the token to use at i (1 = literal)
+        cost = [0] * (length + 1)
+        choice = [1] * length
+
+        for position in range(length - 1, -1, -1):
+            best = cost[position + 1] + LITERAL_COST
+            best_length = 1
+
+            longest = matches[position].length
+            if longest > MAX_UNENCODED:
+                # Since every match costs the same, just find where the cheapest remainder starts
+                remainder = cost[position + MAX_UNENCODED + 1:position + longest + 1]
+                cheapest = min(remainder)
+                if cheapest + MATCH_COST < best:
+                    best = cheapest + MATCH_COST
+                    best_length = remainder.index(cheapest) + MAX_UNENCODED + 1
+
+            cost[position] = best
+            choice[position] = best_length
+
+        tokens = []
+        position = 0
+        while position < length:
+            if choice[position] == 1:
+                tokens.append(data[position])
+                position = position + 1
+            else:
+                tokens.append(((position - 1) - matches[position].offset, choice[position] - (MAX_UNENCODED + 1)))
+                position = position + choice[position]
 
-    j = 0
+        return tokens
 
-    key_index = get_hash_key(data, offset)
-    hash_key = hash_table[key_index]
-    for i in hash_key:
 
-        if i >= offset:
-            continue
+# --- pack_tokens() ---
 
-        if i < offset - WINDOW_SIZE:
-            continue
+def pack_tokens(tokens: list) -> bytes:
+    """
+    Packs literals and back-references in groups of 8, each group preceded by its flag byte
 
-        # First symbol matched
-        if data[i] == data[offset]:
+    Parameters
+    ----------
+    tokens: list
+        A list of literal bytes (int) and encoded strings ((offset, length - 3) tuples)
 
-            j = 1
+    Returns
+    -------
+    bytes
+        The encoded stream
+    """
+    output = bytearray()
 
-            while (offset + j) < len(data) and data[i + j] == data[offset + j]:
-                if j >= MAX_CODED:
-                    break
-                j = j + 1
+    for group in range(0, len(tokens), 8):
+        flags = 0
+        flag_position = len(output)
+        output.append(0)
 
-            if j > match_data.length:
-                match_data.length = j
-                match_data.offset = i
+        for bit, token in enumerate(tokens[group:group + 8]):
+            if type(token) is int:
+                flags = flags | (1 << bit)  # Flag unencoded byte
+                output.append(token)
+            else:
+                output.extend(token)
 
-        if j >= MAX_CODED:
-            match_data.length = MAX_CODED
-            break
+        output[flag_position] = flags
 
-    return match_data
+    return bytes(output)
 
 
 # --- encode() ---
 
-def encode(data: any) -> memoryview:
+def encode(data: any, lazy: bool = False, optimal: bool = False) -> memoryview:
     """
     Perform LZSS Algorithm Encoding
-    """
-    global hash_table
 
-    writer = BytesIO()
-    input_buffer = bytearray(data)
-
-    length = len(input_buffer)
-    if length == 0:
-        return memoryview(bytes(0))
-
-    # Start with an empty list
-    hash_table = list()
-    for i in range(0, HASH_SIZE):
-        hash_table.append([])
-
-    flag_data = FlagData()
+    Parameters
+    ----------
+    data: any
+        Uncompressed data
+    lazy: bool
+        Use lazy matching (see Encoder)
+    optimal: bool
+        Use optimal parsing (see Encoder.optimal_parse())
 
-    # 8 code flags and 8 encoded strings
-    flag_data.flags = 0
-    flag_data.flag_position = 1
-    encoded_data = bytearray(256 * 8)
-    flag_data.next_encoded = 0  # Next index of encoded data
+    Returns
+    -------
+    memoryview
+        The compressed data
+    """
+    return Encoder(lazy, optimal).encode(data)
 
-    input_buffer_position = 0  # Head of encoded lookahead
 
-    for i in range(0, length - MAX_UNENCODED):
-        hash_key = get_hash_key(input_buffer, i)
-        hash_table[hash_key].append(i)
+# --- decode_stream() ---
 
-    match_data = find_match(input_buffer, input_buffer_position)
+def decode_stream(data: Union[bytes, bytearray, memoryview], size: int) -> Tuple[bytearray, int]:
+    """
+    Performs LZSS decoding, stopping as soon as the expected amount of data has been produced
 
-    while input_buffer_position < length:
+    Parameters
+    ----------
+    data: Union[bytes, bytearray, memoryview]
+        Compressed data; this can be a view of the ROM extending past the end of the actual stream
+    size: int
+        Expected size of the uncompressed data, e.g. 2048 for maps
 
-        # Extend match length if trailing rubbish is present
-        if input_buffer_position + match_data.length > length:
-            match_data.length = length - input_buffer_position
+    Returns
+    -------
+    Tuple[bytearray, int]
+        The uncompressed data (at most 'size' bytes), and the number of compressed bytes that were consumed
+    """
+    out_data = bytearray()
+    end = len(data)
+    position = 0
 
-        # Write unencoded byte if match is not long enough
-        if match_data.length <= MAX_UNENCODED:
+    while len(out_data) < size and position < end:
+        flags = data[position]
+        position = position + 1
 
-            match_data.length = 1  # 1 unencoded byte
+        for _ in range(8):
+            if len(out_data) >= size or position >= end:
+                break
 
-            flag_data.flags = flag_data.flags | flag_data.flag_position  # Flag unencoded byte
-            encoded_data[flag_data.next_encoded] = input_buffer[input_buffer_position]
-            flag_data.next_encoded = flag_data.next_encoded + 1
-            update_flags(flag_data, encoded_data, writer)
+            # Found an unencoded byte
+            if flags & 1:
+                out_data.append(data[position])
+                position = position + 1
 
-        # Encode as offset and length if match length >= max unencoded
-        else:
-            match_data.offset = (input_buffer_position - 1) - match_data.offset
-            if match_data.offset > 255 or match_data.offset < 0:
-                log(2, "LZZ encode", "Match Data Offset out of range!")
-                return memoryview(bytes(0))
-            if match_data.length - (MAX_UNENCODED + 1) > 255:
-                log(2, "LZSS encode", "Match Data Length out of range!")
-                return memoryview(bytes(0))
+            # Found encoded data
+            else:
+                if position + 1 >= end:
+                    # Truncated input
+                    position = end
+                    break
 
-            encoded_data[flag_data.next_encoded] = match_data.offset
-            flag_data.next_encoded = flag_data.next_encoded + 1
+                code_offset = data[position] + 1
+                code_length = data[position + 1] + MAX_UNENCODED + 1
+                position = position + 2
 
-            encoded_data[flag_data.next_encoded] = match_data.length - (MAX_UNENCODED + 1)
-            flag_data.next_encoded = flag_data.next_encoded + 1
-            update_flags(flag_data, encoded_data, writer)
+                start = len(out_data) - code_offset
+                if start < 0:
+                    log(3, "LZSS decode", f"Invalid back-reference at offset {position - 2}.")
+                    return out_data, position
 
-        input_buffer_position = input_buffer_position + match_data.length
+                if code_length <= code_offset:
+                    out_data.extend(out_data[start:start + code_length])
+                else:
+                    # The source overlaps the data being written: repeat the pattern
+                    pattern = out_data[start:]
+                    out_data.extend((pattern * (code_length // code_offset + 1))[:code_length])
 
-        # Find next match
-        match_data = find_match(input_buffer, input_buffer_position)
+            flags = flags >> 1
 
-    # Write any remaining encoded data
-    if flag_data.next_encoded != 0:
-        writer.write(flag_data.flags.to_bytes(1, "little"))
-        for i in range(0, flag_data.next_encoded):
-            writer.write(encoded_data[i].to_bytes(1, "little"))
+    if len(out_data) > size:
+        del out_data[size:]
 
-    return writer.getbuffer()
+    return out_data, position
 
 
 # --- decode() ---
@@ -209,51 +419,6 @@ def decode(data: bytes) -> bytearray:
     Returns
     -------
     bytearray
-        A bytearray containing the uncompressed data
+        A bytearray containing the uncompressed data, up to 4 KB
     """
-    reader = BytesIO(data)
-
-    flags = 0  # Encoded flag
-    flags_used = 7  # Unencoded flag
-
-    out_data = bytearray()
-
-    while True and len(out_data) < 4096:
-
-        flags = flags >> 1
-        flags_used = flags_used + 1
-
-        # If all flag bits have been shifted out, read a new flag
-        if flags_used == 8:
-
-            if reader.tell() == len(reader.getbuffer()):
-                break
-
-            flags = reader.read(1)[0]
-            flags_used = 0
-
-        # Found an unencoded byte
-        if (flags & 1) != 0:
-
-            if reader.tell() == len(reader.getbuffer()):
-                break
-
-            out_data.append(reader.read(1)[0])
-
-        # Found encoded data
-        else:
-
-            if reader.tell() == len(reader.getbuffer()):
-                break
-
-            code_offset = reader.read(1)[0]
-
-            if reader.tell() == len(reader.getbuffer()):
-                break
-
-            code_length = reader.read(1)[0] + MAX_UNENCODED + 1
-
-            for i in range(0, code_length):
-                out_data.append(out_data[len(out_data) - (code_offset + 1)])
-
-    return out_data
+    return decode_stream(data, 4096)[0]
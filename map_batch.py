@@ -0,0 +1,212 @@
+"""
+Exports all the maps from a ROM, or imports them back, without starting the GUI.
+
+Run it from the editor's directory:
+    python map_batch.py export ROM_FILE DIRECTORY [--format bin|rle|lzss] [--optimal]
+    python map_batch.py import ROM_FILE DIRECTORY [--output FILE] [--optimal]
+    python map_batch.py validate ROM_FILE [--jobs N]
+
+Maps are stored as one file per entry of the map table at $0F:FEA0, named map_XX.bin/rle/lzss, where XX is the index
+of the map in the table (decimal). The extension determines the compression used for that file, as when importing
+or exporting maps from the Map Editor.
+When importing, only the maps that differ from those in the ROM are saved, using the same allocation as the Map Editor:
+in place if they fit, otherwise re-allocating all the maps in their bank. NPC tables are preserved, but entrances,
+dungeon messages etc. are not touched: use the editor for those.
+Validating decodes all the maps and NPC tables, prints the size of each map and the free space in each bank, and
+lists any problem found (invalid data, overlapping maps, out of range pointers, etc.).
+"""
+
+__author__ = "Fox Cunning"
+
+import argparse
+import os
+import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Optional
+
+from debug import log
+from editor_settings import EditorSettings
+from map_editor import MapEditor
+from map_validator import MapValidator
+from rom import ROM
+from tilesets import TilesetResolver
+
+_MAP_FILE = re.compile(r"^map_(\d+)\.(bin|rle|lzss)$", re.IGNORECASE)
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+
+def open_rom(file_name: str) -> Optional[ROM]:
+    """
+    Opens a ROM file and processes its header
+
+    Returns
+    -------
+    Optional[ROM]
+        The ROM instance, or None if the file could not be opened or is not a valid ROM
+    """
+    rom = ROM()
+    val = rom.open(file_name)
+    if val != "OK":
+        log(2, "MapBatch", f"Could not open '{file_name}': {val}.")
+        return None
+
+    header = rom.header()
+    if bytes(header[0:3]) != b"NES":
+        log(2, "MapBatch", f"Wrong header: '{file_name}' does not look like a valid ROM file!")
+        return None
+
+    if header[6] & 0x04 != 0:
+        rom.trainer_size = 512
+
+    return rom
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+
+def create_map_editor(rom: ROM, optimal: bool) -> MapEditor:
+    """
+    Creates a Map Editor instance that only handles map data, without any GUI
+    """
+    settings = EditorSettings()
+    settings.set("optimal compression", optimal)
+
+    return MapEditor(rom, None, None, None, None, settings, TilesetResolver(rom))
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+
+def export_maps(editor: MapEditor, directory: str, extension: str) -> int:
+    """
+    Decodes every map in the map table and writes it to a file
+
+    Returns
+    -------
+    int
+        Number of failures
+    """
+    failures = 0
+    optimal = editor.settings.get("optimal compression")
+
+    os.makedirs(directory, exist_ok=True)
+
+    for index in range(editor.max_maps()):
+        file_name = os.path.join(directory, f"map_{index:02}.{extension}")
+        if not editor.write_map_file(file_name, editor.read_map(index), editor.is_dungeon(index), optimal):
+            failures = failures + 1
+
+    return failures
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+
+def import_maps(editor: MapEditor, directory: str) -> int:
+    """
+    Reads all the map files in a directory and stores the ones that have changed in ROM
+
+    Returns
+    -------
+    int
+        Number of failures
+    """
+    failures = 0
+
+    files: Dict[int, str] = {}
+    for file_name in sorted(os.listdir(directory)):
+        match = _MAP_FILE.match(file_name)
+        if match is None:
+            continue
+
+        index = int(match.group(1))
+        if index >= editor.max_maps():
+            log(3, "MapBatch", f"Ignoring '{file_name}': this ROM only supports {editor.max_maps()} maps.")
+        elif index in files:
+            log(3, "MapBatch", f"Ignoring '{file_name}': map {index} was already imported from '{files[index]}'.")
+        else:
+            files[index] = file_name
+
+    for index, file_name in sorted(files.items()):
+        dungeon = editor.is_dungeon(index)
+        new_map = editor.read_map_file(os.path.join(directory, file_name), dungeon)
+        if new_map is None:
+            failures = failures + 1
+            continue
+
+        if new_map == editor.read_map(index):
+            continue
+
+        entry = editor.map_table[index]
+        if not 0 <= entry.bank <= 0xE:
+            log(2, "MapBatch", f"Map {index} has no valid ROM bank ({entry.bank:02X}), skipping '{file_name}'.")
+            failures = failures + 1
+            continue
+
+        if dungeon:
+            # Mark and fountain IDs are stored separately, one per tile: their number can only be changed in the editor
+            dungeon_data = editor.dungeon_data[entry.flags & 0x1F]
+            if (new_map.count(6) != len(dungeon_data.mark_ids) or
+                    new_map.count(7) != len(dungeon_data.fountain_ids)):
+                log(2, "MapBatch", f"Number of marks/fountains changed in '{file_name}': use the editor to import "
+                                   f"this map.")
+                failures = failures + 1
+                continue
+
+        log(4, "MapBatch", f"Importing map {index} from '{file_name}'...")
+        editor.map_index = index
+        editor.map = new_map
+        editor.npc_data = editor.read_npc_table(index)
+
+        if not editor.store_map_data():
+            failures = failures + 1
+
+    return failures
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export, import or validate all the maps of a ROM, without the GUI.")
+    parser.add_argument("action", choices=["export", "import", "validate"])
+    parser.add_argument("rom", help="ROM file")
+    parser.add_argument("directory", nargs="?", default="", help="where map files are exported to / imported from")
+    parser.add_argument("--format", choices=["bin", "rle", "lzss"], default="bin",
+                        help="compression used for exported files (default: uncompressed)")
+    parser.add_argument("--output", default="", help="save the modified ROM to this file instead of overwriting it")
+    parser.add_argument("--optimal", action="store_true", help="use the slower encoders that produce smaller data")
+    parser.add_argument("--jobs", type=int, default=1, help="number of processes used for validation")
+    args = parser.parse_args()
+
+    if args.action != "validate" and args.directory == "":
+        parser.error(f"a directory is required to {args.action} maps")
+
+    start = time.perf_counter()
+
+    rom_file = open_rom(args.rom)
+    if rom_file is None:
+        sys.exit(2)
+
+    map_editor = create_map_editor(rom_file, args.optimal)
+
+    if args.action == "validate":
+        validator = MapValidator(rom_file, map_editor)
+        if args.jobs > 1:
+            with ProcessPoolExecutor(max_workers=args.jobs) as pool:
+                report = validator.run(pool)
+        else:
+            report = validator.run()
+        print(report)
+        errors = len(report.all_problems())
+
+    elif args.action == "export":
+        errors = export_maps(map_editor, args.directory, args.format)
+    else:
+        errors = import_maps(map_editor, args.directory)
+        if errors == 0 and not rom_file.save(args.output):
+            errors = 1
+
+    print(f"{args.action.capitalize()} {'completed' if errors == 0 else f'failed with {errors} error(s)'} "
+          f"in {time.perf_counter() - start:.2f} s.")
+
+    sys.exit(1 if errors > 0 else 0)
@@ -2,8 +2,9 @@ __author__ = "Fox Cunning"
 
 import os
 import tkinter
+from collections import OrderedDict
 from dataclasses import dataclass
-from typing import List, TextIO
+from typing import List, Optional, Sequence, Set, TextIO, Tuple, Dict
 
 from PIL import Image, ImageTk
 
@@ -18,6 +19,7 @@ import rle as rle
 from helpers import Point2D
 from palette_editor import PaletteEditor
 from text_editor import TextEditor, read_text, ascii_to_exodus
+from tilesets import TilesetResolver
 from enemy_editor import EnemyEditor
 from rom import ROM
 
@@ -54,6 +56,38 @@ class MapTableEntry:
     flags: int = 0      # 1 byte flags/ID (bit 7 set = dungeon)
 
 
+# ------------------------------------------------------------------------------------------------------------------
+
+@dataclass(init=True, repr=False)
+class MapBlob:
+    """
+    Map data as stored in ROM
+    """
+    data: bytes     # Raw bytes, compressed if the bank uses compression
+    size: int       # Size of the uncompressed data
+
+
+# ------------------------------------------------------------------------------------------------------------------
+
+@dataclass(init=True, repr=False)
+class TileSet:
+    """
+    A complete set of 16 pre-rendered map tiles
+    """
+    images: List[ImageTk.PhotoImage]
+    rows: List[List[bytes]]     # RGB pixels of each tile, one bytes object per row
+
+
+# Maximum number of tile sets kept in memory
+_TILESET_CACHE_SIZE = 8
+
+# Zoom levels available for the map canvas, and the size in pixels of a map tile for each of them
+_ZOOM_LEVELS: Dict[str, int] = {"50%": 8, "100%": 16, "200%": 32}
+
+# Tiles rendered around the visible part of the map, so that scrolling a little does not need a new image
+_VIEW_MARGIN = 4
+
+
 # ------------------------------------------------------------------------------------------------------------------
 
 @dataclass(init=True, repr=False)
@@ -75,18 +109,71 @@ class DungeonData:
     fountain_pointer: int = 0x0000  # Default: 0xB95D + 2 + (Dungeon ID * 4)
 
 
-# ----------------------------------------------------------------------------------------------------------------------
+# ------------------------------------------------------------------------------------------------------------------
 
-def no_stop() -> bool:
+class GridIndex:
     """
-    Used for sub-windows that should only be closed programmatically
-
-    Returns
-    -------
-    bool
-        False
+    Maps the (x, y) coordinates of a map cell to the indices of the objects (NPCs, entrances, Moongates) placed there.
+    Objects outside the 64x64 map are inactive and not indexed.
     """
-    return False
+
+    def __init__(self):
+        self._cells: Dict[Tuple[int, int], List[int]] = {}
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def rebuild(self, positions: Sequence[Tuple[int, int]]) -> None:
+        """
+        Indexes a whole list of objects, discarding any previous content
+
+        Parameters
+        ----------
+        positions: Sequence[Tuple[int, int]]
+            Coordinates of each object, in the same order as the list they come from
+        """
+        self._cells.clear()
+        for index, (x, y) in enumerate(positions):
+            self.add(index, x, y)
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def add(self, index: int, x: int, y: int) -> None:
+        if x > 63 or y > 63:
+            return
+
+        cell = self._cells.setdefault((x, y), [])
+        if index not in cell:
+            cell.append(index)
+            cell.sort()
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def remove(self, index: int, x: int, y: int) -> None:
+        cell = self._cells.get((x, y))
+        if cell is None or index not in cell:
+            return
+
+        cell.remove(index)
+        if len(cell) == 0:
+            del self._cells[(x, y)]
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def move(self, index: int, old_x: int, old_y: int, new_x: int, new_y: int) -> None:
+        self.remove(index, old_x, old_y)
+        self.add(index, new_x, new_y)
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def find(self, x: int, y: int) -> int:
+        """
+        Returns
+        -------
+        int
+            The lowest index of the objects at these coordinates, or -1 if there are none
+        """
+        cell = self._cells.get((x, y))
+        return cell[0] if cell else -1
 
 
 # ------------------------------------------------------------------------------------------------------------------
@@ -100,21 +187,24 @@ class MapEditor:
     rom: ROM
         Instance of the ROM handler
     app: gui
-        Main AppJar GUI instance
+        Main AppJar GUI instance, or None to only access map data (no display functions can be used in that case)
     palette_editor: PaletteEditor
         Instance of the Palette Editor (used to colour map tiles and NPCs)
     """
 
     def __init__(self, rom: ROM, app: gui, palette_editor: PaletteEditor, text_editor: TextEditor,
-                 enemy_editor: EnemyEditor, settings: EditorSettings):
+                 enemy_editor: EnemyEditor, settings: EditorSettings, tilesets: TilesetResolver):
         self.rom: ROM = rom
         self.app: gui = app
         self.text_editor = text_editor
         self.enemy_editor = enemy_editor
         self.settings = settings
+        self.tilesets = tilesets
 
         # Map data table from 0F:FEA0-FF6F
         self.map_table: List[MapTableEntry] = []
+        # Map data as stored in ROM, indexed by (bank, address)
+        self._map_blobs: Dict[Tuple[int, int], MapBlob] = {}
 
         # 1 byte per map in table at $FB9F (1.09+)
         self.tileset_table: bytearray = bytearray()
@@ -141,8 +231,14 @@ class MapEditor:
         self.map_index: int = 0
         # Image cache for the current map's tileset
         self.tiles: List[ImageTk.PhotoImage] = []
+        # RGB pixels of the same tiles, split into 16 rows of 48 bytes each, used to render the whole map at once
+        self.tile_rows: List[List[bytes]] = []
+        # Recently used tile sets, least recently used first
+        # Keys include the palette and the generation of the ROM banks the tiles come from, so that any change to
+        # the source data results in a new key
+        self._tileset_cache: OrderedDict = OrderedDict()
         # 64x64 map data
-        self.map = []
+        self.map = bytearray()
 
         # NPC Data for the current map
         self.npc_data: List[NPCData] = []
@@ -161,6 +257,11 @@ class MapEditor:
         # The last entry contains the coordinates of Dawn
         self.moongates: List[Point2D] = []
 
+        # Indices of the NPCs, entrances and Moongates of the current map, by coordinates
+        self._npc_grid = GridIndex()
+        self._entrance_grid = GridIndex()
+        self._moongate_grid = GridIndex()
+
         # ID of the tiles that should replace each Moongate when it disappears
         # The 9th entry is for Dawn
         self.moongate_replacements: List[int] = []
@@ -181,8 +282,23 @@ class MapEditor:
 
         # --- UI ---
 
-        # Canvas image references for this map's tiles, so we can edit them without clearing the whole map
-        self.canvas_map_images: List[int] = []
+        # The whole map (or current dungeon level) is shown as a single image, edited in place when tiles change
+        self.map_photo: Optional[ImageTk.PhotoImage] = None
+        self.canvas_map_image: int = -1
+        # (x, y) coordinates of the tiles changed since the map image was last updated
+        self._dirty_tiles: Set[Tuple[int, int]] = set()
+        # ID of the pending "after idle" call that will repaint them, or None if nothing is scheduled
+        self._repaint_id: Optional[str] = None
+
+        # Size of a map tile on the canvas, depending on the zoom level
+        self.tile_size: int = 16
+        # Rows of pixels of each tile scaled to the current zoom level, built from tile_rows when first needed
+        self._zoomed_rows: List[List[bytes]] = []
+        # Only the visible part of the map, plus a margin, is rendered: this is the area covered by map_photo,
+        # as (left, top, width, height) in tiles
+        self._view: Tuple[int, int, int, int] = (0, 0, 0, 0)
+        # ID of the pending call that will check whether the view needs to be rendered again after scrolling
+        self._view_update_id: Optional[str] = None
 
         # There will also be images to mark the party starting point and entrances to other locations
         self.canvas_icon_start: int = -1
@@ -190,7 +306,8 @@ class MapEditor:
         self.canvas_icon_moongates: List[int] = []
         self.canvas_icon_dawn: int = -1
 
-        self.canvas_map: tkinter.Canvas = tkinter.Canvas()
+        # There is no canvas when running without a GUI (e.g. from map_batch.py)
+        self.canvas_map: Optional[tkinter.Canvas] = tkinter.Canvas() if app is not None else None
 
         # A reference to the palette editor
         self.palette_editor: PaletteEditor = palette_editor
@@ -215,13 +332,9 @@ class MapEditor:
         # These will be saved when clicking on the map
         self._last_tile: Point2D = Point2D(0xFF, 0xFF)
 
-        # Keep count of how many tiles have been modified by a single action (e.g. single click, drag-drawing,
-        # flood fill, etc.) for undo/redo
-        self._modified_tiles: int = 0
-
+        # All the tiles modified by a single action (e.g. single click, drag-drawing, flood fill, etc.) are grouped
+        # into a single undo/redo entry
         self._undo_redo: UndoRedo = UndoRedo()
-        self._undo_actions: List[int] = []
-        self._redo_actions: List[int] = []
 
         # List of all location names, as read from locations txt file
         self.location_names: List[str] = []
@@ -271,6 +384,8 @@ class MapEditor:
         # Clear the tiles palette and image cache
         self.app.clearCanvas("ME_Canvas_Tiles")
         self.tiles.clear()
+        self.tile_rows.clear()
+        self._zoomed_rows = []
 
         if map_index < 0:
             map_index = self.map_index
@@ -351,6 +466,10 @@ class MapEditor:
             self.app.setOptionBox("ME_Option_Map_Colours", 0, callFunction=False)
             self.app.disableOptionBox("ME_Option_Map_Colours")
 
+        key = ("dungeon", bytes(colours), self.rom.generation(0xA))
+        if self._use_cached_tileset(key):
+            return
+
         # Create a new, empty (for now) tile image
         tile = Image.new('P', (16, 16), 0)
         tile.putpalette(colours)
@@ -406,11 +525,9 @@ class MapEditor:
             # Convert image to something we can put on a Canvas Widget, and cache it
             image = ImageTk.PhotoImage(tile)
             self.tiles.append(image)
+            self._cache_tile_rows(tile)
 
-            # Show this tile in the tile palette
-            x = 8 + (16 * (tile_index % 8))
-            y = 8 + (16 * (tile_index >> 3))
-            self.app.addCanvasImage("ME_Canvas_Tiles", x, y, image)
+        self._cache_tileset(key)
 
     # ------------------------------------------------------------------------------------------------------------------
 
@@ -481,237 +598,17 @@ class MapEditor:
         # Get the index of the tileset for this map
         tileset = self.tileset_table[self.map_index]
 
-        # First, create a list of pattern addresses using the "default" tileset
-        addresses: List[int] = []
-        for p in range(16):
-            addresses.append(0x8A40 + (p * 64))     # Each 2x2 tile is 64 bytes long
-
-        # The first tile will be at PPU address $1A40, the last one at $1E40
-
-        # Each entry in the table at $0A:B600 has the format: source address in bank $0A, destination address in PPU,
-        # number of bytes to copy
-
-        # Tile index is: (PPU address - $1A40) / 64
-        # Number of tiles in this entry: (bytes to copy) / 64
-
-        # Now replicate the subroutine at 0A:9D90 to enact the substitutions
-        if tileset == 0:        # Continent 1 (e.g. Sosaria)
-            # $B606
-            address = 0xB606
-            pattern_address = self.rom.read_word(0xA, address)
-            tile_index = (self.rom.read_word(0xA, address + 2) - 0x1A40) >> 6
-            tile_count = self.rom.read_word(0xA, address + 4) >> 6
-
-            for t in range(tile_count):
-                addresses[tile_index] = pattern_address
-                pattern_address = pattern_address + 64
-                tile_index = tile_index + 1
-
-            # $B60C
-            address = 0xB60C
-            pattern_address = self.rom.read_word(0xA, address)
-            tile_index = (self.rom.read_word(0xA, address + 2) - 0x1A40) >> 6
-            tile_count = self.rom.read_word(0xA, address + 4) >> 6
-
-            for t in range(tile_count):
-                addresses[tile_index] = pattern_address
-                pattern_address = pattern_address + 64
-                tile_index = tile_index + 1
-
-            # $BC36
-            address = 0xB636
-            pattern_address = self.rom.read_word(0xA, address)
-            tile_index = (self.rom.read_word(0xA, address + 2) - 0x1A40) >> 6
-            tile_count = self.rom.read_word(0xA, address + 4) >> 6
-
-            for t in range(tile_count):
-                addresses[tile_index] = pattern_address
-                pattern_address = pattern_address + 64
-                tile_index = tile_index + 1
-
-            # $B63C
-            address = 0xB63C
-            pattern_address = self.rom.read_word(0xA, address)
-            tile_index = (self.rom.read_word(0xA, address + 2) - 0x1A40) >> 6
-            tile_count = self.rom.read_word(0xA, address + 4) >> 6
-
-            for t in range(tile_count):
-                addresses[tile_index] = pattern_address
-                pattern_address = pattern_address + 64
-                tile_index = tile_index + 1
-
-        elif tileset == 1:      # Continent 2 (e.g. Ambrosia)
-            # $B612
-            address = 0xB612
-            pattern_address = self.rom.read_word(0xA, address)
-            tile_index = (self.rom.read_word(0xA, address + 2) - 0x1A40) >> 6
-            tile_count = self.rom.read_word(0xA, address + 4) >> 6
-
-            for t in range(tile_count):
-                addresses[tile_index] = pattern_address
-                pattern_address = pattern_address + 64
-                tile_index = tile_index + 1
-
-            # $B618
-            address = 0xB618
-            pattern_address = self.rom.read_word(0xA, address)
-            tile_index = (self.rom.read_word(0xA, address + 2) - 0x1A40) >> 6
-            tile_count = self.rom.read_word(0xA, address + 4) >> 6
-
-            for t in range(tile_count):
-                addresses[tile_index] = pattern_address
-                pattern_address = pattern_address + 64
-                tile_index = tile_index + 1
-
-            # $B636
-            address = 0xB636
-            pattern_address = self.rom.read_word(0xA, address)
-            tile_index = (self.rom.read_word(0xA, address + 2) - 0x1A40) >> 6
-            tile_count = self.rom.read_word(0xA, address + 4) >> 6
-
-            for t in range(tile_count):
-                addresses[tile_index] = pattern_address
-                pattern_address = pattern_address + 64
-                tile_index = tile_index + 1
-
-            # $B63C
-            address = 0xB63C
-            pattern_address = self.rom.read_word(0xA, address)
-            tile_index = (self.rom.read_word(0xA, address + 2) - 0x1A40) >> 6
-            tile_count = self.rom.read_word(0xA, address + 4) >> 6
-
-            for t in range(tile_count):
-                addresses[tile_index] = pattern_address
-                pattern_address = pattern_address + 64
-                tile_index = tile_index + 1
-
-            # $B654
-            address = 0xB654
-            pattern_address = self.rom.read_word(0xA, address)
-            tile_index = (self.rom.read_word(0xA, address + 2) - 0x1A40) >> 6
-            tile_count = self.rom.read_word(0xA, address + 4) >> 6
-
-            for t in range(tile_count):
-                addresses[tile_index] = pattern_address
-                pattern_address = pattern_address + 64
-                tile_index = tile_index + 1
-
-            # B630
-            address = 0xB630
-            pattern_address = self.rom.read_word(0xA, address)
-            tile_index = (self.rom.read_word(0xA, address + 2) - 0x1A40) >> 6
-            tile_count = self.rom.read_word(0xA, address + 4) >> 6
-
-            for t in range(tile_count):
-                addresses[tile_index] = pattern_address
-                pattern_address = pattern_address + 64
-                tile_index = tile_index + 1
-
-        elif tileset == 2:      # Castle 1 (e.g. Castle British, Shrines)
-            # $B61E
-            address = 0xB61E
-            pattern_address = self.rom.read_word(0xA, address)
-            tile_index = (self.rom.read_word(0xA, address + 2) - 0x1A40) >> 6
-            tile_count = self.rom.read_word(0xA, address + 4) >> 6
-
-            for t in range(tile_count):
-                addresses[tile_index] = pattern_address
-                pattern_address = pattern_address + 64
-                tile_index = tile_index + 1
-
-            # $B64E
-            address = 0xB64E
-            pattern_address = self.rom.read_word(0xA, address)
-            tile_index = (self.rom.read_word(0xA, address + 2) - 0x1A40) >> 6
-            tile_count = self.rom.read_word(0xA, address + 4) >> 6
-
-            for t in range(tile_count):
-                addresses[tile_index] = pattern_address
-                pattern_address = pattern_address + 64
-                tile_index = tile_index + 1
-
-            # $B624
-            address = 0xB624
-            pattern_address = self.rom.read_word(0xA, address)
-            tile_index = (self.rom.read_word(0xA, address + 2) - 0x1A40) >> 6
-            tile_count = self.rom.read_word(0xA, address + 4) >> 6
-
-            for t in range(tile_count):
-                addresses[tile_index] = pattern_address
-                pattern_address = pattern_address + 64
-                tile_index = tile_index + 1
-
-            # $B642
-            address = 0xB642
-            pattern_address = self.rom.read_word(0xA, address)
-            tile_index = (self.rom.read_word(0xA, address + 2) - 0x1A40) >> 6
-            tile_count = self.rom.read_word(0xA, address + 4) >> 6
-
-            for t in range(tile_count):
-                addresses[tile_index] = pattern_address
-                pattern_address = pattern_address + 64
-                tile_index = tile_index + 1
-
-        elif tileset == 3:      # Castle 2 (e.g. Castle Exodus)
-            # $B61E
-            address = 0xB61E
-            pattern_address = self.rom.read_word(0xA, address)
-            tile_index = (self.rom.read_word(0xA, address + 2) - 0x1A40) >> 6
-            tile_count = self.rom.read_word(0xA, address + 4) >> 6
-
-            for t in range(tile_count):
-                addresses[tile_index] = pattern_address
-                pattern_address = pattern_address + 64
-                tile_index = tile_index + 1
-
-            # $B65A
-            address = 0xB65A
-            pattern_address = self.rom.read_word(0xA, address)
-            tile_index = (self.rom.read_word(0xA, address + 2) - 0x1A40) >> 6
-            tile_count = self.rom.read_word(0xA, address + 4) >> 6
-
-            for t in range(tile_count):
-                addresses[tile_index] = pattern_address
-                pattern_address = pattern_address + 64
-                tile_index = tile_index + 1
-
-            # $B64E
-            address = 0xB64E
-            pattern_address = self.rom.read_word(0xA, address)
-            tile_index = (self.rom.read_word(0xA, address + 2) - 0x1A40) >> 6
-            tile_count = self.rom.read_word(0xA, address + 4) >> 6
-
-            for t in range(tile_count):
-                addresses[tile_index] = pattern_address
-                pattern_address = pattern_address + 64
-                tile_index = tile_index + 1
-
-            # $B642
-            address = 0xB642
-            pattern_address = self.rom.read_word(0xA, address)
-            tile_index = (self.rom.read_word(0xA, address + 2) - 0x1A40) >> 6
-            tile_count = self.rom.read_word(0xA, address + 4) >> 6
-
-            for t in range(tile_count):
-                addresses[tile_index] = pattern_address
-                pattern_address = pattern_address + 64
-                tile_index = tile_index + 1
-
-        else:                   # Town / default
-            # $B642
-            address = 0xB642
-            pattern_address = self.rom.read_word(0xA, address)
-            tile_index = (self.rom.read_word(0xA, address + 2) - 0x1A40) >> 6
-            tile_count = self.rom.read_word(0xA, address + 4) >> 6
-
-            for t in range(tile_count):
-                addresses[tile_index] = pattern_address
-                pattern_address = pattern_address + 64
-                tile_index = tile_index + 1
+        # Substitutions come from bank $0A, per-tile palettes from bank $0D
+        key = ("tileset", tileset, tuple(map_palette), self.rom.generation(0xA), self.rom.generation(0xD))
+        if self._use_cached_tileset(key):
+            return
+
+        # Bank and address of the patterns of each tile, after applying the substitutions for this tileset
+        sources = self.tilesets.sources(tileset)
 
         # Now we have a full list of pattern addresses, we can use it to create our images
         tile_index = 0
-        for a in addresses:
+        for bank, a in sources:
             # Get palette index for this tile from table in ROM at 0D:856D
             palette_index = self.rom.read_byte(0x0D, 0x856D + tile_index) * 4
             colours = []
@@ -726,41 +623,35 @@ class MapEditor:
             tile = Image.new('P', (16, 16), 0)
             tile.putpalette(colours)
 
-            # Top-left pattern
-            pixels = bytes(bytearray(self.rom.read_pattern(0x0A, a)))
-            image = Image.frombytes('P', (8, 8), pixels)
-            image.putpalette(colours)
-            tile.paste(image, (0, 0))
-            # Bottom-left pattern
-            pixels = bytes(bytearray(self.rom.read_pattern(0x0A, a + 0x10)))
-            image = Image.frombytes('P', (8, 8), pixels)
-            image.putpalette(colours)
-            tile.paste(image, (0, 8))
-            # Top-right pattern
-            pixels = bytes(bytearray(self.rom.read_pattern(0x0A, a + 0x20)))
-            image = Image.frombytes('P', (8, 8), pixels)
-            image.putpalette(colours)
-            tile.paste(image, (8, 0))
-            # Bottom-right pattern
-            pixels = bytes(bytearray(self.rom.read_pattern(0x0A, a + 0x30)))
-            image = Image.frombytes('P', (8, 8), pixels)
-            image.putpalette(colours)
-            tile.paste(image, (8, 8))
+            # Patterns are stored in this order: top-left, bottom-left, top-right, bottom-right
+            for pixels, position in zip(self.rom.read_patterns(bank, a, 4), [(0, 0), (0, 8), (8, 0), (8, 8)]):
+                image = Image.frombytes('P', (8, 8), pixels)
+                image.putpalette(colours)
+                tile.paste(image, position)
 
             image = ImageTk.PhotoImage(tile)
             self.tiles.append(image)
-
-            # Show this tile in the tile palette
-            x = 8 + (16 * (tile_index % 8))
-            y = 8 + (16 * (tile_index >> 3))
-            self.app.addCanvasImage("ME_Canvas_Tiles", x, y, image)
+            self._cache_tile_rows(tile)
 
             # Next tile
             tile_index = tile_index + 1
 
+        self._cache_tileset(key)
+
     # ------------------------------------------------------------------------------------------------------------------
 
     def _load_tile_patterns_hardcoded(self, map_palette: List[int]) -> None:
+        # Maps that use the same substitutions share the same tiles
+        if self.map_index == 0x00 or self.map_index == 0x0F or self.map_index == 0x14:
+            variant = self.map_index
+        elif self.map_index == 0x06 or self.map_index >= 0x15:
+            variant = 0x06
+        else:
+            variant = -1
+
+        key = ("hardcoded", variant, tuple(map_palette), self.rom.generation(0xA), self.rom.generation(0xD))
+        if self._use_cached_tileset(key):
+            return
 
         # Cache the 16 tiles used in this map
         for tile_index in range(16):
@@ -837,31 +728,70 @@ class MapEditor:
                 if tile_index == 0x0F:  # Alt. Grass 0 replaces Town Icon
                     actual_tile_index = 0x3E
 
-            # Top-left pattern
-            pixels = bytes(bytearray(self.rom.read_pattern(0x0A, 0x8A40 + (actual_tile_index * 64))))
-            image = Image.frombytes('P', (8, 8), pixels)
-            image.putpalette(colours)
-            tile.paste(image, (0, 0))
-            # Bottom-left pattern
-            pixels = bytes(bytearray(self.rom.read_pattern(0x0A, 0x8A50 + (actual_tile_index * 64))))
-            image = Image.frombytes('P', (8, 8), pixels)
-            image.putpalette(colours)
-            tile.paste(image, (0, 8))
-            # Top-right pattern
-            pixels = bytes(bytearray(self.rom.read_pattern(0x0A, 0x8A60 + (actual_tile_index * 64))))
-            image = Image.frombytes('P', (8, 8), pixels)
-            image.putpalette(colours)
-            tile.paste(image, (8, 0))
-            # Bottom-right pattern
-            pixels = bytes(bytearray(self.rom.read_pattern(0x0A, 0x8A70 + (actual_tile_index * 64))))
-            image = Image.frombytes('P', (8, 8), pixels)
-            image.putpalette(colours)
-            tile.paste(image, (8, 8))
+            # Patterns are stored in this order: top-left, bottom-left, top-right, bottom-right
+            for pixels, position in zip(self.rom.read_patterns(0x0A, 0x8A40 + (actual_tile_index * 64), 4),
+                                        [(0, 0), (0, 8), (8, 0), (8, 8)]):
+                image = Image.frombytes('P', (8, 8), pixels)
+                image.putpalette(colours)
+                tile.paste(image, position)
 
             image = ImageTk.PhotoImage(tile)
             self.tiles.append(image)
+            self._cache_tile_rows(tile)
+
+        self._cache_tileset(key)
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def _use_cached_tileset(self, key: Tuple) -> bool:
+        """
+        Looks for a tile set in the cache, and makes it the current one if found
+
+        Parameters
+        ----------
+        key: Tuple
+            Identifies the tile set: source of the tiles, palette and generation of the ROM banks they come from
+
+        Returns
+        -------
+        bool
+            True if the tiles were found and are now in use, False if they need to be loaded
+        """
+        tileset: Optional[TileSet] = self._tileset_cache.get(key)
+        if tileset is None:
+            return False
+
+        self._tileset_cache.move_to_end(key)
+        self.tiles.extend(tileset.images)
+        self.tile_rows.extend(tileset.rows)
+        self._show_tile_palette()
+        return True
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def _cache_tileset(self, key: Tuple) -> None:
+        """
+        Stores the tiles that have just been loaded in the cache, discarding the least recently used set if needed,
+        and shows them in the tile palette
+
+        Parameters
+        ----------
+        key: Tuple
+            Identifies the tile set: source of the tiles, palette and generation of the ROM banks they come from
+        """
+        self._tileset_cache[key] = TileSet(list(self.tiles), list(self.tile_rows))
+        while len(self._tileset_cache) > _TILESET_CACHE_SIZE:
+            self._tileset_cache.popitem(last=False)
+
+        self._show_tile_palette()
+
+    # ------------------------------------------------------------------------------------------------------------------
 
-            # Show this tile in the tile palette
+    def _show_tile_palette(self) -> None:
+        """
+        Shows the current tiles in the tile palette canvas
+        """
+        for tile_index, image in enumerate(self.tiles):
             x = 8 + (16 * (tile_index % 8))
             y = 8 + (16 * (tile_index >> 3))
             self.app.addCanvasImage("ME_Canvas_Tiles", x, y, image)
@@ -1083,9 +1013,6 @@ class MapEditor:
                 map_bank = entry.bank
                 map_address = entry.data_pointer
 
-                # Read map data (64*32 = 2KB)
-                map_data = self.rom.read_bytes(map_bank, map_address, 2046)
-
                 # Read Mark and Fountain pointers
                 mark_pointer = self.rom.read_word(0xD, base_mark_pointer + (dungeon_id * 4))
                 fountain_pointer = self.rom.read_word(0xD, base_mark_pointer + 2 + (dungeon_id * 4))
@@ -1094,12 +1021,8 @@ class MapEditor:
                 # there is no sequence terminator character or byte count stored anywhere; so we need to read the map
                 # and read the values as we go
 
-                # Uncompress map data if needed
-                map_compression = self.bank_compression[map_bank]
-                if map_compression == "RLE":
-                    map_data = rle.decode(map_data)
-                elif map_compression == "LZSS":
-                    map_data = lzss.decode(map_data)
+                # Read map data (64*32 = 2KB), uncompressing it if needed
+                map_data = self._read_map_data(map_bank, map_address, self.bank_compression[map_bank])[0]
 
                 # Read one byte for each mark/fountain found
                 fountain_count = 0
@@ -1150,6 +1073,48 @@ class MapEditor:
 
     # ------------------------------------------------------------------------------------------------------------------
 
+    def read_npc_table(self, map_index: int) -> List[NPCData]:
+        """
+        Reads a map's NPC table from ROM, without showing it in the editor
+
+        Parameters
+        ----------
+        map_index: int
+            Index of the map in the map data table
+
+        Returns
+        -------
+        List[NPCData]
+            Up to 32 NPCs, or an empty list if the map has no valid NPC table
+        """
+        bank = self.map_table[map_index].bank
+        address = self.map_table[map_index].npc_pointer
+
+        npc_data: List[NPCData] = []
+
+        # If either the bank number or the address is out of range, then there is no table
+        if bank > 0xE or address > 0xBFFF:
+            return npc_data
+
+        # Keep reading until 0xFF is found or 32 NPCs have been loaded
+        for _ in range(32):
+            npc = NPCData()
+            npc.sprite_id = self.rom.read_byte(bank, address)
+            if npc.sprite_id == 0xFF:
+                break
+            address = address + 1
+            npc.dialogue_id = self.rom.read_byte(bank, address)
+            address = address + 1
+            npc.starting_x = self.rom.read_byte(bank, address)
+            address = address + 1
+            npc.starting_y = self.rom.read_byte(bank, address)
+            address = address + 1
+            npc_data.append(npc)
+
+        return npc_data
+
+    # ------------------------------------------------------------------------------------------------------------------
+
     def load_npc_data(self) -> None:
         """
         Loads NPC data for the currently loaded map and puts the NPC images on the canvas
@@ -1157,10 +1122,6 @@ class MapEditor:
         bank = self.map_table[self.map_index].bank
         address = self.map_table[self.map_index].npc_pointer
 
-        # Clear previous data
-        self.npc_data.clear()
-        self.npc_data = []
-
         # Remove previous NPC images
         for npc in self.canvas_npc_images:
             self.canvas_map.delete(npc)
@@ -1171,28 +1132,18 @@ class MapEditor:
 
         # If either the bank number or the address is out of range, then we are creating an empty map
         if bank > 0xE or address > 0xBFFF:
+            self.npc_data = []
+            self._npc_grid.rebuild([])
             self.info(f"Creating empty NPC table for map {self.map_index}.")
             self.app.changeOptionBox("NPCE_Option_NPC_List", ["No NPCs found on this map"])
             return
 
-        # Keep reading until 0xFF is found or 32 NPCs have been loaded
-        for i in range(32):
-            npc = NPCData()
-            npc.sprite_id = self.rom.read_byte(bank, address)
-            if npc.sprite_id == 0xFF:
-                break
-            address = address + 1
-            npc.dialogue_id = self.rom.read_byte(bank, address)
-            address = address + 1
-            npc.starting_x = self.rom.read_byte(bank, address)
-            address = address + 1
-            npc.starting_y = self.rom.read_byte(bank, address)
-            address = address + 1
-            self.npc_data.append(npc)
+        self.npc_data = self.read_npc_table(self.map_index)
+        self._npc_grid.rebuild([(npc.starting_x, npc.starting_y) for npc in self.npc_data])
 
+        for i, npc in enumerate(self.npc_data):
             # Draw this NPC on the map
-            canvas_x = (npc.starting_x << 4) + 8
-            canvas_y = (npc.starting_y << 4) + 8
+            canvas_x, canvas_y = self._canvas_position(npc.starting_x, npc.starting_y)
             npc_sprite = self.npc_sprites[npc.sprite_id & 0x7F]
             self.canvas_npc_images.append(self.app.addCanvasImage("ME_Canvas_Map", canvas_x, canvas_y, npc_sprite))
 
@@ -1227,6 +1178,7 @@ class MapEditor:
             self.canvas_map.delete(e)
         self.canvas_icon_entrances.clear()
         self.entrances.clear()
+        self._entrance_grid.rebuild([])
 
         self.app.clearListBox("EE_List_Entrances", callFunction=False)
         self.app.clearEntry("EE_Entrance_X", callFunction=False, setFocus=False)
@@ -1242,7 +1194,7 @@ class MapEditor:
         starting_y = self.map_table[self.map_index].entry_y
         image = ImageTk.PhotoImage(Image.open("res/icon-start.gif"))
         self.canvas_icon_start = self.app.addCanvasImage("ME_Canvas_Map",
-                                                         (starting_x << 4) + 8, (starting_y << 4) + 8, image)
+                                                         *self._canvas_position(starting_x, starting_y), image)
 
         # Process entrances from Sosaria
         if self.map_index == 0x0:
@@ -1268,8 +1220,7 @@ class MapEditor:
                 address = address + 2
                 # Create an icon for this entrance
                 image_id = self.app.addCanvasImage("ME_Canvas_Map",
-                                                   (entrance.x << 4) + 8, (entrance.y << 4) + 8,
-                                                   image)
+                                                   *self._canvas_position(entrance.x, entrance.y), image)
                 self.canvas_icon_entrances.append(image_id)
                 # Only show entrance if coordinates are valid
                 if entrance.x > 63 or entrance.y > 63:
@@ -1308,8 +1259,7 @@ class MapEditor:
                 address = address + 2
                 # Create an icon for this entrance
                 image_id = self.app.addCanvasImage("ME_Canvas_Map",
-                                                   (entrance.x << 4) + 8, (entrance.y << 4) + 8,
-                                                   image)
+                                                   *self._canvas_position(entrance.x, entrance.y), image)
                 self.canvas_icon_entrances.append(image_id)
                 # Only show the icon if coordinates are valid
                 if entrance.x > 63 or entrance.y > 63:
@@ -1319,6 +1269,8 @@ class MapEditor:
                 self.app.addListItem("EE_List_Entrances",
                                      f"0x{e + 0x15:02X} -> {entrance.x:02d}, {entrance.y:02d}", select=False)
 
+        self._entrance_grid.rebuild([(entrance.x, entrance.y) for entrance in self.entrances])
+
         # Enable the entrance editing widgets if there are any
         if len(self.entrances) > 0:
             # self.app.selectListItemAtPos("EE_List_Entrances", 0, callFunction=True)
@@ -1348,6 +1300,8 @@ class MapEditor:
 
         self.canvas_icon_moongates.clear()
         self.canvas_icon_dawn = -1
+        self.moongates.clear()
+        self._moongate_grid.rebuild([])
 
         self.app.clearListBox("EE_List_Moongates", callFunction=False)
         self.app.clearEntry("EE_Moongate_X", callFunction=False, setFocus=False)
@@ -1405,7 +1359,7 @@ class MapEditor:
                 self.app.addListItem("EE_List_Moongates", f"{e} ({x:02d}, {y:02d})", select=False)
 
                 # Show this Moongate's icon on the map
-                canvas_image = self.app.addCanvasImage("ME_Canvas_Map", (x << 4) + 8, (y << 4) + 8, image)
+                canvas_image = self.app.addCanvasImage("ME_Canvas_Map", *self._canvas_position(x, y), image)
                 self.canvas_icon_moongates.append(canvas_image)
 
             # Read Moongate "replacement" tile IDs from ROM
@@ -1426,9 +1380,11 @@ class MapEditor:
             self.moongates.append(Point2D(x, y))
             self.app.addListItem("EE_List_Moongates", f"Dawn: ({x:02d}, {y:02d})", select=False)
 
+            self._moongate_grid.rebuild([(moongate.x, moongate.y) for moongate in self.moongates])
+
             # Show Dawn's icon on the map
             image = ImageTk.PhotoImage(Image.open("res/icon-dawn.gif"))
-            self.canvas_icon_dawn = self.app.addCanvasImage("ME_Canvas_Map", (x << 4) + 8, (y << 4) + 8, image)
+            self.canvas_icon_dawn = self.app.addCanvasImage("ME_Canvas_Map", *self._canvas_position(x, y), image)
 
             # Read Dawn's entrance and replacement tiles (bank $0B)
             # B225    LDA #$8F
@@ -1467,7 +1423,6 @@ class MapEditor:
                 # Clear the map
 
                 # TODO Clear undo/redo history
-                self._modified_tiles = 0
 
                 if self.is_dungeon():
                     # Only clear the current dungeon level
@@ -1486,26 +1441,17 @@ class MapEditor:
                     # Clear the whole area
                     clear_npcs = self.app.yesNoBox("Clear Map", "Do you also want to remove all NPCs?", "Map_Editor")
 
-                    self.app.setLabel("Progress_Label", "Clearing map, please wait...")
-                    self.app.showSubWindow("Map_Progress")
-                    root = self.canvas_map.winfo_toplevel()
-                    root.update()
-                    progress = 0.0
-                    self.app.setMeter("ME_Progress_Meter", value=progress)
+                    # The map image will be repainted all at once when we're done
                     for y in range(64):
-                        progress = progress + 1.55
                         for x in range(64):
                             self._change_tile(x, y, 0x00, False)
-                        self.app.setMeter("ME_Progress_Meter", value=progress)
-                        root.update()
-                    # Hide progress window and re-focus map editor windows
-                    self.app.hideSubWindow("Map_Progress")
                     self.app.showSubWindow("Entrance_Editor")
                     self.app.showSubWindow("NPC_Editor")
                     self.app.showSubWindow("Map_Editor")
 
                     if clear_npcs:
                         self.npc_data.clear()
+                        self._npc_grid.rebuild([])
 
                         for i in range(32):
                             # Hide the sprite
@@ -1587,8 +1533,6 @@ class MapEditor:
             self.create_widgets()
 
         self._undo_redo.clear()
-        self._undo_actions = []
-        self._redo_actions = []
         self._update_undo_buttons()
 
         self.app.showSubWindow("Map_Editor", hide=False)
@@ -1611,8 +1555,15 @@ class MapEditor:
         # TODO Ask to save changes (if any)
 
         self._undo_redo.clear()
-        self._undo_actions = []
-        self._redo_actions = []
+        if self._repaint_id is not None:
+            self.canvas_map.after_cancel(self._repaint_id)
+            self._repaint_id = None
+        if self._view_update_id is not None:
+            self.canvas_map.after_cancel(self._view_update_id)
+            self._view_update_id = None
+        self._dirty_tiles.clear()
+        self.map_photo = None
+        self.canvas_map_image = -1
         self.canvas_map = tkinter.Canvas()
 
         self.app.hideSubWindow("NPC_Editor", useStopFunction=False)
@@ -1784,27 +1735,19 @@ class MapEditor:
     # ------------------------------------------------------------------------------------------------------------------
 
     def _undo(self, _event=None) -> None:
-        try:
-            count = self._undo_actions.pop()
-        except IndexError:
+        if not self._undo_redo.can_undo():
             return
 
-        self._undo_redo.undo(count)
-
-        self._redo_actions.append(count)
+        self._undo_redo.undo()
         self._update_undo_buttons()
 
     # ------------------------------------------------------------------------------------------------------------------
 
     def _redo(self, _event=None) -> None:
-        try:
-            count = self._redo_actions.pop()
-        except IndexError:
+        if not self._undo_redo.can_redo():
             return
 
-        self._undo_redo.redo(count)
-
-        self._undo_actions.append(count)
+        self._undo_redo.redo()
         self._update_undo_buttons()
 
     # ------------------------------------------------------------------------------------------------------------------
@@ -1818,8 +1761,8 @@ class MapEditor:
         event
             Mouse click event instance
         """
-        tile_x = event.x >> 4
-        tile_y = event.y >> 4
+        tile_x = event.x // self.tile_size
+        tile_y = event.y // self.tile_size
 
         # Save coordinates for future editing
         self._last_tile(tile_x, tile_y)
@@ -1827,10 +1770,11 @@ class MapEditor:
         if self.tool == "draw":
             old_tile_id = self.get_tile_id(tile_x, tile_y)
 
+            # Everything drawn until the button is released will be undone in one step
+            self._undo_redo.begin("Draw")
             # self._change_tile(tile_x, tile_y, self.selected_tile_id, False)
             self._undo_redo(self._change_tile, (tile_x, tile_y, self.selected_tile_id, False),
                             (tile_x, tile_y, old_tile_id, False), text="Draw")
-            self._modified_tiles += 1
 
         elif self.tool == "fill":
             self.flood_fill(tile_x, tile_y)
@@ -1859,6 +1803,19 @@ class MapEditor:
                     self.app.showLabelFrame("NPCE_Frame_Info")
                     # app.setButton("NPCE_Button_Create_Apply", "Apply Changes")
 
+                # Also select any entrance or Moongate found here in the Entrance Editor
+                entrance_index = self.find_entrance(tile_x, tile_y)
+                if entrance_index > -1:
+                    self.selected_entrance = entrance_index
+                    self._highlight_list_item("EE_List_Entrances", entrance_index)
+                    self.entrance_info(entrance_index)
+
+                moongate_index = self.find_moongate(tile_x, tile_y)
+                if moongate_index > -1:
+                    self.selected_moongate = moongate_index
+                    self._highlight_list_item("EE_List_Moongates", moongate_index)
+                    self.moongate_info(moongate_index)
+
         elif self.tool == "move_entrance":
             self.select_tool("draw")
             if self.selected_entrance < 0 or len(self.app.getAllListItems("EE_List_Entrances")) < 1:
@@ -1887,9 +1844,7 @@ class MapEditor:
         # Display last tile position
         self.app.setLabel("ME_Selected_Tile_Position", f"[{self._last_tile.x}, {self._last_tile.y}]")
 
-        self._undo_actions.append(self._modified_tiles)
-        self._redo_actions = []
-        self._modified_tiles = 0
+        self._undo_redo.commit()
         self._update_undo_buttons()
 
     # ----------------------------------------------------------------------------------------------------------------------
@@ -1898,8 +1853,8 @@ class MapEditor:
         if self.tool != "draw":
             return
 
-        tile_x = event.x >> 4
-        tile_y = event.y >> 4
+        tile_x = event.x // self.tile_size
+        tile_y = event.y // self.tile_size
 
         if self._last_tile.x == tile_x and self._last_tile.y == tile_y:
             return
@@ -1912,7 +1867,6 @@ class MapEditor:
         # self._change_tile(tile_x, tile_y, self.selected_tile_id, False)
         self._undo_redo(self._change_tile, (tile_x, tile_y, self.selected_tile_id, False),
                         (tile_x, tile_y, old_tile_id, False), text="Draw")
-        self._modified_tiles += 1
 
     # ----------------------------------------------------------------------------------------------------------------------
 
@@ -1938,6 +1892,9 @@ class MapEditor:
         elif widget == "ME_Button_Info":
             self.select_tool("info")
 
+        elif widget == "ME_Option_Zoom":
+            self.set_zoom(_ZOOM_LEVELS.get(self.app.getOptionBox(widget), 16))
+
         elif widget == "MapEditor_Discard":
             self.close_windows()
 
@@ -2126,6 +2083,13 @@ class MapEditor:
                 # Column 2
                 self.app.canvas("ME_Canvas_Map_Colours", width=35, height=18, row=0, column=2, stretch='NONE',
                                 map=None, bg=colour.BLACK)
+                # Column 3
+                self.app.label("ME_Label_Zoom", "Zoom:", row=0, column=3, sticky='E')
+                # Column 4
+                self.app.optionBox("ME_Option_Zoom", list(_ZOOM_LEVELS.keys()), row=0, column=4, width=5,
+                                   sticky='W', change=self.map_input)
+                self.app.setOptionBox("ME_Option_Zoom", index=list(_ZOOM_LEVELS.values()).index(self.tile_size),
+                                      callFunction=False)
 
             # Map Canvas
             with self.app.scrollPane("ME_Scroll_Pane", row=4, column=0, stretch='BOTH', padding=[0, 0], sticky='NEWS'):
@@ -2159,16 +2123,6 @@ class MapEditor:
                                       tooltip="Automatically create corresponding ladder on the connecting floor",
                                       font=9)
 
-            # Progress Sub-Sub-Window ----------------------------------------------------------------------------------
-            with self.app.subWindow("Map_Progress", title="Redraw Map", modal=True, size=[300, 100], padding=[4, 4],
-                                    bg=colour.PALE_LIME):
-                # noinspection PyArgumentList
-                self.app.setStopFunction(no_stop)
-
-                self.app.label("Progress_Label", "Please wait...", row=0, column=0, font=16)
-                self.app.meter("ME_Progress_Meter", value=0, stretch="BOTH", sticky="WE",
-                               row=1, column=0, fill=colour.MEDIUM_BLUE)
-
             # Entrance / Moongate Editor Sub-Sub-Window ----------------------------------------------------------------
             with self.app.subWindow("Entrance_Editor", "Entrances / Moongates", size=[256, 440], modal=False,
                                     resizable=False, bg=colour.PALE_OLIVE):
@@ -2329,84 +2283,76 @@ class MapEditor:
         self.canvas_map.bind("<B1-Motion>", self._map_button1_drag, add='')
         self.canvas_map.bind("<ButtonRelease-1>", self._map_button1_up, add='')
 
+        # Check whether more of the map needs to be rendered whenever the pane is scrolled or resized
+        pane = self.app.getScrollPaneWidget("ME_Scroll_Pane")
+        pane.canvas.configure(xscrollcommand=lambda first, last: self._view_scrolled(pane.hscrollbar, first, last),
+                              yscrollcommand=lambda first, last: self._view_scrolled(pane.vscrollbar, first, last))
+
     # ------------------------------------------------------------------------------------------------------------------
 
-    def _load_dungeon(self, bank: int, address: int, compression: str = "") -> None:
+    def _read_map_data(self, bank: int, address: int, compression: str) -> Tuple[bytearray, int]:
         """
-        Loads and displays a dungeon map from ROM
+        Reads and, if needed, decompresses 2 KB of map data from ROM
 
         Parameters
         ----------
         bank: int
             Number of the ROM bank where this map's data resides
         address: int
-            Address in ROM of map data
+            Address in ROM of the map data
         compression: str
-            Can be "none", "LZSS" or "RLE". If not specified, use the default compression for that bank
-        """
-        # Clear map
-        self.map.clear()
-
-        # Set default tool
-        self.select_tool("draw")
-
-        # Show level 1 by default after loading
-        self.dungeon_level = 0
-
-        # Resize canvas to show one dungeon level at once (16 x 16 x 16 = 256 x 256)
-        self.app.setCanvasWidth("ME_Canvas_Map", 256)
-        self.app.setCanvasHeight("ME_Canvas_Map", 256)
-
-        # If the address is out of range, create an empty dungeon
-        if 0x8000 > address or address > 0xBFFF:
-            data = bytearray()
-            for _ in range(2048):
-                data.append(0x0D)
-        else:
-            data = self.rom.read_bytes(bank, address, 2048)
-
-        if compression == "" and (0 <= bank <= 0xF):
-            compression = self.bank_compression[bank]
+            Can be "none", "LZSS" or "RLE"
 
-        if compression == "none" or 0x8000 > address or address > 0xBFFF:
-            self.map = data
-            self.show_map()
+        Returns
+        -------
+        Tuple[bytearray, int]
+            The uncompressed map data, and the number of bytes it occupies in ROM
+        """
+        if compression == "LZSS":
+            return lzss.decode_stream(self.rom.read_view(bank, address), 2048)
 
         elif compression == "RLE":
+            return rle.decode_stream(self.rom.read_view(bank, address), 2048)
 
-            self.info(f"Opening dungeon map @{bank:X}:{address:04X} (RLE compressed)...")
-            uncompressed = rle.decode(data)
-            for i in range(2048):
-                value = uncompressed[i]
-                self.map.append(value)
+        return self.rom.read_bytes(bank, address, 2048), 2048
 
-            self.show_map()
+    # ------------------------------------------------------------------------------------------------------------------
 
-        elif compression == "LZSS":
+    @staticmethod
+    def _compress_map(map_data: bytearray, compression: str, optimal: bool = False) -> Tuple[bytes, int]:
+        """
+        Compresses map data
 
-            self.info(f"Opening dungeon map @{bank:X}:{address:04X} (LZSS compressed)...")
-            uncompressed = lzss.decode(data)
-            for i in range(2048):
-                value = uncompressed[i]
-                self.map.append(value)
+        Parameters
+        ----------
+        map_data: bytearray
+            Uncompressed map data
+        compression: str
+            Can be "LZSS" or "RLE"
+        optimal: bool
+            If True, use the slower encoder that produces the smallest output
 
-            self.show_map()
+        Returns
+        -------
+        Tuple[bytes, int]
+            The compressed data, and how many bytes were saved compared to the default encoder (always 0 if not
+            using optimal compression)
+        """
+        if compression == "LZSS":
+            packed = lzss.encode(map_data, optimal=optimal).tobytes(order="A")
+            saved = len(lzss.encode(map_data)) - len(packed) if optimal else 0
 
         else:
+            packed = bytes(rle.encode(map_data, optimal=optimal))
+            saved = len(rle.encode(map_data)) - len(packed) if optimal else 0
 
-            log(3, f"{self.__class__.__name__}",
-                f"Unsupported compression type: '{compression}' for map @{bank:X}:{address:04X}!")
-
-            for _ in range(2048):
-                self.map.append(0xD)
-
-            self.show_map()
+        return packed, saved
 
     # ------------------------------------------------------------------------------------------------------------------
 
-    def _load_map(self, bank: int, address: int, compression: str) -> None:
+    def _decode_map(self, bank: int, address: int, compression: str, dungeon: bool) -> bytearray:
         """
-        Loads and displays a (non dungeon) map from ROM
+        Reads and unpacks map data from ROM, without displaying it
 
         Parameters
         ----------
@@ -2416,251 +2362,365 @@ class MapEditor:
             Address in ROM of the map data
         compression: str
             Can be "none", "LZSS" or "RLE"
+        dungeon: bool
+            True for dungeon maps (one byte per tile), False for other maps (4-bit packing)
+
+        Returns
+        -------
+        bytearray
+            One byte per tile: 2048 for a dungeon, 4096 for other maps
         """
-        # Clear map
-        self.map.clear()
+        if dungeon:
+            # If the address is out of range, create an empty dungeon
+            if 0x8000 > address or address > 0xBFFF:
+                return bytearray([0x0D] * 2048)
 
-        # Set default tool
-        self.select_tool("draw")
+            if compression == "none":
+                return self.rom.read_bytes(bank, address, 2048)
 
-        # Resize canvas (64 x 64 x 16 = 1024 x 1024)
-        self.app.setCanvasWidth("ME_Canvas_Map", 1024)
-        self.app.setCanvasHeight("ME_Canvas_Map", 1024)
+            if compression == "RLE" or compression == "LZSS":
+                self.info(f"Opening dungeon map @{bank:X}:{address:04X} ({compression} compressed)...")
+                return bytearray(self._read_map_data(bank, address, compression)[0][:2048])
+
+            log(3, f"{self.__class__.__name__}",
+                f"Unsupported compression type: '{compression}' for map @{bank:X}:{address:04X}!")
+            return bytearray([0x0D] * 2048)
 
         # If the bank or address is out of range, we create an empty map
         if bank > 0xE or 0x8000 > address or address > 0xBFFF:
             self.info(f"Creating new empty map...")
-            for _ in range(64 * 64):
-                self.map.append(0)
-
-        elif compression == "none":
-            # self.info(f"Opening map @{bank:X}:{address:04X} (uncompressed)...")
-            for y in range(64):
-                for x in range(32):
-                    # Each byte represents two tiles
-                    value = self.rom.read_byte(bank, address)
-                    address = address + 1
-                    # Separate and store the two values
-                    self.map.append(value >> 4)
-                    self.map.append(value & 0x0F)
-            self.show_map()
+            return bytearray(64 * 64)
 
-        elif compression == "RLE":
-            # self.info(f"Opening map @{bank:X}:{address:04X} (RLE compressed)...")
-            data = self.rom.read_bytes(bank, address, 2048)
-            uncompressed = rle.decode(data)
-            offset = 0
-            for y in range(64):
-                for x in range(32):
-                    # Each byte represents two tiles
-                    value = uncompressed[offset]
-                    offset = offset + 1
-                    # Separate and store the two values
-                    self.map.append(value >> 4)
-                    self.map.append(value & 0x0F)
-            self.show_map()
-
-        elif compression == "LZSS":
-
-            # self.info(f"Opening map @{bank:X}:{address:04X} (LZSS compressed)...")
-            data = self.rom.read_bytes(bank, address, 2048)
-            uncompressed = lzss.decode(data)
-            offset = 0
-            for y in range(64):
-                for x in range(32):
-                    # Each byte represents two tiles
-                    value = uncompressed[offset]
-                    offset = offset + 1
-                    # Separate and store the two values
-                    self.map.append(value >> 4)
-                    self.map.append(value & 0x0F)
-            self.show_map()
+        if compression == "none":
+            packed = self.rom.read_bytes(bank, address, 2048)
 
-        else:
+        elif compression == "RLE" or compression == "LZSS":
+            packed = self._read_map_data(bank, address, compression)[0]
 
+        else:
             log(3, f"{self.__class__.__name__}",
                 f"Unimplemented compression method '{compression}' for non-dungeon map.")
+            return bytearray(64 * 64)
+
+        return self._unpack_tiles(packed)
 
     # ------------------------------------------------------------------------------------------------------------------
 
-    def import_map(self, file_name: str) -> bool:
+    @staticmethod
+    def _unpack_tiles(packed: Sequence[int]) -> bytearray:
         """
-        Imports map data from a binary file
+        Separates 4-bit packed map data, the format used for non-dungeon maps, into one byte per tile
 
         Parameters
         ----------
-        file_name: str
-            Full path of the file to open. Compression type will be chosen depending on file extension.
+        packed: Sequence[int]
+            At least 2048 bytes, each one representing two tiles
 
         Returns
         -------
-        bool
-            True if import was successful, False otherwise
+        bytearray
+            64 x 64 tile IDs
         """
-        file = None
-
-        # Determine compression type depending on file name
-        try:
-            position = file_name.index('.')
-            extension = file_name[position:]
-        except ValueError:
-            extension = ".bin"
+        map_data = bytearray(64 * 64)
+        for i in range(2048):
+            value = packed[i]
+            map_data[i << 1] = value >> 4
+            map_data[(i << 1) + 1] = value & 0x0F
+        return map_data
 
-        if extension.lower() == ".lzss":
-            compression = "LZSS"
+    # ------------------------------------------------------------------------------------------------------------------
 
-        elif extension.lower() == ".rle":
-            compression = "RLE"
+    @staticmethod
+    def _pack_tiles(map_data: Sequence[int]) -> bytearray:
+        """
+        Packs a non-dungeon map using 4 bits per tile (this is the format used internally by the game)
 
-        else:
-            compression = "none"
+        Parameters
+        ----------
+        map_data: Sequence[int]
+            64 x 64 tile IDs
 
-        try:
-            file = open(file_name, "rb")
+        Returns
+        -------
+        bytearray
+            2048 bytes of packed map data
+        """
+        packed = bytearray(2048)
+        for i in range(2048):
+            packed[i] = (map_data[i << 1] << 4) | (map_data[(i << 1) + 1] & 0x0F)
+        return packed
 
-            buffer = file.read()
+    # ------------------------------------------------------------------------------------------------------------------
 
-            if compression == "LZSS":
-                unpacked = lzss.decode(buffer)
-            elif compression == "RLE":
-                unpacked = rle.decode(bytearray(buffer))
-            else:
-                unpacked = bytearray(buffer)
+    def read_map(self, map_index: int) -> bytearray:
+        """
+        Decodes a map from ROM without loading it in the editor
 
-            new_map = bytearray()
+        Parameters
+        ----------
+        map_index: int
+            Index of the map in the map data table
 
-            try:
-                if self.is_dungeon():
-                    fountains = 0
-                    marks = 0
-                    dungeon_id = self.get_map_id()
+        Returns
+        -------
+        bytearray
+            One byte per tile: 2048 for a dungeon, 4096 for other maps
+        """
+        entry = self.map_table[map_index]
+        compression = self.bank_compression[entry.bank] if entry.bank <= 0xF else "none"
+        return self._decode_map(entry.bank, entry.data_pointer, compression, self.is_dungeon(map_index))
 
-                    # Copy map data as it is
-                    for i in range(64 * 32):
-                        # Count fountains and marks
-                        if unpacked[i] == 6:
-                            marks = marks + 1
-                        elif unpacked[i] == 7:
-                            fountains = fountains + 1
+    # ------------------------------------------------------------------------------------------------------------------
 
-                        new_map.append(int(unpacked[i]))
+    def _load_dungeon(self, bank: int, address: int, compression: str = "") -> None:
+        """
+        Loads and displays a dungeon map from ROM
 
-                    # Update fountains/marks count
-                    difference = marks - len(self.dungeon_data[dungeon_id].mark_ids)
+        Parameters
+        ----------
+        bank: int
+            Number of the ROM bank where this map's data resides
+        address: int
+            Address in ROM of map data
+        compression: str
+            Can be "none", "LZSS" or "RLE". If not specified, use the default compression for that bank
+        """
+        # Set default tool
+        self.select_tool("draw")
 
-                    if difference > 0:
-                        # There are  more marks than before: expand list
-                        for _ in range(difference):
-                            self.dungeon_data[dungeon_id].mark_ids.append(0)
+        # Show level 1 by default after loading
+        self.dungeon_level = 0
 
-                    elif difference < 0:
-                        # There are less marks than before: shrink list
-                        self.dungeon_data[dungeon_id].mark_ids = self.dungeon_data[dungeon_id].mark_ids[0:difference]
+        if compression == "" and (0 <= bank <= 0xF):
+            compression = self.bank_compression[bank]
 
-                    # Same thing with fountains
-                    difference = fountains - len(self.dungeon_data[dungeon_id].fountain_ids)
+        self.map = self._decode_map(bank, address, compression, True)
+        self.show_map()
 
-                    if difference > 0:
-                        # More fountains than before: expand list
-                        for _ in range(difference):
-                            self.dungeon_data[dungeon_id].fountain_ids.append(0)
+    # ------------------------------------------------------------------------------------------------------------------
 
-                    elif difference < 0:
-                        # Less fountains than before: shrink list
-                        self.dungeon_data[dungeon_id].fountain_ids = \
-                            self.dungeon_data[dungeon_id].fountain_ids[0:difference]
+    def _load_map(self, bank: int, address: int, compression: str) -> None:
+        """
+        Loads and displays a (non dungeon) map from ROM
 
-                else:
-                    # Non-dungeon maps use 4-bit packing
-                    for t in unpacked:
-                        new_map.append(t >> 4)
-                        new_map.append(t & 0x0F)
-
-            except IndexError as error:
-                self.error(f"Bad map data in file '{file_name}': {error}.")
-                file.close()
-                return False
+        Parameters
+        ----------
+        bank: int
+            Number of the ROM bank where this map's data resides
+        address: int
+            Address in ROM of the map data
+        compression: str
+            Can be "none", "LZSS" or "RLE"
+        """
+        # Set default tool
+        self.select_tool("draw")
 
-            # Done
-            file.close()
+        self.map = self._decode_map(bank, address, compression, False)
+        self.show_map()
 
-            # Clear map
-            self.map.clear()
-            self.map = new_map
+    # ------------------------------------------------------------------------------------------------------------------
 
-            self.show_map()
+    @staticmethod
+    def _file_compression(file_name: str) -> str:
+        """
+        Parameters
+        ----------
+        file_name: str
+            Name of a map file
 
-            if self.is_dungeon():
-                # Refresh marks and fountains count if dungeon
-                self.show_marks_count()
-                self.show_fountains_count()
+        Returns
+        -------
+        str
+            The compression used for that file, depending on its extension: "LZSS", "RLE" or "none"
+        """
+        extension = os.path.splitext(file_name)[1].lower()
 
-            else:
-                # Show NPCs and entrances if not a dungeon
-                self.load_npc_data()
-                self.load_entrances()
-                self.load_moongates()
+        if extension == ".lzss":
+            return "LZSS"
 
-            return True
+        elif extension == ".rle":
+            return "RLE"
+
+        return "none"
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def read_map_file(self, file_name: str, dungeon: bool) -> Optional[bytearray]:
+        """
+        Reads and unpacks map data from a binary file. Compression type is chosen depending on file extension.
+
+        Parameters
+        ----------
+        file_name: str
+            Full path of the file to open
+        dungeon: bool
+            True if the file contains a dungeon map, False for any other map
+
+        Returns
+        -------
+        Optional[bytearray]
+            One byte per tile, or None if the file could not be read
+        """
+        compression = self._file_compression(file_name)
+
+        try:
+            with open(file_name, "rb") as file:
+                buffer = file.read()
 
         except OSError as error:
             self.error(f"System error importing '{file_name}': {error}.")
+            return None
+
+        try:
+            if compression == "LZSS":
+                unpacked = lzss.decode(buffer)
+            elif compression == "RLE":
+                unpacked = rle.decode(bytearray(buffer))
+            else:
+                unpacked = bytearray(buffer)
 
-            if file is not None:
-                file.close()
+            if dungeon:
+                # Copy map data as it is
+                if len(unpacked) < 64 * 32:
+                    raise IndexError(f"{len(unpacked)} bytes instead of {64 * 32}")
+                return bytearray(unpacked[:64 * 32])
 
-            return False
+            # Non-dungeon maps use 4-bit packing
+            return self._unpack_tiles(unpacked)
+
+        except IndexError as error:
+            self.error(f"Bad map data in file '{file_name}': {error}.")
+            return None
 
     # ------------------------------------------------------------------------------------------------------------------
 
-    def export_map(self, file_name: str) -> bool:
+    def write_map_file(self, file_name: str, map_data: Sequence[int], dungeon: bool, optimal: bool = False) -> bool:
         """
-        Exports map data to a binary file
+        Packs map data and writes it to a binary file. The extension will determine the export format.
 
         Parameters
         ----------
         file_name: str
-            A string containing the desired file name. The extension will determine the export format.
+            A string containing the desired file name
+        map_data: Sequence[int]
+            One byte per tile
+        dungeon: bool
+            True for a dungeon map, False for any other map
+        optimal: bool
+            If True, use the slower encoder that produces the smallest output
 
         Returns
         -------
         bool
             True if successful, False otherwise
         """
-        # Pack map data first using 4-bit packing (this is the format used internally by the game)
-        packed_data = bytearray()
-
         # Only use 4-bit packing for non-dungeon maps
-        if self.is_dungeon() is False:
-            for i in range(0, 64 * 64, 2):
-                left = self.map[i]
-                right = self.map[i + 1]
-                packed_data.append((left << 4) | right)
-
+        if dungeon:
+            packed_data = bytearray(map_data)
         else:
-            packed_data = bytearray(self.map)
+            packed_data = self._pack_tiles(map_data)
+
+        compression = self._file_compression(file_name)
+        if compression != "none":
+            packed_data = self._compress_map(packed_data, compression, optimal)[0]
 
-        # Decide format depending on file extension
         try:
-            position = file_name.index('.')
-            extension = file_name[position:]
-        except ValueError:
-            extension = ".bin"
+            with open(file_name, "wb") as file:
+                file.write(packed_data)
 
-        if extension.lower() == ".lzss":
-            packed_data = lzss.encode(packed_data)
+        except OSError as error:
+            self.error(f"System error exporting '{file_name}': {error}.")
+            return False
 
-        elif extension.lower() == ".rle":
-            packed_data = rle.encode(packed_data)
+        return True
 
-        file = open(file_name, "wb")
-        if file is not None:
-            file.write(packed_data)
-            file.close()
-            return True
-        else:
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def import_map(self, file_name: str) -> bool:
+        """
+        Imports map data from a binary file
+
+        Parameters
+        ----------
+        file_name: str
+            Full path of the file to open. Compression type will be chosen depending on file extension.
+
+        Returns
+        -------
+        bool
+            True if import was successful, False otherwise
+        """
+        new_map = self.read_map_file(file_name, self.is_dungeon())
+        if new_map is None:
             return False
 
+        if self.is_dungeon():
+            dungeon_id = self.get_map_id()
+
+            # Count fountains and marks
+            marks = new_map.count(6)
+            fountains = new_map.count(7)
+
+            # Update fountains/marks count
+            difference = marks - len(self.dungeon_data[dungeon_id].mark_ids)
+
+            if difference > 0:
+                # There are  more marks than before: expand list
+                for _ in range(difference):
+                    self.dungeon_data[dungeon_id].mark_ids.append(0)
+
+            elif difference < 0:
+                # There are less marks than before: shrink list
+                self.dungeon_data[dungeon_id].mark_ids = self.dungeon_data[dungeon_id].mark_ids[0:difference]
+
+            # Same thing with fountains
+            difference = fountains - len(self.dungeon_data[dungeon_id].fountain_ids)
+
+            if difference > 0:
+                # More fountains than before: expand list
+                for _ in range(difference):
+                    self.dungeon_data[dungeon_id].fountain_ids.append(0)
+
+            elif difference < 0:
+                # Less fountains than before: shrink list
+                self.dungeon_data[dungeon_id].fountain_ids = \
+                    self.dungeon_data[dungeon_id].fountain_ids[0:difference]
+
+        self.map = new_map
+
+        self.show_map()
+
+        if self.is_dungeon():
+            # Refresh marks and fountains count if dungeon
+            self.show_marks_count()
+            self.show_fountains_count()
+
+        else:
+            # Show NPCs and entrances if not a dungeon
+            self.load_npc_data()
+            self.load_entrances()
+            self.load_moongates()
+
+        return True
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def export_map(self, file_name: str) -> bool:
+        """
+        Exports map data to a binary file
+
+        Parameters
+        ----------
+        file_name: str
+            A string containing the desired file name. The extension will determine the export format.
+
+        Returns
+        -------
+        bool
+            True if successful, False otherwise
+        """
+        return self.write_map_file(file_name, self.map, self.is_dungeon(), self.settings.get("optimal compression"))
+
     # ------------------------------------------------------------------------------------------------------------------
 
     def jump_to(self, x: int, y: int) -> None:
@@ -2689,6 +2749,249 @@ class MapEditor:
 
     # ------------------------------------------------------------------------------------------------------------------
 
+    def _cache_tile_rows(self, tile: Image.Image) -> None:
+        """
+        Stores the RGB pixels of a newly loaded tile, one bytes object per row, so that the map renderer can simply
+        join them together
+
+        Parameters
+        ----------
+        tile: Image.Image
+            16x16 tile image, as it will appear on the map
+        """
+        pixels = tile.convert("RGB").tobytes()
+        self.tile_rows.append([pixels[row:row + 48] for row in range(0, 16 * 48, 48)])
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def _render_map_image(self, left: int = 0, top: int = 0, width: int = -1, height: int = -1) -> Image.Image:
+        """
+        Renders a rectangular portion of the current map, or dungeon level, as a single image
+
+        Parameters
+        ----------
+        left: int
+            Horizontal coordinate of the first tile
+        top: int
+            Vertical coordinate of the first tile
+        width: int
+            Width of the area, in tiles; extends to the right edge of the map if not specified
+        height: int
+            Height of the area, in tiles; extends to the bottom of the map if not specified
+
+        Returns
+        -------
+        Image.Image
+            An RGB image of the requested area, at the current zoom level
+        """
+        if self.is_dungeon():
+            size = 16
+            first = self.dungeon_level << 8
+        else:
+            size = 64
+            first = 0
+
+        if width < 0:
+            width = size - left
+        if height < 0:
+            height = size - top
+
+        # Every line of pixels is made of the corresponding line of each tile in that row of the map
+        lines = []
+        rows = self._tile_atlas()
+        tile_size = self.tile_size
+        for y in range(top, top + height):
+            start = first + left + (y * size)
+            tiles = [rows[tile_id] for tile_id in self.map[start:start + width]]
+            for line in range(tile_size):
+                lines.append(b"".join([tile[line] for tile in tiles]))
+
+        return Image.frombytes("RGB", (width * tile_size, height * tile_size), b"".join(lines))
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def _tile_atlas(self) -> List[List[bytes]]:
+        """
+        Returns
+        -------
+        List[List[bytes]]
+            The rows of pixels of each tile, scaled to the current zoom level
+        """
+        if self.tile_size == 16:
+            return self.tile_rows
+
+        if len(self._zoomed_rows) != len(self.tile_rows):
+            size = self.tile_size
+            stride = size * 3
+            self._zoomed_rows = []
+            for rows in self.tile_rows:
+                tile = Image.frombytes("RGB", (16, 16), b"".join(rows))
+                pixels = tile.resize((size, size), Image.NONE if size > 16 else Image.BOX).tobytes()
+                self._zoomed_rows.append([pixels[row:row + stride] for row in range(0, size * stride, stride)])
+
+        return self._zoomed_rows
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def _canvas_position(self, x: int, y: int) -> Tuple[int, int]:
+        """
+        Parameters
+        ----------
+        x: int
+            Horizontal coordinate of a tile in the map, or dungeon level
+        y: int
+            Vertical coordinate of a tile in the map, or dungeon level
+
+        Returns
+        -------
+        Tuple[int, int]
+            Coordinates of the centre of that tile on the map canvas, at the current zoom level
+        """
+        half = self.tile_size >> 1
+        return (x * self.tile_size) + half, (y * self.tile_size) + half
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def _visible_area(self) -> Tuple[int, int, int, int]:
+        """
+        Returns
+        -------
+        Tuple[int, int, int, int]
+            The tiles that are currently visible in the scroll pane, as (left, top, right, bottom), with right and
+            bottom exclusive; the whole map if the pane has not been drawn yet
+        """
+        size = 16 if self.is_dungeon() else 64
+
+        pane = self.app.getScrollPaneWidget("ME_Scroll_Pane").canvas
+        width = pane.winfo_width()
+        height = pane.winfo_height()
+        if width <= 1 or height <= 1:
+            return 0, 0, size, size
+
+        # Visible area of the pane, relative to the map canvas
+        x = int(pane.canvasx(0)) - self.canvas_map.winfo_x()
+        y = int(pane.canvasy(0)) - self.canvas_map.winfo_y()
+
+        tile_size = self.tile_size
+        return (max(0, x // tile_size), max(0, y // tile_size),
+                min(size, (x + width + tile_size - 1) // tile_size), min(size, (y + height + tile_size - 1) // tile_size))
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def _render_view(self) -> None:
+        """
+        Renders the visible part of the map, plus a margin, as a single image placed where it belongs on the canvas
+        """
+        size = 16 if self.is_dungeon() else 64
+        left, top, right, bottom = self._visible_area()
+        left = max(0, left - _VIEW_MARGIN)
+        top = max(0, top - _VIEW_MARGIN)
+        right = min(size, right + _VIEW_MARGIN)
+        bottom = min(size, bottom + _VIEW_MARGIN)
+        self._view = (left, top, right - left, bottom - top)
+
+        self.map_photo = ImageTk.PhotoImage(self._render_map_image(*self._view))
+
+        x = left * self.tile_size
+        y = top * self.tile_size
+        if self.canvas_map_image < 0:
+            self.canvas_map_image = self.app.addCanvasImage("ME_Canvas_Map", x, y, self.map_photo, anchor="nw")
+        else:
+            self.canvas_map.itemconfigure(self.canvas_map_image, image=self.map_photo)
+            self.canvas_map.coords(self.canvas_map_image, x, y)
+
+        # The whole view has just been drawn
+        self._dirty_tiles.clear()
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def _view_scrolled(self, scrollbar, first: str, last: str) -> None:
+        """
+        Called when the map's scroll pane is scrolled or resized: updates the scroll bar and checks whether more of
+        the map needs to be rendered, once the event loop is idle
+
+        Parameters
+        ----------
+        scrollbar
+            The scroll bar widget that would normally receive this update
+        first: str
+            Fraction of the pane's content at the start of the visible area
+        last: str
+            Fraction of the pane's content at the end of the visible area
+        """
+        scrollbar.set(first, last)
+
+        if self._view_update_id is None and self.map_photo is not None:
+            self._view_update_id = self.canvas_map.after_idle(self._update_view)
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def _update_view(self) -> None:
+        """
+        Renders the map again if part of the visible area is not covered by the current map image
+        """
+        self._view_update_id = None
+        if self.map_photo is None:
+            return
+
+        left, top, right, bottom = self._visible_area()
+        view_left, view_top, view_width, view_height = self._view
+        if (left < view_left or top < view_top or right > view_left + view_width or
+                bottom > view_top + view_height):
+            self._render_view()
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def set_zoom(self, tile_size: int) -> None:
+        """
+        Changes the zoom level of the map canvas
+
+        Parameters
+        ----------
+        tile_size: int
+            Size in pixels of a map tile on the canvas: 8, 16 or 32
+        """
+        if tile_size == self.tile_size:
+            return
+
+        self.tile_size = tile_size
+        self._zoomed_rows = []
+
+        if self.map_photo is None:
+            return
+
+        self._resize_canvas()
+        self._render_view()
+
+        # Dungeons don't show any icons
+        if self.is_dungeon():
+            return
+
+        # Move all the icons to their new positions
+        if self.canvas_icon_start > -1:
+            self.canvas_map.coords(self.canvas_icon_start,
+                                   *self._canvas_position(self.map_table[self.map_index].entry_x,
+                                                          self.map_table[self.map_index].entry_y))
+        for npc, image_id in zip(self.npc_data, self.canvas_npc_images):
+            self.canvas_map.coords(image_id, *self._canvas_position(npc.starting_x, npc.starting_y))
+        for entrance, image_id in zip(self.entrances, self.canvas_icon_entrances):
+            self.canvas_map.coords(image_id, *self._canvas_position(entrance.x, entrance.y))
+        for moongate, image_id in zip(self.moongates, self.canvas_icon_moongates + [self.canvas_icon_dawn]):
+            if image_id > -1:
+                self.canvas_map.coords(image_id, *self._canvas_position(moongate.x, moongate.y))
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def _resize_canvas(self) -> None:
+        """
+        Makes the map canvas as large as the whole map, or dungeon level, at the current zoom level
+        """
+        size = (16 if self.is_dungeon() else 64) * self.tile_size
+        self.app.setCanvasWidth("ME_Canvas_Map", size)
+        self.app.setCanvasHeight("ME_Canvas_Map", size)
+
+    # ------------------------------------------------------------------------------------------------------------------
+
     def show_map(self) -> None:
         """
         Use cached tiles to display the currently loaded map
@@ -2696,33 +2999,20 @@ class MapEditor:
 
         # self.info("Drawing map on canvas...")
         self.app.clearCanvas("ME_Canvas_Map")
-        self.canvas_map_images.clear()
 
         self.canvas_icon_dawn = -1
         self.canvas_icon_entrances.clear()
         self.canvas_icon_start = -1
         self.canvas_icon_moongates.clear()
 
+        # The visible part of the map is a single image: any icon added afterwards will be drawn on top of it
+        self.canvas_map_image = -1
+        self._resize_canvas()
+        self._render_view()
+
         if self.is_dungeon():
-            # Get offset of map data for the current level
-            level_offset = self.dungeon_level << 8
             dungeon_index = self.get_map_id()
 
-            for y in range(16):
-                for x in range(16):
-                    # Calculate offset of this tile for this level
-                    offset = level_offset + x + (y << 4)
-                    tile_id = self.map[offset]
-                    tile_image = self.tiles[tile_id]
-
-                    # Calculate drawing position on canvas
-                    canvas_x = (x << 4) + 8
-                    canvas_y = (y << 4) + 8
-
-                    # "Paste" cached tile image on canvas
-                    pasted_image = self.app.addCanvasImage("ME_Canvas_Map", canvas_x, canvas_y, tile_image)
-                    self.canvas_map_images.append(pasted_image)
-
             # If this is a new map, it will have no messages
             missing_messages = 8 - len(self.dungeon_data[dungeon_index].messages)
             if missing_messages > 0:
@@ -2739,40 +3029,128 @@ class MapEditor:
             self.show_fountains_count()
 
         else:
-            # Show progress
-            self.app.setLabel("Progress_Label", "Loading map, please wait...")
-            self.app.showSubWindow("Map_Progress")
-            root = self.canvas_map.winfo_toplevel()
-            root.update()
-            progress = 0.0
-            self.app.setMeter("ME_Progress_Meter", value=progress)
-
-            index = 0
-            for y in range(64):
-                progress = progress + 1.55
-                for x in range(64):
-                    # Each value should be between 0 and 0x0F
-                    tile_id = self.map[index]
-                    tile_image = self.tiles[tile_id]
-                    # Calculate the centre coordinates of this tile in the canvas
-                    canvas_x = (x << 4) + 8
-                    canvas_y = (y << 4) + 8
-                    # "Paste" the cached tile on the canvas
-                    pasted_image = self.app.addCanvasImage("ME_Canvas_Map", canvas_x, canvas_y, tile_image)
-                    self.canvas_map_images.append(pasted_image)
-                    # Move to the next tile
-                    index = index + 1
-                self.app.setMeter("ME_Progress_Meter", value=progress)
-                root.update()
-
-            # Hide progress window
-            self.app.hideSubWindow("Map_Progress", useStopFunction=False)
             self.app.showSubWindow("Entrance_Editor")
             self.app.showSubWindow("NPC_Editor")
             self.app.showSubWindow("Map_Editor")
 
     # ------------------------------------------------------------------------------------------------------------------
 
+    def _paint_tile(self, x: int, y: int) -> None:
+        """
+        Marks a tile as changed: the map image will be updated once the event loop is idle, together with any other
+        tile that changes in the meantime
+
+        Parameters
+        ----------
+        x: int
+            Horizontal coordinate of the tile in the map, or dungeon level
+        y: int
+            Vertical coordinate of the tile in the map, or dungeon level
+        """
+        self._dirty_tiles.add((x, y))
+        self._schedule_repaint()
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def _schedule_repaint(self) -> None:
+        """
+        Makes sure that the dirty tiles will be repainted once the event loop is idle
+        """
+        if self._repaint_id is None and len(self._dirty_tiles) > 0:
+            self._repaint_id = self.canvas_map.after_idle(self._repaint_dirty_tiles)
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    @staticmethod
+    def _dirty_rectangles(tiles: Set[Tuple[int, int]]) -> List[Tuple[int, int, int, int]]:
+        """
+        Groups changed tiles into rectangles: horizontal runs of tiles first, then runs that span the same columns on
+        consecutive rows are merged together
+
+        Parameters
+        ----------
+        tiles: Set[Tuple[int, int]]
+            (x, y) coordinates of the changed tiles
+
+        Returns
+        -------
+        List[Tuple[int, int, int, int]]
+            A list of (left, top, width, height) rectangles covering all the tiles, in tile units
+        """
+        rectangles: List[Tuple[int, int, int, int]] = []
+        # Rectangles that can still grow downwards: (left, width) -> (top, height)
+        open_rectangles: Dict[Tuple[int, int], Tuple[int, int]] = {}
+
+        runs: Dict[int, List[Tuple[int, int]]] = {}
+        for x, y in sorted(tiles, key=lambda t: (t[1], t[0])):
+            row = runs.setdefault(y, [])
+            if len(row) > 0 and row[-1][0] + row[-1][1] == x:
+                row[-1] = (row[-1][0], row[-1][1] + 1)
+            else:
+                row.append((x, 1))
+
+        for y, row in runs.items():
+            still_open: Dict[Tuple[int, int], Tuple[int, int]] = {}
+            for run in row:
+                top, height = open_rectangles.pop(run, (y, 0))
+                if top + height == y:
+                    still_open[run] = (top, height + 1)
+                else:
+                    rectangles.append((run[0], top, run[1], height))
+                    still_open[run] = (y, 1)
+
+            # Whatever was not extended by this row is complete
+            for (left, width), (top, height) in open_rectangles.items():
+                rectangles.append((left, top, width, height))
+            open_rectangles = still_open
+
+        for (left, width), (top, height) in open_rectangles.items():
+            rectangles.append((left, top, width, height))
+
+        return rectangles
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def _repaint_dirty_tiles(self) -> None:
+        """
+        Updates the areas of the map image that contain changed tiles
+        """
+        self._repaint_id = None
+        if self.map_photo is None or len(self._dirty_tiles) == 0:
+            self._dirty_tiles.clear()
+            return
+
+        # Tiles outside the rendered area will be drawn when they are scrolled into view
+        view_left, view_top, view_width, view_height = self._view
+        rectangles = self._dirty_rectangles({(x, y) for x, y in self._dirty_tiles
+                                             if view_left <= x < view_left + view_width and
+                                             view_top <= y < view_top + view_height})
+        self._dirty_tiles.clear()
+
+        # Too many separate areas, e.g. after undoing a large fill: re-render everything at once
+        if len(rectangles) > 64:
+            self.redraw_map()
+            return
+
+        photo = str(self.map_photo)
+        level_offset = self.dungeon_level << 8
+        tile_size = self.tile_size
+        for left, top, width, height in rectangles:
+            x = (left - view_left) * tile_size
+            y = (top - view_top) * tile_size
+            if width == 1 and height == 1 and tile_size == 16:
+                # Copy the cached tile directly, no need to go through PIL
+                if self.is_dungeon():
+                    tile_id = self.map[level_offset + left + (top << 4)]
+                else:
+                    tile_id = self.map[left + (top << 6)]
+                self.canvas_map.tk.call(photo, "copy", str(self.tiles[tile_id]), "-to", x, y)
+            else:
+                area = ImageTk.PhotoImage(self._render_map_image(left, top, width, height))
+                self.canvas_map.tk.call(photo, "copy", str(area), "-to", x, y)
+
+    # ------------------------------------------------------------------------------------------------------------------
+
     def _set_party_entry(self, x: int, y: int, facing: int = 0) -> None:
         """
         Sets/changes the coordinates at which the party will be placed when entering this map from a continent
@@ -2813,9 +3191,6 @@ class MapEditor:
 
         if self.is_dungeon() is False:
             self._map_flood_fill(x, y, self.selected_tile_id, old_tile_id)
-            self._redo_actions = []
-            self._undo_actions.append(self._modified_tiles)
-            self._modified_tiles = 0
             self._update_undo_buttons()
 
         else:
@@ -2830,15 +3205,9 @@ class MapEditor:
                 # self._change_tile(x, y, self.selected_tile_id)
                 self._undo_redo(self._change_tile, (x, y, self.selected_tile_id),
                                 (x, y, old_tile_id), text="Draw")
-                self._redo_actions = []
-                self._undo_actions.append(1)
-                self._modified_tiles = 0
                 self._update_undo_buttons()
             else:
                 self._dungeon_flood_fill(x, y, self.selected_tile_id, old_tile_id)
-                self._redo_actions = []
-                self._undo_actions.append(self._modified_tiles)
-                self._modified_tiles = 0
                 self._update_undo_buttons()
 
     # ------------------------------------------------------------------------------------------------------------------
@@ -2860,54 +3229,10 @@ class MapEditor:
         """
         self.app.setCanvasCursor("ME_Canvas_Map", "watch")
 
-        queue = list()
-
-        # self._change_tile(x, y, new_tile_id)
-        self._undo_redo(self._change_tile, (x, y, new_tile_id), (x, y, old_tile_id), text="Flood fill")
-        self._modified_tiles += 1
-
-        queue.append((x, y))
-
-        while len(queue) > 0:
-            # root.update()
-
-            node = queue.pop()
-
-            node_x = node[0] - 1
-            node_y = node[1]
-            if node_x >= 0 and self.get_tile_id(node_x, node_y) == old_tile_id:
-                # self._change_tile(node_x, node_y, new_tile_id)
-                self._undo_redo(self._change_tile, (node_x, node_y, new_tile_id),
-                                (node_x, node_y, old_tile_id), text="Flood fill")
-                self._modified_tiles += 1
-                queue.append((node_x, node_y))
-
-            node_x = node[0] + 1
-            node_y = node[1]
-            if node_x <= 63 and self.get_tile_id(node_x, node_y) == old_tile_id:
-                # self._change_tile(node_x, node_y, new_tile_id)
-                self._undo_redo(self._change_tile, (node_x, node_y, new_tile_id),
-                                (node_x, node_y, old_tile_id), text="Flood fill")
-                self._modified_tiles += 1
-                queue.append((node_x, node_y))
-
-            node_x = node[0]
-            node_y = node[1] - 1
-            if node_y >= 0 and self.get_tile_id(node_x, node_y) == old_tile_id:
-                # self._change_tile(node_x, node_y, new_tile_id)
-                self._undo_redo(self._change_tile, (node_x, node_y, new_tile_id),
-                                (node_x, node_y, old_tile_id), text="Flood fill")
-                self._modified_tiles += 1
-                queue.append((node_x, node_y))
-
-            node_x = node[0]
-            node_y = node[1] + 1
-            if node_y <= 63 and self.get_tile_id(node_x, node_y) == old_tile_id:
-                # self._change_tile(node_x, node_y, new_tile_id)
-                self._undo_redo(self._change_tile, (node_x, node_y, new_tile_id),
-                                (node_x, node_y, old_tile_id), text="Flood fill")
-                self._modified_tiles += 1
-                queue.append((node_x, node_y))
+        indices = self._scanline_fill(x, y, 64, old_tile_id)
+
+        # The whole area is changed (and undone) as a single action
+        self._undo_redo.apply_delta(self.map, indices, new_tile_id, self._tiles_changed, text="Flood fill")
 
     # ------------------------------------------------------------------------------------------------------------------
 
@@ -2928,52 +3253,93 @@ class MapEditor:
         """
         self.app.setCanvasCursor("ME_Canvas_Map", "watch")
 
-        queue = list()
-
-        # self._change_tile(x, y, new_tile_id)
-        self._undo_redo(self._change_tile, (x, y, new_tile_id), (x, y, old_tile_id), text="Flood fill")
-        self._modified_tiles += 1
-
-        queue.append((x, y))
-
-        while len(queue) > 0:
-            node = queue.pop()
-
-            node_x = node[0] - 1
-            node_y = node[1]
-            if node_x >= 0 and self.get_tile_id(node_x, node_y) == old_tile_id:
-                # self._change_tile(node_x, node_y, new_tile_id)
-                self._undo_redo(self._change_tile, (node_x, node_y, new_tile_id),
-                                (node_x, node_y, old_tile_id), text="Flood fill")
-                self._modified_tiles += 1
-                queue.append((node_x, node_y))
-
-            node_x = node[0] + 1
-            node_y = node[1]
-            if node_x <= 15 and self.get_tile_id(node_x, node_y) == old_tile_id:
-                # self._change_tile(node_x, node_y, new_tile_id)
-                self._undo_redo(self._change_tile, (node_x, node_y, new_tile_id),
-                                (node_x, node_y, old_tile_id), text="Flood fill")
-                self._modified_tiles += 1
-                queue.append((node_x, node_y))
-
-            node_x = node[0]
-            node_y = node[1] - 1
-            if node_y >= 0 and self.get_tile_id(node_x, node_y) == old_tile_id:
-                # self._change_tile(node_x, node_y, new_tile_id)
-                self._undo_redo(self._change_tile, (node_x, node_y, new_tile_id),
-                                (node_x, node_y, old_tile_id), text="Flood fill")
-                self._modified_tiles += 1
-                queue.append((node_x, node_y))
-
-            node_x = node[0]
-            node_y = node[1] + 1
-            if node_y <= 15 and self.get_tile_id(node_x, node_y) == old_tile_id:
-                # self._change_tile(node_x, node_y, new_tile_id)
-                self._undo_redo(self._change_tile, (node_x, node_y, new_tile_id),
-                                (node_x, node_y, old_tile_id), text="Flood fill")
-                self._modified_tiles += 1
-                queue.append((node_x, node_y))
+        indices = self._scanline_fill(x, y, 16, old_tile_id)
+
+        self._undo_redo.apply_delta(self.map, indices, new_tile_id, self._tiles_changed, text="Flood fill")
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def _scanline_fill(self, x: int, y: int, size: int, old_tile_id: int) -> List[int]:
+        """
+        Finds the area that a flood fill starting at the given coordinates would cover, without changing anything
+
+        Parameters
+        ----------
+        x: int
+            Starting point of the fill, X coordinate
+        y: int
+            Starting point of the fill, Y coordinate
+        size: int
+            Width/height of the map: 64, or 16 for a dungeon level
+        old_tile_id: int
+            ID of the tile(s) that will be replaced
+
+        Returns
+        -------
+        List[int]
+            Indices in the map data of all the tiles in the area
+        """
+        first = (self.dungeon_level << 8) if self.is_dungeon() else 0
+        area = self.map[first:first + (size * size)]
+        filled = bytearray(size * size)
+        indices: List[int] = []
+
+        stack = [(x, y)]
+        while len(stack) > 0:
+            x, y = stack.pop()
+            row = y * size
+            if filled[row + x] or area[row + x] != old_tile_id:
+                continue
+
+            # Extend this span as far as possible to the left and to the right
+            left = x
+            while left > 0 and area[row + left - 1] == old_tile_id and not filled[row + left - 1]:
+                left = left - 1
+            right = x
+            while right < size - 1 and area[row + right + 1] == old_tile_id and not filled[row + right + 1]:
+                right = right + 1
+
+            filled[row + left:row + right + 1] = b"\x01" * (right + 1 - left)
+            indices.extend(range(first + row + left, first + row + right + 1))
+
+            # Queue one seed for each separate span of matching tiles above and below this one
+            for next_y in (y - 1, y + 1):
+                if next_y < 0 or next_y >= size:
+                    continue
+
+                next_row = next_y * size
+                in_span = False
+                for next_x in range(left, right + 1):
+                    if area[next_row + next_x] == old_tile_id and not filled[next_row + next_x]:
+                        if not in_span:
+                            stack.append((next_x, next_y))
+                            in_span = True
+                    else:
+                        in_span = False
+
+        return indices
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def _tiles_changed(self, indices: Sequence[int]) -> None:
+        """
+        Called after a group of tiles has been changed directly in the map data, e.g. by a flood fill.
+        Unlike _change_tile, this does not keep track of special tiles: only use it for terrain, walls and floors.
+
+        Parameters
+        ----------
+        indices: Sequence[int]
+            Indices of the changed tiles in the map data
+        """
+        if self.is_dungeon():
+            # Only repaint tiles on the level currently shown
+            first = self.dungeon_level << 8
+            self._dirty_tiles.update([((index - first) & 0x0F, (index - first) >> 4) for index in indices
+                                      if first <= index < first + 256])
+        else:
+            self._dirty_tiles.update([(index & 0x3F, index >> 6) for index in indices])
+
+        self._schedule_repaint()
 
     # ------------------------------------------------------------------------------------------------------------------
 
@@ -2995,7 +3361,6 @@ class MapEditor:
         # If drawing a special tile, show special tile info
         if self.is_dungeon():
             map_index = x + (16 * y) + (self.dungeon_level << 8)
-            canvas_index = x + (16 * y)
 
             dungeon_id = self.get_map_id()
 
@@ -3129,7 +3494,6 @@ class MapEditor:
         # Otherwise, simply hide special tile info frame
         else:
             map_index = x + (y << 6)
-            canvas_index = map_index
 
             # self.app.hideFrame("ME_Frame_Special_Tile")
 
@@ -3137,19 +3501,19 @@ class MapEditor:
         # Update cached map data
         self.map[map_index] = tile_id
         # Update canvas image
-        self.canvas_map.itemconfig(self.canvas_map_images[canvas_index], image=self.tiles[tile_id])
+        self._paint_tile(x, y)
 
     # ------------------------------------------------------------------------------------------------------------------
 
     def _update_undo_buttons(self) -> None:
-        if len(self._undo_actions) < 1:
+        if not self._undo_redo.can_undo():
             self.app.disableButton("ME_Button_Undo")
             self.app.setButtonTooltip("ME_Button_Undo", "Nothing to Undo")
         else:
             self.app.enableButton("ME_Button_Undo")
             self.app.setButtonTooltip("ME_Button_Undo", "Undo: " + self._undo_redo.get_undo_text())
 
-        if len(self._redo_actions) < 1:
+        if not self._undo_redo.can_redo():
             self.app.disableButton("ME_Button_Redo")
             self.app.setButtonTooltip("ME_Button_Redo", "Nothing to Redo")
         else:
@@ -3162,19 +3526,11 @@ class MapEditor:
         """
         Exactly what you would expect.
         """
-        first = 0
-        last = 64 * 64
-        canvas_index = 0
-
-        if self.is_dungeon():
-            # Each dungeon level is 256 bytes long
-            first = 256 * self.dungeon_level
-            last = first + 256
+        self._dirty_tiles.clear()
+        if self.map_photo is None:
+            return
 
-        for i in range(first, last):
-            tile_id = self.map[i]
-            self.canvas_map.itemconfig(self.canvas_map_images[canvas_index], image=self.tiles[tile_id])
-            canvas_index = canvas_index + 1
+        self.map_photo.paste(self._render_map_image(*self._view))
 
     # ------------------------------------------------------------------------------------------------------------------
 
@@ -3509,12 +3865,33 @@ class MapEditor:
         int
             Index of the NPC at these coordinates (from this map's NPC data table), or -1 if none
         """
-        for i in range(0, len(self.npc_data)):
-            entry = self.npc_data[i]
-            if entry.starting_x == npc_x and entry.starting_y == npc_y:
-                return i
+        return self._npc_grid.find(npc_x, npc_y)
 
-        return -1  # Not found
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def find_entrance(self, x: int, y: int) -> int:
+        """
+        Finds the entrance at the given map coordinates
+
+        Returns
+        -------
+        int
+            Index of the entrance at these coordinates (from this map's list of entrances), or -1 if none
+        """
+        return self._entrance_grid.find(x, y)
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def find_moongate(self, x: int, y: int) -> int:
+        """
+        Finds the Moongate at the given map coordinates
+
+        Returns
+        -------
+        int
+            Index of the Moongate at these coordinates (8 = Dawn), or -1 if none
+        """
+        return self._moongate_grid.find(x, y)
 
     # ------------------------------------------------------------------------------------------------------------------
 
@@ -3538,10 +3915,12 @@ class MapEditor:
         # Create a default NPC
         npc = NPCData(0, 0, 0, 0)
         self.npc_data.append(npc)
+        self._npc_grid.add(npc_index, npc.starting_x, npc.starting_y)
 
         # Add an image for this NPC onto the map canvas
         self.canvas_map.itemconfigure(self.canvas_npc_images[npc_index], state="normal")
-        self.canvas_map.coords(self.canvas_npc_images[npc_index], (npc.starting_x << 4) + 8, (npc.starting_y << 4) + 8)
+        self.canvas_map.coords(self.canvas_npc_images[npc_index], *self._canvas_position(npc.starting_x,
+                                                                                         npc.starting_y))
 
         # Update widgets
         npc_list = self.app.getOptionBoxWidget("NPCE_Option_NPC_List").options
@@ -3569,11 +3948,13 @@ class MapEditor:
         if npc_index < 0:
             npc_index = self.npc_index
 
-        self.npc_data[npc_index].starting_x = x
-        self.npc_data[npc_index].starting_y = y
+        npc = self.npc_data[npc_index]
+        self._npc_grid.move(npc_index, npc.starting_x, npc.starting_y, x, y)
+        npc.starting_x = x
+        npc.starting_y = y
 
         # Move the NPC image on the map
-        self.canvas_map.coords(self.canvas_npc_images[npc_index], (x << 4) + 8, (y << 4) + 8)
+        self.canvas_map.coords(self.canvas_npc_images[npc_index], *self._canvas_position(x, y))
 
         # Update the label showing the position
         self.app.setLabel("NPCE_Starting_Position", f"Starting Pos: {x}, {y}")
@@ -3751,11 +4132,15 @@ class MapEditor:
             self.warning(f"Invalid Moongate index: {moongate_index}.")
             return
 
+        position = self.moongates[moongate_index]
+        self._moongate_grid.move(moongate_index, position.x, position.y,
+                                 new_x if new_x > -1 else position.x, new_y if new_y > -1 else position.y)
+
         if new_x > -1:
-            self.moongates[moongate_index].x = new_x
+            position.x = new_x
 
         if new_y > -1:
-            self.moongates[moongate_index].y = new_y
+            position.y = new_y
 
         if new_replacement_tile > -1:
             self.moongate_replacements[moongate_index] = new_replacement_tile & 0xF
@@ -3774,7 +4159,7 @@ class MapEditor:
 
             else:
                 # Moongate moved, update icon coordinates
-                self.canvas_map.coords(icon, (position.x << 4) + 8, (position.y << 4) + 8)
+                self.canvas_map.coords(icon, *self._canvas_position(position.x, position.y))
                 self.canvas_map.itemconfigure(icon, state="normal")
 
             # Update the item in the list box
@@ -3813,11 +4198,13 @@ class MapEditor:
             self.app.errorBox("Edit Entrance", f"Could not change entrance #{entrance_index}: index out of range.")
             return
 
-        self.entrances[entrance_index].x = new_x
-        self.entrances[entrance_index].y = new_y
+        entrance = self.entrances[entrance_index]
+        self._entrance_grid.move(entrance_index, entrance.x, entrance.y, new_x, new_y)
+        entrance.x = new_x
+        entrance.y = new_y
 
         # Move the entrance icon on the map
-        self.canvas_map.coords(self.canvas_icon_entrances[entrance_index], (new_x << 4) + 8, (new_y << 4) + 8)
+        self.canvas_map.coords(self.canvas_icon_entrances[entrance_index], *self._canvas_position(new_x, new_y))
 
         # Hide or un-hide the icon as needed after moving it
         if new_x > 63 or new_y > 63:
@@ -3967,13 +4354,8 @@ class MapEditor:
         # Transform x, y and level values to an offset in the map data
         offset = x + (y * 16) + (self.dungeon_level * 256)
 
-        # Loop through map data counting the fountains until we reach the current offset
-        count = -1
-        for i in range(0, offset):
-            if self.map[i] == 0x07:
-                count = count + 1
-
-        return count + 1
+        # Count the fountains found before the current offset
+        return self.map.count(0x07, 0, offset)
 
     # ------------------------------------------------------------------------------------------------------------------
 
@@ -3996,13 +4378,8 @@ class MapEditor:
         # Transform x, y and level values to an offset in the map data
         offset = x + (y * 16) + (self.dungeon_level * 256)
 
-        # Loop through map data counting the fountains until we reach the current offset
-        count = -1
-        for i in range(0, offset):
-            if self.map[i] == 0x06:
-                count = count + 1
-
-        return count + 1
+        # Count the marks found before the current offset
+        return self.map.count(0x06, 0, offset)
 
     # ------------------------------------------------------------------------------------------------------------------
 
@@ -4188,56 +4565,211 @@ class MapEditor:
 
     # ------------------------------------------------------------------------------------------------------------------
 
-    def save_map(self, sync_npc_sprites: bool = True) -> bool:
+    def map_area_bounds(self, bank: int) -> Tuple[int, int]:
         """
-        Saves changes to the currently loaded map.
-        This will recreate the map data table and re-organise the data in the bank where this map is stored.
-
         Parameters
         ----------
-        sync_npc_sprites: bool
-            If True, also update the colours used for NPC sprites in battle scenes to be the same used on the map
+        bank: int
+            ROM bank number
 
         Returns
         -------
-        bool
-            True if changes were successfully saved, False otherwise
+        Tuple[int, int]
+            The first address available for map data, and the first address of the NPC tables in that bank
         """
-        self.info("Saving map changes...")
-
-        # Create a new map table
-        new_table: List[MapTableEntry] = []
-
-        # For convenience, store the current map's entry in a local variable
-        current_map = self.map_table[self.map_index]
-
-        # Create a helper list
-        processed_maps: List[MapEditor.ProcessedEntry] = []
-        processed_npcs: List[MapEditor.ProcessedEntry] = []
-
-        # The first available address will depend on bank number and then size/address of the previous one
         first_map_address = 0x8000
         first_npc_address = 0xB800
 
-        if self.bank_compression[current_map.bank] == "LZSS":
+        if self.bank_compression[bank] == "LZSS":
             first_map_address = 0x8140
             first_npc_address = 0xB100
-        elif self.bank_compression[current_map.bank] == "RLE":
+        elif self.bank_compression[bank] == "RLE":
             first_map_address = 0x8050
             first_npc_address = 0xBB00
 
         else:
             # The vanilla game stores maps at the beginning of the bank, except for bank 6
-            if current_map.bank == 2:
+            if bank == 2:
                 first_map_address = 0x8000
                 first_npc_address = 0xBB00
-            elif current_map.bank == 6:
+            elif bank == 6:
                 first_map_address = 0x9000
                 first_npc_address = 0x9800
 
+        return first_map_address, first_npc_address
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def _get_map_blob(self, bank: int, address: int) -> MapBlob:
+        """
+        Retrieves map data as it is stored in ROM, from the cache if possible
+
+        Parameters
+        ----------
+        bank: int
+            ROM bank number
+        address: int
+            Address of the map data
+
+        Returns
+        -------
+        MapBlob
+            The (compressed) map data
+        """
+        blob = self._map_blobs.get((bank, address), None)
+
+        # Make sure the cached data is still there, as the ROM could have been modified elsewhere
+        if blob is not None and self.rom.read_view(bank, address, len(blob.data)) == blob.data:
+            return blob
+
+        map_data, size = self._read_map_data(bank, address, self.bank_compression[bank])
+        blob = MapBlob(data=self.rom.read_bytes(bank, address, size), size=len(map_data))
+        self._map_blobs[(bank, address)] = blob
+
+        return blob
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def _encode_current_map(self) -> bytes:
+        """
+        Packs and compresses the currently loaded map
+
+        Returns
+        -------
+        bytes
+            The map data in the format used in ROM
+        """
+        current_map = self.map_table[self.map_index]
+
+        if current_map.flags & 0x80 != 0:
+            map_data = bytearray(self.map)
+        else:
+            # Use 4-bit packing for non-dungeon maps
+            map_data = self._pack_tiles(self.map)
+
+        compression = self.bank_compression[current_map.bank] if 0 <= current_map.bank <= 0xF else "none"
+        if compression == "LZSS" or compression == "RLE":
+            optimal = self.settings.get("optimal compression")
+            map_data, saved = self._compress_map(map_data, compression, optimal)
+            if optimal:
+                self.info(f"Map data: {len(map_data)} bytes, {saved} saved by optimal compression.")
+
+        return bytes(map_data)
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def _save_map_data(self) -> bool:
+        """
+        Stores the current map's data and NPC table without moving other maps in the same bank.
+        The map is re-written in place if it still fits, otherwise it is moved to the smallest free block
+        that can contain it.
+
+        Returns
+        -------
+        bool
+            True if successful, False if the bank needs to be re-organised (e.g. not enough contiguous free space)
+        """
+        current_map = self.map_table[self.map_index]
+        bank = current_map.bank
+        old_address = current_map.data_pointer
+        is_dungeon = current_map.flags & 0x80 != 0
+
+        if not 0 <= bank <= 0xE:
+            return False
+
+        first_map_address, first_npc_address = self.map_area_bounds(bank)
+        if not first_map_address <= old_address < first_npc_address:
+            return False
+        if not is_dungeon and not first_npc_address <= current_map.npc_pointer <= 0xBF00:
+            return False
+
+        map_data = self._encode_current_map()
+        old_size = len(self._get_map_blob(bank, old_address).data)
+
+        # Mark the space used by all the other maps in this bank
+        map_area = f"maps {bank:X}"
+        self.rom.allocator.define_area(map_area, bank, [(first_map_address, first_npc_address)])
+        reserved = {old_address}
+        for entry in self.map_table:
+            if (entry.bank == bank and entry.data_pointer not in reserved and
+                    first_map_address <= entry.data_pointer < first_npc_address):
+                # Other entries can share the same data, only reserve it once
+                reserved.add(entry.data_pointer)
+                size = len(self._get_map_blob(bank, entry.data_pointer).data)
+                if not self.rom.allocator.reserve(map_area, entry.data_pointer, size):
+                    # Overlapping or out of bounds data: the new map could end up on top of it
+                    self.info(f"Map data at {bank:X}:{entry.data_pointer:04X} ({size} bytes) overlaps other data "
+                              f"or exceeds the map area.")
+                    return False
+
+        if len(map_data) <= old_size and self.rom.allocator.reserve(map_area, old_address, len(map_data)):
+            new_address = old_address
+        else:
+            new_address = self.rom.allocator.allocate(map_area, len(map_data))
+            if new_address < 0:
+                return False
+            self.info(f"Moving map data from {bank:X}:{old_address:04X} to {bank:X}:{new_address:04X}.")
+
+        self.rom.write_bytes(bank, new_address, map_data)
+        self._map_blobs.pop((bank, old_address), None)
+        self._map_blobs[(bank, new_address)] = MapBlob(data=map_data, size=2048)
+
+        # Other entries can share the same data
+        if new_address != old_address:
+            for entry in self.map_table:
+                if entry.bank == bank and entry.data_pointer == old_address:
+                    entry.data_pointer = new_address
+            self.save_map_tables()
+
+        # NPC tables have a fixed size, so they can always be stored in place
+        if not is_dungeon:
+            npc_data = bytearray()
+            for npc in self.npc_data:
+                npc_data.append(npc.sprite_id)
+                npc_data.append(npc.dialogue_id)
+                npc_data.append(npc.starting_x)
+                npc_data.append(npc.starting_y)
+
+            # We need to fill any empty space with 0xFF
+            npc_data = npc_data + bytearray([0xFF] * (256 - len(npc_data)))
+            self.rom.write_bytes(bank, current_map.npc_pointer, npc_data)
+
+        self.info(f"Map data memory: {self.rom.allocator.fragmentation(map_area)}.")
+
+        return True
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def _repack_map_bank(self) -> bool:
+        """
+        Re-allocates all the map data and NPC tables in the current map's bank, starting from the first
+        available address, and rebuilds the map table.
+
+        Returns
+        -------
+        bool
+            True if successful, False if the data could not fit in the bank
+        """
+        # Create a new map table
+        new_table: List[MapTableEntry] = []
+
+        # For convenience, store the current map's entry in a local variable
+        current_map = self.map_table[self.map_index]
+
+        # The first available address will depend on bank number and then size/address of the previous one
+        first_map_address, first_npc_address = self.map_area_bounds(current_map.bank)
+
+        # Create a helper list
+        processed_maps: List[MapEditor.ProcessedEntry] = []
+        processed_npcs: List[MapEditor.ProcessedEntry] = []
+
+        # Map data will be re-allocated from the start of its area, up to the NPC tables
+        map_area = f"maps {current_map.bank:X}"
+        self.rom.allocator.define_area(map_area, current_map.bank, [(first_map_address, first_npc_address)])
+
         # Since we will be reading map and NPC data from ROM, we can't at the same time write to it
         # So, we'll store maps and NPC data in a buffer
-        map_buffer: List[bytearray] = []
+        map_buffer: List[bytes] = []
         npc_buffer: List[bytearray] = []
 
         # Go through the current map data table
@@ -4272,59 +4804,47 @@ class MapEditor:
                         entry.npc_pointer = processed.new_address
                         npc_done = True
 
-                # If we found no matches, re-compress the map and store it again
-                map_data = bytearray()
+                # If we found no matches, store the map data again
+                map_data = bytes()
                 if data_done is False:
 
                     # If this was the current map's address, use the loaded map data
                     if entry.data_pointer == current_map.data_pointer:
+                        map_data = self._encode_current_map()
 
-                        if entry.flags & 0x80 != 0:
-                            map_data = bytearray(self.map)
-                        else:
-                            # Use 4-bit packing for non-dungeon maps
-                            for i in range(0, 64 * 64, 2):
-                                left = self.map[i]
-                                right = self.map[i + 1]
-                                map_data.append((left << 4) | (right & 0x0F))
-
-                    # Otherwise read it from ROM, un-compress and re-compress
+                    # Otherwise copy it as it is stored in ROM: there is no need to decompress and re-compress it
                     else:
                         # Ignore values out of bound
                         if 0 <= entry.bank <= 0xE:
-                            # Load raw bytes
+                            map_data = self._get_map_blob(entry.bank, entry.data_pointer).data
                             log(4, f"{self.__class__.__name__}",
-                                f"Re-allocating map from {entry.bank:X}:{entry.data_pointer:04X}...")
-                            map_data = self.rom.read_bytes(entry.bank, entry.data_pointer, 2048)
-
-                            # Decompress if needed
-                            if self.bank_compression[entry.bank] == "LZSS":
-                                map_data = lzss.decode(map_data)
-                                # We don't have an "end of data" marker, so just discard anything over 2 KB
-                                map_data = map_data[0:2048]
-                            elif self.bank_compression[entry.bank] == "RLE":
-                                map_data = rle.decode(map_data)
+                                f"Re-allocating map from {entry.bank:X}:{entry.data_pointer:04X} "
+                                f"({len(map_data)} bytes)...")
 
                         else:
                             map_data = None
 
-                    # Store this data at the first available address
+                    # Store this data in the smallest free block that can contain it
                     if map_data is not None:
 
-                        # Re-compress if needed
-                        if self.bank_compression[entry.bank] == "LZSS":
-                            map_data = lzss.encode(map_data).tobytes(order="A")
-                        elif self.bank_compression[entry.bank] == "RLE":
-                            map_data = rle.encode(map_data)
+                        new_address = self.rom.allocator.allocate(map_area, len(map_data))
+                        if new_address < 0:
+                            message = (f"Not enough space for map data in bank {current_map.bank:X}.\n"
+                                       f"{self.rom.allocator.fragmentation(map_area)}.")
+                            if self.app is None:
+                                self.error(message)
+                            else:
+                                self.app.errorBox("Save Map", f"ERROR: {message}", parent="Map_Editor")
+                            # Nothing has been written yet, restore the old table and abort
+                            self.read_map_tables()
+                            return False
 
                         # Add this entry to the processed maps list
                         processed_maps.append(MapEditor.ProcessedEntry(old_address=entry.data_pointer,
-                                                                       new_address=first_map_address))
+                                                                       new_address=new_address))
 
                         # Update pointer for this entry
-                        entry.data_pointer = first_map_address
-                        # Advance data pointer
-                        first_map_address = first_map_address + len(map_data)
+                        entry.data_pointer = new_address
 
                 # Check if we also need to re-write the NPC table
                 npc_data = bytearray()
@@ -4358,12 +4878,12 @@ class MapEditor:
                 # Ready to store the modified entry
                 new_table.append(entry)
                 # Save data
-                # TODO Check that it does not extend over the reserved area in ROM
                 npc_buffer.append(npc_data)
                 # Save compressed data
-                # TODO Check here that it does not go over the allowed area in ROM
                 map_buffer.append(map_data)
 
+        self.info(f"Map data memory: {self.rom.allocator.fragmentation(map_area)}.")
+
         # Store the new table in ROM
         address = 0xFEA0
         i = 0  # This will be the index for entries that are on the current bank
@@ -4384,6 +4904,7 @@ class MapEditor:
             if m.bank == current_map.bank:
                 if len(map_buffer[i]) > 0 and 0x8000 < m.data_pointer < 0xC000:
                     self.rom.write_bytes(m.bank, m.data_pointer, map_buffer[i])
+                    self._map_blobs[(m.bank, m.data_pointer)] = MapBlob(data=bytes(map_buffer[i]), size=2048)
                 if len(npc_buffer[i]) > 0 and 0x8000 < m.npc_pointer < 0xC000:
                     self.rom.write_bytes(m.bank, m.npc_pointer, npc_buffer[i])
                 i = i + 1
@@ -4391,6 +4912,50 @@ class MapEditor:
         # Update the currently cached table
         self.map_table = new_table
 
+        return True
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def store_map_data(self) -> bool:
+        """
+        Writes the current map's data and NPC table to ROM, in place if possible, otherwise re-allocating all the maps
+        in its bank. Does not touch any other data (entrances, dungeon messages, colours, etc.).
+
+        Returns
+        -------
+        bool
+            True if successful, False if the data could not fit in the bank
+        """
+        # Try to only store the edited map, without touching the rest of the bank
+        if self._save_map_data():
+            return True
+
+        self.info(f"Re-allocating all maps in bank {self.map_table[self.map_index].bank:X}...")
+        return self._repack_map_bank()
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def save_map(self, sync_npc_sprites: bool = True) -> bool:
+        """
+        Saves changes to the currently loaded map.
+        Only the edited map is re-encoded and written, in place if it still fits. If there is not enough free space
+        for it, the map data table is recreated and the data in the bank where this map is stored re-organised.
+
+        Parameters
+        ----------
+        sync_npc_sprites: bool
+            If True, also update the colours used for NPC sprites in battle scenes to be the same used on the map
+
+        Returns
+        -------
+        bool
+            True if changes were successfully saved, False otherwise
+        """
+        self.info("Saving map changes...")
+
+        if not self.store_map_data():
+            return False
+
         # If we were editing a dungeon map, also reallocate and save messages, marks and fountains
         if self.is_dungeon():
             self.info("Saving dungeon data...")
@@ -4422,14 +4987,11 @@ class MapEditor:
             fountains_address = self.rom.read_word(0xD, base_mark_pointer + 2)
 
             # We allocate two separate areas for uncompressed text, to make room for more data
-            messages_0 = 0xB635
-            messages_0_end = 0xB917
             # The second area is only available in v1.09+
-            messages_1 = 0
-            messages_1_end = 0
+            message_areas = [(0xB635, 0xB917)]
             if base_message_pointer != 0xAAF6:
-                messages_1 = 0xAAF6
-                messages_1_end = 0xAB65
+                message_areas.append((0xAAF6, 0xAB65))
+            self.rom.allocator.define_area("dungeon messages", 0xD, message_areas)
 
             for d in range(0, len(self.dungeon_data)):
                 # Save marks pointer
@@ -4491,40 +5053,21 @@ class MapEditor:
                             if len(data) < 1 or data[-1] != 0xFF:
                                 data.append(0xFF)
 
-                            # Check if it fits in the first message area
-                            size = len(data)
-                            if messages_0 + size > messages_0_end:
-                                # Won't fit: try the second area if available
-                                if messages_1 > 0x8000:
-                                    if messages_1 + size > messages_1_end:
-                                        log(2, f"{self.__class__.__name__}",
-                                            f"Message '{current_message}' from dungeon #{d} won't fit in ROM!")
-                                        # Show a popup message and ask to continue/abort
-                                        if self.app.yesNoBox("Saving Dungeon Messages",
-                                                             f"ERROR: Message '{current_message}' from dungeon "
-                                                             f"#{d} won't fit in ROM!\nDo you want to continue?",
-                                                             parent="Map_Editor"):
-                                            continue
-                                        else:
-                                            return False
-                                    else:
-                                        # Save area 1 pointer
-                                        self.dungeon_data[d].message_pointers[m] = messages_1
-                                        messages_1 = messages_1 + size
+                            # Find the smallest free block where it fits
+                            address = self.rom.allocator.allocate("dungeon messages", len(data))
+                            if address < 0:
+                                log(2, f"{self.__class__.__name__}",
+                                    f"Message '{current_message}' from dungeon #{d} won't fit in ROM!")
+                                # Show a popup message and ask to continue/abort
+                                if self.app.yesNoBox("Saving Dungeon Messages",
+                                                     f"ERROR: Message '{current_message}' from dungeon "
+                                                     f"#{d} won't fit in ROM!\nDo you want to continue?",
+                                                     parent="Map_Editor"):
+                                    continue
                                 else:
-                                    log(2, f"{self.__class__.__name__}",
-                                        f"Message '{current_message}' from dungeon #{d} won't fit in ROM!")
-                                    if self.app.yesNoBox("Saving Dungeon Messages",
-                                                         f"ERROR: Message '{current_message}' from dungeon "
-                                                         f"#{d} won't fit in ROM!\nDo you want to continue?",
-                                                         parent="Map_Editor"):
-                                        continue
-                                    else:
-                                        return False
-                            else:
-                                # Save area 0 pointer
-                                self.dungeon_data[d].message_pointers[m] = messages_0
-                                messages_0 = messages_0 + size
+                                    return False
+
+                            self.dungeon_data[d].message_pointers[m] = address
 
                             # Save text
                             self.rom.write_bytes(0xD, self.dungeon_data[d].message_pointers[m], data)
@@ -4533,6 +5076,8 @@ class MapEditor:
                         address = base_message_pointer + (2 * m) + (16 * d)
                         self.rom.write_word(0xD, address, self.dungeon_data[d].message_pointers[m])
 
+            self.info(f"Dungeon message memory: {self.rom.allocator.fragmentation('dungeon messages')}.")
+
             # Custom dungeon colours only if the ROM supports them
             if self.rom.has_feature("custom map colours"):
                 self.info("Saving custom map colours...")
@@ -4675,6 +5220,24 @@ class MapEditor:
 
     # ------------------------------------------------------------------------------------------------------------------
 
+    def _highlight_list_item(self, widget: str, index: int) -> None:
+        """
+        Marks an item in one of the Entrance Editor lists as selected, by changing its background.
+        The native selection can't be used, as it is lost when clicking outside the list.
+
+        Parameters
+        ----------
+        widget: str
+            Name of the ListBox widget
+        index: int
+            Position of the item to highlight; all the other items will be shown as not selected
+        """
+        items: list = self.app.getAllListItems(widget)
+        for pos in range(len(items)):
+            self.app.setListItemAtPosBg(widget, pos, "#DFDFDF" if pos == index else "#FFFFFF")
+
+    # ------------------------------------------------------------------------------------------------------------------
+
     def entrance_input(self, widget: str) -> None:
         """
         Callback function for presses/changes on widgets in the Entrance Editor sub-sub-window
@@ -4684,10 +5247,6 @@ class MapEditor:
         widget: str
             Name of the widget that generated the event
         """
-
-        _SELECTED = "#DFDFDF"
-        _UNSELECTED = "#FFFFFF"
-
         # Click on Entrance Move Button
         if widget == "EE_Button_Entrance_Set":
             if self.selected_entrance > -1:
@@ -4710,14 +5269,8 @@ class MapEditor:
                     self.jump_to(point.x, point.y)
 
                 else:
-                    # We change the background of the item as it will be deselected when clicking outside the list
-                    items: list = self.app.getAllListItems(widget)
-                    for pos in range(len(items)):
-                        if pos == value[0]:
-                            self.app.setListItemAtPosBg(widget, pos, _SELECTED)
-                            self.selected_entrance = pos
-                        else:
-                            self.app.setListItemAtPosBg(widget, pos, _UNSELECTED)
+                    self._highlight_list_item(widget, value[0])
+                    self.selected_entrance = value[0]
 
                     # Update the widgets to show info about this entrance
                     self.entrance_info(value[0])
@@ -4759,14 +5312,9 @@ class MapEditor:
                     self.jump_to(point.x, point.y)
 
                 else:
-                    items: list = self.app.getAllListItems(widget)
-                    for pos in range(len(items)):
-                        if pos == value[0]:
-                            self.app.setListItemAtPosBg(widget, pos, _SELECTED)
-                            self.selected_moongate = pos
-                            self.moongate_info(pos)
-                        else:
-                            self.app.setListItemAtPosBg(widget, pos, _UNSELECTED)
+                    self._highlight_list_item(widget, value[0])
+                    self.selected_moongate = value[0]
+                    self.moongate_info(value[0])
 
         # Mouse click on move Moongate button
         elif widget == "EE_Button_Moongate_Set":
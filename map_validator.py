@@ -0,0 +1,371 @@
+__author__ = "Fox Cunning"
+
+from concurrent.futures import Executor
+from dataclasses import dataclass, field, replace
+from typing import Dict, List, Optional, Tuple
+
+import lzss
+import rle
+from map_editor import MapEditor
+from rom import ROM
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+
+@dataclass(init=True, repr=False)
+class MapCheck:
+    """
+    Results of the validation of a single entry of the map table
+
+    Attributes
+    ----------
+    compressed_size: int
+        Bytes occupied in ROM by this map's data
+    decoded_size: int
+        Bytes produced by decoding the data: anything other than 2048 means the data is invalid
+    npc_count: int
+        Number of entries in this map's NPC table
+    """
+    index: int = 0
+    bank: int = 0
+    address: int = 0
+    npc_pointer: int = 0
+    dungeon: bool = False
+    compressed_size: int = 0
+    decoded_size: int = 0
+    npc_count: int = 0
+    problems: List[str] = field(default_factory=list)
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def __repr__(self) -> str:
+        return (f"Map 0x{self.index:02X} @{self.bank:X}:{self.address:04X}: {self.compressed_size} -> "
+                f"{self.decoded_size} bytes, {'dungeon' if self.dungeon else f'{self.npc_count} NPC(s)'}")
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+
+@dataclass(init=True, repr=False)
+class BankCheck:
+    """
+    Map data usage for a ROM bank
+
+    Attributes
+    ----------
+    map_area: Tuple[int, int]
+        Range of addresses reserved for map data, as (start, end) with end exclusive
+    used: int
+        Bytes used by map data within that area
+    npc_tables: int
+        Number of distinct NPC tables stored in this bank
+    """
+    bank: int = 0
+    compression: str = "none"
+    map_area: Tuple[int, int] = (0x8000, 0x8000)
+    used: int = 0
+    npc_tables: int = 0
+    problems: List[str] = field(default_factory=list)
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    @property
+    def free(self) -> int:
+        return max(0, self.map_area[1] - self.map_area[0] - self.used)
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def __repr__(self) -> str:
+        return (f"Bank {self.bank:X} ({self.compression}): {self.used}/{self.map_area[1] - self.map_area[0]} bytes "
+                f"used by maps, {self.free} free, {self.npc_tables} NPC table(s)")
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+
+@dataclass(init=True, repr=False)
+class ValidationReport:
+    """
+    Results of the validation of all the maps in a ROM
+    """
+    maps: List[MapCheck] = field(default_factory=list)
+    banks: List[BankCheck] = field(default_factory=list)
+    # Problems that don't belong to a single map or bank (e.g. entrances and Moongates)
+    problems: List[str] = field(default_factory=list)
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def all_problems(self) -> List[str]:
+        """
+        Returns
+        -------
+        List[str]
+            A description of every problem found, starting with those affecting single maps
+        """
+        problems = [f"Map 0x{check.index:02X}: {problem}" for check in self.maps for problem in check.problems]
+        problems.extend([f"Bank {check.bank:X}: {problem}" for check in self.banks for problem in check.problems])
+        problems.extend(self.problems)
+        return problems
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def __repr__(self) -> str:
+        lines = [f"{check}" for check in self.maps] + [f"{check}" for check in self.banks]
+        problems = self.all_problems()
+        lines.append(f"{len(problems)} problem(s) found.")
+        return "\n".join(lines + problems)
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+
+def _find_overlaps(blocks: Dict[int, int]) -> List[Tuple[int, int]]:
+    """
+    Parameters
+    ----------
+    blocks: Dict[int, int]
+        Size of each block, indexed by start address
+
+    Returns
+    -------
+    List[Tuple[int, int]]
+        Start addresses of each pair of overlapping blocks
+    """
+    overlaps = []
+    # Sorted by address, keeping track of the block that extends the furthest
+    furthest = -1
+    for address in sorted(blocks):
+        if furthest >= 0 and furthest + blocks[furthest] > address:
+            overlaps.append((furthest, address))
+        if furthest < 0 or address + blocks[address] > furthest + blocks[furthest]:
+            furthest = address
+    return overlaps
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+
+def check_bank(bank: int, compression: str, data: bytes, map_area: Tuple[int, int],
+               entries: List[MapCheck]) -> Tuple[List[MapCheck], BankCheck]:
+    """
+    Decodes all the maps and NPC tables stored in a bank.
+    This only uses its arguments, so that it can run in a separate process.
+
+    Parameters
+    ----------
+    bank: int
+        ROM bank number
+    compression: str
+        Compression used for maps in this bank: "none", "LZSS" or "RLE"
+    data: bytes
+        Contents of the bank ($8000-$BFFF)
+    map_area: Tuple[int, int]
+        First address available for map data, and first address of the NPC tables
+    entries: List[MapCheck]
+        One entry for each map stored in this bank, with the problems list still empty
+
+    Returns
+    -------
+    Tuple[List[MapCheck], BankCheck]
+        The same entries with their results filled in, and the results for the bank
+    """
+    first_map_address, first_npc_address = map_area
+    report = BankCheck(bank=bank, compression=compression, map_area=map_area, problems=[])
+
+    # Size of each block of data, indexed by address
+    map_blocks: Dict[int, int] = {}
+    npc_blocks: Dict[int, int] = {}
+
+    view = memoryview(data)
+
+    for entry in entries:
+        if not 0x8000 <= entry.address <= 0xBFFF:
+            entry.problems.append(f"map data pointer ${entry.address:04X} out of range")
+            continue
+
+        if not first_map_address <= entry.address < first_npc_address:
+            entry.problems.append(f"map data at ${entry.address:04X} is outside the map area "
+                                  f"${first_map_address:04X}-${first_npc_address - 1:04X}")
+
+        stream = view[entry.address - 0x8000:]
+        if compression == "LZSS":
+            decoded, entry.compressed_size = lzss.decode_stream(stream, 2048)
+            entry.decoded_size = len(decoded)
+        elif compression == "RLE":
+            decoded, entry.compressed_size = rle.decode_stream(stream, 2048)
+            entry.decoded_size = len(decoded)
+        else:
+            entry.compressed_size = min(2048, len(stream))
+            entry.decoded_size = entry.compressed_size
+
+        if entry.decoded_size != 2048:
+            entry.problems.append(f"map data decodes to {entry.decoded_size} bytes instead of 2048")
+
+        end = entry.address + entry.compressed_size
+        if entry.address < first_npc_address < end:
+            entry.problems.append(f"map data extends into the NPC tables (${end - 1:04X})")
+
+        map_blocks[entry.address] = max(map_blocks.get(entry.address, 0), entry.compressed_size)
+
+        # Dungeons don't have an NPC table: the "pointer" is used as the starting facing direction
+        if entry.dungeon:
+            continue
+
+        if not first_npc_address <= entry.npc_pointer <= 0xBF00:
+            entry.problems.append(f"NPC table pointer ${entry.npc_pointer:04X} out of range")
+            continue
+
+        npc_blocks[entry.npc_pointer] = 256
+        offset = entry.npc_pointer - 0x8000
+        for npc in range(32):
+            sprite_id, _, x, y = data[offset:offset + 4]
+            if sprite_id == 0xFF:
+                break
+            if x > 63 or y > 63:
+                entry.problems.append(f"NPC #{npc} starting position ({x}, {y}) out of the map")
+            offset = offset + 4
+            entry.npc_count = entry.npc_count + 1
+
+    for first, second in _find_overlaps(map_blocks):
+        report.problems.append(f"map data at ${first:04X} and ${second:04X} overlap")
+    for first, second in _find_overlaps(npc_blocks):
+        report.problems.append(f"NPC tables at ${first:04X} and ${second:04X} overlap")
+
+    # Count the bytes in use inside the map area, merging overlapping blocks so they are not counted twice
+    position = first_map_address
+    for address in sorted(map_blocks):
+        start = max(address, position)
+        end = min(address + map_blocks[address], first_npc_address)
+        if end > start:
+            report.used = report.used + (end - start)
+            position = end
+
+    report.npc_tables = len(npc_blocks)
+
+    return entries, report
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+
+class MapValidator:
+    """
+    Checks that all the maps, dungeons, NPC tables, entrances and Moongates in a ROM can be decoded, and reports how
+    much space is left for map data in each bank.
+
+    All the data needed is copied when this is created, so that the validation itself can run in a separate thread
+    or process without accessing the ROM, e.g.:
+        report = MapValidator(rom, map_editor).run(ProcessPoolExecutor())
+    """
+
+    def __init__(self, rom: ROM, map_editor: MapEditor):
+        self._maps: List[MapCheck] = []
+        # Parameters for check_bank(), indexed by bank number
+        self._banks: Dict[int, Tuple[str, bytes, Tuple[int, int]]] = {}
+
+        for index in range(map_editor.max_maps()):
+            entry = map_editor.map_table[index]
+            self._maps.append(MapCheck(index=index, bank=entry.bank, address=entry.data_pointer,
+                                       npc_pointer=entry.npc_pointer, dungeon=map_editor.is_dungeon(index),
+                                       problems=[]))
+
+            if 0 <= entry.bank <= 0xE and entry.bank not in self._banks:
+                self._banks[entry.bank] = (map_editor.bank_compression[entry.bank],
+                                           bytes(rom.read_bytes(entry.bank, 0x8000, 0x4000)),
+                                           map_editor.map_area_bounds(entry.bank))
+
+        # Entrance coordinates from each continent, and how many there are in each table
+        address = rom.read_word(0xF, 0xC430)
+        self._entrances: List[Tuple[str, int, bytes]] = [("Sosaria", address, self._read_table(rom, address, 21))]
+        address = rom.read_word(0xF, 0xC46B)
+        self._entrances.append(("Ambrosia", address,
+                                self._read_table(rom, address, 7 if address == 0xC489 else 11)))
+
+        # Coordinates of the 8 Moongates, followed by Dawn's
+        self._moongates: bytes = bytes(rom.read_bytes(0xF, 0xC4D2, 16) +
+                                       bytearray([rom.read_byte(0xB, 0xB212), rom.read_byte(0xB, 0xB216)]))
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    @staticmethod
+    def _read_table(rom: ROM, address: int, count: int) -> Optional[bytes]:
+        """
+        Reads a table of (x, y) coordinates from bank $0F, or returns None if its address is invalid
+        """
+        if not 0xC000 <= address <= 0xFFFF - (count * 2):
+            return None
+        return bytes(rom.read_bytes(0xF, address, count * 2))
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def run(self, executor: Optional[Executor] = None) -> ValidationReport:
+        """
+        Performs the validation
+
+        Parameters
+        ----------
+        executor: Optional[Executor]
+            If provided, each bank is processed as a separate job by this executor (e.g. a ProcessPoolExecutor),
+            otherwise everything is done in the calling thread
+
+        Returns
+        -------
+        ValidationReport
+            The results of all the checks
+        """
+        report = ValidationReport(maps=[], banks=[], problems=[])
+
+        # Start from clean copies, so that this can be run more than once
+        checks = [replace(check, problems=[]) for check in self._maps]
+
+        jobs = []
+        for bank, (compression, data, map_area) in sorted(self._banks.items()):
+            entries = [check for check in checks if check.bank == bank]
+            if executor is None:
+                jobs.append(check_bank(bank, compression, data, map_area, entries))
+            else:
+                jobs.append(executor.submit(check_bank, bank, compression, data, map_area, entries))
+
+        for job in jobs:
+            maps, bank = job if executor is None else job.result()
+            report.maps.extend(maps)
+            report.banks.append(bank)
+
+        # Maps without a valid bank are shown as empty maps in the editor
+        for check in checks:
+            if not 0 <= check.bank <= 0xE:
+                check.problems.append(f"bank number 0x{check.bank:02X} out of range: this map will be empty")
+                report.maps.append(check)
+
+        report.maps.sort(key=lambda c: c.index)
+
+        self._check_entrances(report)
+        self._check_moongates(report)
+
+        return report
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def _check_entrances(self, report: ValidationReport) -> None:
+        for continent, address, table in self._entrances:
+            if table is None:
+                report.problems.append(f"Entrances from {continent}: table address ${address:04X} out of range")
+                continue
+
+            # Coordinates outside the map mean that an entrance is not used
+            found: Dict[Tuple[int, int], int] = {}
+            # The first entrance from Sosaria is an entrance to itself, which is ignored
+            for e in range(2 if continent == "Sosaria" else 0, len(table), 2):
+                position = (table[e], table[e + 1])
+                if position[0] > 63 or position[1] > 63:
+                    continue
+                if position in found:
+                    report.problems.append(f"Entrances from {continent}: #{found[position]} and #{e >> 1} are both "
+                                           f"at {position}, only the first one can be used")
+                else:
+                    found[position] = e >> 1
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def _check_moongates(self, report: ValidationReport) -> None:
+        for m in range(0, len(self._moongates), 2):
+            x = self._moongates[m]
+            y = self._moongates[m + 1]
+            if x > 63 or y > 63:
+                name = "Dawn" if m == 16 else f"Moongate #{m >> 1}"
+                report.problems.append(f"{name} coordinates ({x}, {y}) out of the map")
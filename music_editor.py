@@ -19,6 +19,7 @@ from appJar import gui
 from appJar.appjar import ItemLookupError
 from debug import log
 from editor_settings import EditorSettings
+from music_sequencer import FrameClock, MusicSequencer, TrackTimeline
 from rom import ROM
 
 # Note definitions as read from ROM
@@ -36,18 +37,6 @@ _NOTE_NAMES = ["C2 ", "C#2", "D2 ", "D#2", "E2 ", "F2 ", "F#2", "G2 ", "G#2", "A
 # This is to quickly get a duty representation based on the register's value
 _DUTY = ["12.5%", "  25%", "  50%", "  75%"]
 
-# Envelope lookup tables, one per envelope level (0-8) containing each one value per volume level (0-F)
-# This will be a lot quicker than calculating output levels every frame
-_ENV_TABLE = [[0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0],
-              [0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x1, 0x1, 0x1, 0x1, 0x1, 0x1, 0x1, 0x1],
-              [0x0, 0x0, 0x0, 0x0, 0x1, 0x1, 0x1, 0x1, 0x2, 0x2, 0x2, 0x2, 0x3, 0x3, 0x3, 0x3],
-              [0x0, 0x0, 0x0, 0x0, 0x1, 0x1, 0x1, 0x1, 0x3, 0x3, 0x3, 0x3, 0x4, 0x4, 0x4, 0x4],
-              [0x0, 0x0, 0x1, 0x1, 0x2, 0x2, 0x3, 0x3, 0x4, 0x4, 0x5, 0x5, 0x6, 0x6, 0x7, 0x7],
-              [0x0, 0x0, 0x1, 0x1, 0x2, 0x2, 0x3, 0x3, 0x5, 0x5, 0x6, 0x6, 0x7, 0x7, 0x8, 0x8],
-              [0x0, 0x0, 0x1, 0x1, 0x3, 0x3, 0x4, 0x4, 0x6, 0x6, 0x7, 0x7, 0x9, 0x9, 0xA, 0xA],
-              [0x0, 0x0, 0x1, 0x1, 0x3, 0x3, 0x4, 0x4, 0x7, 0x7, 0x8, 0x8, 0xA, 0xA, 0xB, 0xB],
-              [0x0, 0x1, 0x2, 0x3, 0x4, 0x5, 0x6, 0x7, 0x8, 0x9, 0xA, 0xB, 0xC, 0xD, 0xE, 0xF]]
-
 
 # ----------------------------------------------------------------------------------------------------------------------
 
@@ -294,20 +283,16 @@ class MusicEditor:
         self._track_index: int = 0
         self._selected_channel: int = 0
         self._selected_element: int = 0
-        self._track_undo: UndoRedo = UndoRedo()
         # Each action can undo or redo a variable number of tasks, for example if a selection of 4 items are deleted
-        #   4 undo actions will be created, but a single "Undo" must undo all of them at once, so we would add 4
-        #   to this list in that case
-        self._track_undo_count: List[int] = []
-        self._track_redo_count: List[int] = []
+        #   4 undo actions will be created, but a single "Undo" must undo all of them at once, so they are grouped
+        #   together with begin() / commit()
+        self._track_undo: UndoRedo = UndoRedo()
 
         # --- Instrument Editor ---
         self._instruments: List[Instrument] = []
         self._selected_instrument: int = 0
         self._test_channel: int = 1
         self._instrument_undo: UndoRedo = UndoRedo()
-        self._instrument_undo_count: List[int] = []
-        self._instrument_redo_count: List[int] = []
 
         # --- General ---
         self.sound_server = sound_server
@@ -339,6 +324,10 @@ class MusicEditor:
         # Starts from 1 and is decreased each frame. When 0, read next data segment.
         self._track_counter: List[int] = [1, 1, 1, 1]
 
+        # Frame index of the last track played from a seek point, and the data it was created from
+        self._timeline: Optional[TrackTimeline] = None
+        self._timeline_key: Tuple = ()
+
         # Each of the two ROM banks used for music contain two tables of period values for each note
         self._note_period_lo: bytearray = bytearray()
         self._note_period_hi: bytearray = bytearray()
@@ -516,8 +505,6 @@ class MusicEditor:
         self.app.emptySubWindow("Track_Editor")
 
         self._track_undo.clear()
-        self._track_undo_count = []
-        self._track_redo_count = []
 
         self._unsaved_changes_track = False
 
@@ -544,8 +531,6 @@ class MusicEditor:
         self.app.emptySubWindow("Instrument_Editor")
 
         self._instrument_undo.clear()
-        self._instrument_undo_count = []
-        self._instrument_redo_count = []
 
         self._unsaved_changes_instrument = False
 
@@ -1417,6 +1402,10 @@ class MusicEditor:
             # Other banks are not supported
             return False
 
+        # All the track data in this bank is going to be re-allocated
+        memory_area = f"music {self._bank:X}"
+        self.rom.allocator.define_area(memory_area, self._bank, [(start, start + size) for start, size in memory_map])
+
         # Some channels will share the same address between different songs
         # For this reason, we keep track of where has each address been moved to, and keep them in sync
         # (old address, new address, data)
@@ -1530,40 +1519,20 @@ class MusicEditor:
 
                 if not already_processed:
                     # No matches: find the smallest space this would fit into
-                    size = len(buffer)
-                    chunk: int = -1
-                    smallest: int = 65535
-                    for m in range(len(memory_map)):
-                        difference = memory_map[m][1] - size
-                        if difference < 0:
-                            # Won't fit
-                            continue
-                        elif difference == 0:
-                            # Perfect fit, stop here
-                            chunk = m
-                            break
-                        else:
-                            if difference < smallest:
-                                # Best so far, but keep looking
-                                smallest = difference
-                                chunk = m
+                    new_address = self.rom.allocator.allocate(memory_area, len(buffer))
 
-                    if chunk == -1:
+                    if new_address < 0:
                         # This channel won't fit anywhere
                         self.error(f"Channel {c} of track {i} does not fit in ROM.")
                         success = False
                     else:
                         # Save this channel to its new address
-                        new_address = memory_map[chunk][0]
                         if 0xBFF0 >= new_address >= 0x8000:
                             processed.append((channel_address[c], new_address, buffer))
                         channel_address[c] = new_address
 
                         # self.info(f"DEBUG: Allocating track {i} channel {c} to: 0x{new_address:04X}.")
 
-                        # Reduce the chunk size and advance its start address
-                        memory_map[chunk] = (memory_map[chunk][0] + size, memory_map[chunk][1] - size)
-
                 # Channel has been processed: update the pointer table with its new address
                 self.rom.write_word(self._bank, pointer_table + (2 * c) + (8 * i), channel_address[c])
 
@@ -1574,6 +1543,8 @@ class MusicEditor:
                 self.info(f"DEBUG: Saving {len(p[2])} bytes to: ${self._bank:02X}:{p[1]:04X}.")
                 self.rom.write_bytes(self._bank, p[1], p[2])
 
+            self.info(f"Music data memory: {self.rom.allocator.fragmentation(memory_area)}.")
+
         return success
 
     # ------------------------------------------------------------------------------------------------------------------
@@ -1745,14 +1716,14 @@ class MusicEditor:
 
     def _update_undo_buttons(self, editor: int) -> None:
         if editor == 0:  # Track Editor
-            if len(self._track_undo_count) < 1:
+            if not self._track_undo.can_undo():
                 self.app.disableButton("SE_Button_Undo")
                 self.app.setButtonTooltip("SE_Button_Undo", "Nothing to Undo")
             else:
                 self.app.enableButton("SE_Button_Undo")
                 self.app.setButtonTooltip("SE_Button_Undo", "Undo: " + self._track_undo.get_undo_text())
 
-            if len(self._track_redo_count) < 1:
+            if not self._track_undo.can_redo():
                 self.app.disableButton("SE_Button_Redo")
                 self.app.setButtonTooltip("SE_Button_Redo", "Nothing to Redo")
             else:
@@ -2012,13 +1983,11 @@ class MusicEditor:
     # ------------------------------------------------------------------------------------------------------------------
 
     def _undo_track_action(self, _event: any = None) -> None:
-        if len(self._track_undo_count) < 1:
+        if not self._track_undo.can_undo():
             self.app.soundError()
             return
 
-        count = self._track_undo_count.pop()
-        self._track_redo_count.append(count)
-        result = self._track_undo.undo(count)
+        result = self._track_undo.undo()
         # We expect the result to be a channel index
         if len(result) == 1 and result[0] is not None:
             self.track_info(result[0])
@@ -2035,13 +2004,11 @@ class MusicEditor:
     # ------------------------------------------------------------------------------------------------------------------
 
     def _redo_track_action(self, _event: any = None) -> None:
-        if len(self._track_redo_count) < 1:
+        if not self._track_undo.can_redo():
             self.app.soundError()
             return
 
-        count = self._track_redo_count.pop()
-        self._track_undo_count.append(count)
-        result = self._track_undo.redo(count)
+        result = self._track_undo.redo()
 
         if len(result) == 1 and result[0] is not None:
             self.track_info(result[0])
@@ -2201,8 +2168,6 @@ class MusicEditor:
             old_values = element.raw.copy()
             self._track_undo(self._change_element_value, (channel, index, bytearray([value, duration])),
                              (channel, index, old_values), text=f"Modify note (Channel {channel})")
-            self._track_undo_count.append(1)
-            self._track_redo_count = []
 
             # Update UI
             self._update_undo_buttons(0)
@@ -2240,8 +2205,6 @@ class MusicEditor:
             old_value = element.raw[1]
             self._track_undo(self._change_element_value, (channel, index, bytearray([value])),
                              (channel, index, bytearray([old_value])), text=f"Volume (Channel {channel})")
-            self._track_undo_count.append(1)
-            self._track_redo_count = []
 
             # Update UI
             self._update_undo_buttons(0)
@@ -2268,8 +2231,6 @@ class MusicEditor:
                 self._track_undo(self._change_element_value, (channel, index, bytearray([value[0]])),
                                  (channel, index, bytearray([old_value])),
                                  text=f"Change instrument (Channel {channel})")
-                self._track_undo_count.append(1)
-                self._track_redo_count = []
 
                 # Update undo/redo buttons
                 self._update_undo_buttons(0)
@@ -2309,8 +2270,6 @@ class MusicEditor:
             old_value = element.raw[1]
             self._track_undo(self._change_element_value, (channel, index, bytearray([value])),
                              (channel, index, bytearray([old_value])), text=f"Rest duration (Channel {channel})")
-            self._track_undo_count.append(1)
-            self._track_redo_count = []
 
             # Update UI
             self._update_undo_buttons(0)
@@ -2365,8 +2324,6 @@ class MusicEditor:
             old_values = element.raw[1:]
             self._track_undo(self._change_element_value, (channel, index, new_values),
                              (channel, index, old_values), text=f"Set vibrato (Channel {channel})")
-            self._track_undo_count.append(1)
-            self._track_redo_count = []
 
             # Update UI
             self._update_undo_buttons(0)
@@ -2396,8 +2353,6 @@ class MusicEditor:
             old_values = element.raw[1:]
             self._track_undo(self._change_element_value, (channel, index, new_values),
                              (channel, index, old_values), text=f"Set vibrato (Channel {channel})")
-            self._track_undo_count.append(1)
-            self._track_redo_count = []
 
             # Update UI
             self._update_undo_buttons(0)
@@ -2422,8 +2377,6 @@ class MusicEditor:
                 else:
                     self._track_undo(element.set_rewind, (value,),
                                      (element.loop_position,), text=f"Set rewind (Channel {self._selected_channel})")
-                    self._track_undo_count.append(1)
-                    self._track_redo_count = []
                     element.loop_position = value
                     self._unsaved_changes_track = True
 
@@ -2484,8 +2437,6 @@ class MusicEditor:
             # self._change_element_type(self._selected_channel, self._selected_element, new_type)
             self._track_undo(self._change_element_type, (channel, index, new_type),
                              (channel, index, old_type, old_values), text=f"Change element type (Channel {channel})")
-            self._track_undo_count.append(1)
-            self._track_redo_count = []
             self._update_undo_buttons(0)
 
         # Undoable action: increase the duration of a group of notes
@@ -2506,7 +2457,8 @@ class MusicEditor:
                     if element.raw[0] < 0xF0 and element.raw[1] < 0xFF:
                         final_selection.append(index)
 
-            # Now we can process these "filtered" items
+            # Now we can process these "filtered" items, as a single undo entry
+            self._track_undo.begin()
             for index in final_selection:
                 element = self._track_data[channel][index]
 
@@ -2519,9 +2471,7 @@ class MusicEditor:
                 self._update_element_info(channel, index)
                 self.app.selectListItemAtPos(f"SE_List_Channel_{channel}", index << 1, callFunction=False)
 
-            if len(final_selection) > 0:
-                self._track_undo_count.append(len(final_selection))
-                self._track_redo_count = []
+            if self._track_undo.commit():
                 # Update undo buttons
                 self._update_undo_buttons(0)
                 # (Re-)select these items
@@ -2544,7 +2494,8 @@ class MusicEditor:
                     if element.raw[0] < 0xF0 and element.raw[1] > 0:
                         final_selection.append(index)
 
-            # Now we can process these "filtered" items
+            # Now we can process these "filtered" items, as a single undo entry
+            self._track_undo.begin()
             for index in final_selection:
                 element = self._track_data[channel][index]
 
@@ -2557,9 +2508,7 @@ class MusicEditor:
                 self._update_element_info(channel, index)
                 self.app.selectListItemAtPos(f"SE_List_Channel_{channel}", index << 1, callFunction=False)
 
-            if len(final_selection) > 0:
-                self._track_undo_count.append(len(final_selection))
-                self._track_redo_count = []
+            if self._track_undo.commit():
                 # Update undo buttons
                 self._update_undo_buttons(0)
                 # (Re-)select these items
@@ -2581,7 +2530,8 @@ class MusicEditor:
                     if element.raw[0] < len(_NOTE_NAMES):
                         final_selection.append(index)
 
-            # Now we can process these "filtered" items
+            # Now we can process these "filtered" items, as a single undo entry
+            self._track_undo.begin()
             for index in final_selection:
                 element = self._track_data[channel][index]
 
@@ -2597,9 +2547,7 @@ class MusicEditor:
                     self._update_element_info(channel, index)
                     self.app.selectListItemAtPos(f"SE_List_Channel_{channel}", index << 1, callFunction=False)
 
-            if len(final_selection) > 0:
-                self._track_undo_count.append(len(final_selection))
-                self._track_redo_count = []
+            if self._track_undo.commit():
                 # Update undo buttons
                 self._update_undo_buttons(0)
                 # (Re-)select these items
@@ -2621,7 +2569,8 @@ class MusicEditor:
                     if 0 < element.raw[0] < 0xF0:
                         final_selection.append(index)
 
-            # Now we can process these "filtered" items
+            # Now we can process these "filtered" items, as a single undo entry
+            self._track_undo.begin()
             for index in final_selection:
                 element = self._track_data[channel][index]
 
@@ -2638,9 +2587,7 @@ class MusicEditor:
                     self._update_element_info(channel, index)
                     self.app.selectListItemAtPos(f"SE_List_Channel_{channel}", index << 1, callFunction=False)
 
-            if len(final_selection) > 0:
-                self._track_undo_count.append(len(final_selection))
-                self._track_redo_count = []
+            if self._track_undo.commit():
                 # Update undo buttons
                 self._update_undo_buttons(0)
                 # (Re-)select these items
@@ -2833,8 +2780,6 @@ class MusicEditor:
                          # UNDO: delete element (channel, position)
                          (channel, position), self._delete_track_element,
                          text=f"Insert new element (Channel {channel})")
-        self._track_undo_count.append(1)
-        self._track_redo_count = []
         self._update_undo_buttons(0)
 
         # Update UI
@@ -2942,8 +2887,6 @@ class MusicEditor:
                 address += 2
 
             self._track_undo.clear()
-            self._track_undo_count = []
-            self._track_redo_count = []
 
             self.read_track_data(0)
             self.track_info(0)
@@ -2972,8 +2915,6 @@ class MusicEditor:
                 return
 
             self._track_undo.clear()
-            self._track_undo_count = []
-            self._track_redo_count = []
 
             self.read_track_data(channel)
             self.track_info(channel)
@@ -2997,8 +2938,6 @@ class MusicEditor:
 
                 # Not undoable: clear undo stack
                 self._track_undo.clear()
-                self._track_undo_count = []
-                self._track_redo_count = []
                 self._update_undo_buttons(0)
 
                 self._unsaved_changes_track = True
@@ -3080,8 +3019,6 @@ class MusicEditor:
 
             # Not undoable: clear the undo stack
             self._track_undo.clear()
-            self._track_undo_count = []
-            self._track_redo_count = []
             self._update_undo_buttons(0)
 
             # Clear channel by creating a new one with minimal elements
@@ -3113,6 +3050,7 @@ class MusicEditor:
             if len(selection) > 0:
                 sorted_selection = list(set([i >> 1 for i in selection]))
                 sorted_selection.sort(reverse=True)
+                self._track_undo.begin()
                 for index in sorted_selection:
 
                     # We need to know what the deleted element was if we want to be able to undo this action
@@ -3141,7 +3079,7 @@ class MusicEditor:
 
                     # self._delete_track_element(self._selected_channel, entry >> 1)
 
-                self._track_undo_count.append(len(sorted_selection))
+                self._track_undo.commit()
                 self._update_undo_buttons(0)
 
                 # Show updated elements list
@@ -4498,6 +4436,11 @@ class MusicEditor:
         if tracks is None:
             tracks = self._track_data
 
+        sequencer = self.create_sequencer(tracks)
+        if sequencer is None:
+            self.app.errorBox("Music Editor", f"Unsupported ROM bank {self._bank}.", "Music_Editor")
+            return
+
         # --- Init code ---
         if self.sound_server.getIsBooted() < 1:
             self.sound_server.boot()
@@ -4512,799 +4455,82 @@ class MusicEditor:
 
         self.apu.set_triangle_volume(self._triangle_volume)
 
-        # Approximate NTSC timing
-        frame_interval = 0.016  # 1 / 60
-
-        channel_volume = bytearray([0, 0, 0, 0])
-        note_volume = bytearray([0, 0, 0, 0])
-        channel_instrument: List[Instrument] = [Instrument(), Instrument(), Instrument(), Instrument()]
-        # Each channel has a set of 3 triggers that control when to switch to the next envelope
-        envelope_triggers = [bytearray([0, 0, 0]),
-                             bytearray([0, 0, 0]),
-                             bytearray([0, 0, 0]),
-                             bytearray([0, 0, 0])]
-
-        # This controls the difference between the "base" note period and each entry in the vibrato table
-        vibrato_factor = bytearray([0, 0, 0, 0])
-        # How much to increment the counter, affects how soon we will switch to the next period entry in the table
-        # These are 16-bit values
-        vibrato_increment = [0, 0, 0, 0]
-        vibrato_counter = [0, 0, 0, 0]
-        # Low byte of note period will be taken from this table at each frame
-        vibrato_table = [bytearray([0, 0, 0, 0, 0, 0, 0, 0]),
-                         bytearray([0, 0, 0, 0, 0, 0, 0, 0]),
-                         bytearray([0, 0, 0, 0, 0, 0, 0, 0]),
-                         bytearray([0, 0, 0, 0, 0, 0, 0, 0])]
-
-        # Read the register masks from ROM
-        reg_mask: List[bytearray] = [bytearray(), bytearray(), bytearray(), bytearray()]
-        if self._bank == 8:
-            reg_mask[0] = self.rom.read_bytes(0x8, 0x859F, 4)
-            reg_mask[1] = self.rom.read_bytes(0x8, 0x85A3, 4)
-            reg_mask[2] = self.rom.read_bytes(0x8, 0x85A7, 4)
-            reg_mask[3] = self.rom.read_bytes(0x8, 0x85AB, 4)
-        elif self._bank == 9:
-            reg_mask[0] = self.rom.read_bytes(0x9, 0x85A3, 4)
-            reg_mask[1] = self.rom.read_bytes(0x9, 0x85A7, 4)
-            reg_mask[2] = self.rom.read_bytes(0x9, 0x85AB, 4)
-            reg_mask[3] = self.rom.read_bytes(0x9, 0x85AF, 4)
-        else:
-            self.app.errorBox("Music Editor", f"Unsupported ROM bank {self._bank}.", "Music_Editor")
-            return
-
-        # At the end of each play loop, these values will be written to the corresponding APU registers of their
-        # respective channels
-        reg_0 = bytearray([reg_mask[0][0], reg_mask[0][1], reg_mask[0][2], reg_mask[0][3]])
-        reg_1 = bytearray([reg_mask[1][0], reg_mask[1][1], reg_mask[1][2], reg_mask[1][3]])
-        reg_2 = bytearray([reg_mask[2][0], reg_mask[2][1], reg_mask[2][2], reg_mask[2][3]])
-        reg_3 = bytearray([reg_mask[3][0], reg_mask[3][1], reg_mask[3][2], reg_mask[3][3]])
-
         # Initialise APU registers
-        self.apu.pulse_0.write_reg0(reg_mask[0][0])
-        self.apu.pulse_0.write_reg1(reg_mask[0][1])
-        self.apu.pulse_0.write_reg2(reg_mask[0][2])
-        self.apu.pulse_0.write_reg3(reg_mask[0][3])
-
-        self.apu.pulse_1.write_reg0(reg_mask[1][0])
-        self.apu.pulse_1.write_reg1(reg_mask[1][1])
-        self.apu.pulse_1.write_reg2(reg_mask[1][2])
-        self.apu.pulse_1.write_reg3(reg_mask[1][3])
-
-        self.apu.triangle.write_reg0(reg_mask[2][0])
-        self.apu.triangle.write_reg2(reg_mask[2][2])
-        self.apu.triangle.write_reg3(reg_mask[2][3])
-
-        self.apu.noise.write_reg0(reg_mask[3][0])
-        self.apu.noise.write_reg2(reg_mask[3][2])
-        self.apu.noise.write_reg3(reg_mask[3][3])
-
-        # Pre-allocate some variables so we don't need a lot of malloc during the loop
-        # Envelope size, three envelopes per instrument, one instrument per channel
-        size_0: bytearray = bytearray([0, 0, 0, 0])
-        size_1: bytearray = bytearray([0, 0, 0, 0])
-        size_2: bytearray = bytearray([0, 0, 0, 0])
-        tmp_int: int
-        tmp_vol: int        # Volume before attenuation
-
-        triangle_octave: bool = False
-
-        self._track_counter = [0, 0, 0, 0]
-        self._track_position = [0, 0, 0, 0]
-
-        # --- Seek code ---
+        for address, value in sequencer.initial_writes():
+            self.apu.write(address, value)
 
         if seek[1] != 0:
-            # Process the seek channel's elements keeping count of how many frames they take, until we reach the
-            #   seek point. We also change the initial values of counters, volumes, instruments and vibrato.
-            c = seek[0]
-            self._track_position[c] = seek[1]
-            element_index = 0
-            target_frames = 0
-
-            for e in tracks[c]:
-                if element_index == seek[1]:
-                    break
-
-                if e.control == TrackDataEntry.CHANNEL_VOLUME:
-                    channel_volume[c] = e.raw[1]
-
-                elif e.control == TrackDataEntry.SELECT_INSTRUMENT:
-                    channel_instrument[c] = self._instruments[e.raw[1]]
-
-                elif e.control == TrackDataEntry.SET_VIBRATO and c < 3:
-                    vibrato_factor[c] = e.raw[2]
-                    # Use vibrato_speed to set the counters
-                    if e.raw[3] < 2:
-                        # Disable vibrato
-                        vibrato_counter[c] = 0
-                        vibrato_increment[c] = 0
-                    else:
-                        # Enable vibrato
-                        vibrato_increment[c] = 0x800 // e.raw[2]
-                        vibrato_counter[c] = 0x200
-
-                    if c == 2:
-                        triangle_octave = e.raw[1] < 0xFF
-
-                elif e.control == TrackDataEntry.REST:
-                    target_frames += e.raw[1]
-
-                elif e.control == TrackDataEntry.REWIND:
-                    # This means we are trying to seek from the end of the track.
-                    #   Nice try, but we'll start from 0 instead.
-                    target_frames = 0
-                    self._track_counter[c] = 1
-                    self._track_position[c] = 0
-                    break
-
-                elif e.raw[0] < 0xF0:
-                    target_frames += e.note.duration
-
-                element_index += 1
-
-            # Now we go through all the other channels to find what element is playing after the desired amount of
-            #   frames has passed.
-            for c in range(4):
-                if c == seek[0]:
-                    continue  # Skip the seek channel, we have already processed that
-
-                frames = 0
-                element_index = 0
-                for e in tracks[c]:
-                    if frames == target_frames:
-                        # Start this channel exactly from here
-                        self._track_position[c] = element_index
-                        self._track_counter[c] = 1
-                        break
-
-                    if frames > target_frames:
-                        # Start in the middle of this element, e.g. during a rest of while a note is playing.
-                        self._track_position[c] = element_index
-                        # We need to calculate how many frames into the rest/note we need to be to stay in sync.
-                        self._track_counter[c] = 1 + (frames - target_frames)
-                        break
-
-                    if e.control == TrackDataEntry.CHANNEL_VOLUME:
-                        channel_volume[c] = e.raw[1]
-
-                    elif e.control == TrackDataEntry.SELECT_INSTRUMENT:
-                        channel_instrument[c] = self._instruments[e.raw[1]]
-
-                        # Store each envelope's size, it will be used to calculate trigger points when a note is played
-                        size_0[c] = channel_instrument[c].size(0)
-                        size_1[c] = channel_instrument[c].size(1)
-                        size_2[c] = channel_instrument[c].size(2)
-
-                    elif e.control == TrackDataEntry.SET_VIBRATO and c < 3:
-                        vibrato_factor[c] = e.raw[3]
-                        # Use vibrato_speed to set the counters
-                        if e.raw[1] < 2:
-                            # Disable vibrato
-                            vibrato_counter[c] = 0
-                            vibrato_increment[c] = 0
-                        else:
-                            # Enable vibrato
-                            vibrato_increment[c] = 0x800 // e.raw[1]
-                            vibrato_counter[c] = 0x200
-
-                        if c == 2:
-                            if e.raw[1] == 0xFF:
-                                triangle_octave = True
-                            else:
-                                triangle_octave = False
-
-                    elif e.control == TrackDataEntry.REST:
-                        frames += e.raw[1]
-
-                    elif e.control == TrackDataEntry.REWIND:
-                        # TODO Detect and prevent endless loops if there are no notes or rests
-                        element_index = e.loop_position
-
-                    elif e.raw[0] < 0xF0:
-                        frames += e.note.duration
-
-                        # Now we set "trigger points" for the instrument's envelope
-
-                        # Trigger 0 is the note duration
-                        envelope_triggers[c][0] = e.raw[1]
-
-                        # Trigger 1 is trigger 0 - the size of envelope 0
-                        # This means just enough time to play all the values in env.0 before we switch to env.1
-                        envelope_triggers[c][1] = e.raw[1] - size_0[c] if e.raw[1] > size_0[c] else 0
+            sequencer.seek(seek[0], seek[1], self._track_timeline(sequencer))
 
-                        # Trigger 2
-                        tmp_int = envelope_triggers[c][1] - size_2[c] if envelope_triggers[c][1] > size_2[c] else 0
+        # The tracker UI update thread follows these
+        self._track_counter = sequencer.counter
+        self._track_position = sequencer.position
 
-                        if tmp_int > size_1[c]:
-                            tmp_int = size_1[c]
-
-                        envelope_triggers[c][2] = envelope_triggers[c][1] - tmp_int
-
-                        note_volume[c] = channel_volume[c]
-
-                    element_index += 1
-
-        # --- End of seek code ---
-
-        c = 0  # Currently playing channel
-
-        # A partially unrolled loop is necessary for a fast enough playback
+        clock = FrameClock()
         while self._playing:
-            start_time = time.time()
-
-            # ---------------------------------------- PULSE 0 ---------------------------------------------------------
-
-            # Note that the initial value should be 1, so on the first iteration we immediately read
-            # the first segment
-            self._track_counter[c] -= 1
-
-            # Keep reading data segments until we find a rest or a note
-            while self._track_counter[c] < 1:
-                track_data = tracks[c][self._track_position[c]]
-
-                # Interpret this data
-
-                # Go from the most to least common
-                if track_data.raw[0] < 0xF0:        # PULSE 0 NOTE
-                    period_lo = self._note_period_lo[track_data.raw[0]]
-                    period_hi = self._note_period_hi[track_data.raw[0]]
-
-                    # Do the same vibrato calculations done by the game's music engine
-                    # Basically, it creates a table of 8 values for the low byte of the note period, and cycles
-                    # through them at a rate that depends on the vibrato speed ("increment" value)
-                    vibrato_value = (period_lo >> 3) | ((period_hi & 0x03) << 5)
-                    
-                    tmp_int = vibrato_value // vibrato_factor[c] if vibrato_factor[c] > 0 else 0
-
-                    # Timer High register value is written as-is
-                    reg_3[c] = period_hi
-
-                    # Put the low byte in the vibrato table, positions 0 and 4
-                    vibrato_table[c][0] = vibrato_table[c][4] = period_lo
-                    # Entries 1 and 3 add the offset
-                    vibrato_table[c][1] = vibrato_table[c][3] = (period_lo + tmp_int) % 256
-                    # Entry 2 adds the offset again
-                    vibrato_table[c][2] = (vibrato_table[c][3] + tmp_int) % 256
-                    # Entries 5 and 7 subtract the offset instead
-                    vibrato_table[c][5] = vibrato_table[c][7] = period_lo - tmp_int
-                    # Finally entry 6 subtracts it again
-                    vibrato_table[c][6] = (vibrato_table[c][5] - tmp_int) % 256
-
-                    # Setting the counter will end the "event reading" loop
-                    self._track_counter[c] = track_data.raw[1]
-
-                    # Now we set "trigger points" for the instrument's envelope
-
-                    # Trigger 0 is the note duration
-                    envelope_triggers[c][0] = track_data.raw[1]
-
-                    # Trigger 1 is trigger 0 - the size of envelope 0
-                    # This means just enough time to play all the values in env.0 before we switch to env.1
-                    envelope_triggers[c][1] = track_data.raw[1] - size_0[c] if track_data.raw[1] > size_0[c] else 0
-
-                    # Trigger 2
-                    tmp_int = envelope_triggers[c][1] - size_2[c] if envelope_triggers[c][1] > size_2[c] else 0
-
-                    if tmp_int > size_1[c]:
-                        tmp_int = size_1[c]
-
-                    envelope_triggers[c][2] = envelope_triggers[c][1] - tmp_int
-
-                    note_volume[c] = channel_volume[c]
-
-                elif track_data.control == 0xFE:    # PULSE 0 REST
-                    # The "data read" loop should end after setting this
-                    self._track_counter[c] = track_data.raw[1]
-
-                    # Skip all the envelope trigger stuff, it has no effect anyway...
-
-                    # This should effectively mute the channel
-                    reg_0[c] = reg_mask[c][0]
-                    reg_1[c] = reg_mask[c][1]
-                    reg_2[c] = reg_mask[c][2]
-                    reg_3[c] = reg_mask[c][3]
-
-                    envelope_triggers[c][0] = track_data.raw[1]
-                    envelope_triggers[c][1] = 0
-                    envelope_triggers[c][2] = 0
-
-                    note_volume[c] = 0
-
-                elif track_data.control == 0xFC:    # PULSE 0 INSTRUMENT
-                    channel_instrument[c] = self._instruments[track_data.raw[1]]
-
-                    # Store each envelope's size, it will be used to calculate trigger points when a note is played
-                    size_0[c] = channel_instrument[c].size(0)
-                    size_1[c] = channel_instrument[c].size(1)
-                    size_2[c] = channel_instrument[c].size(2)
-
-                elif track_data.control == 0xFB:    # PULSE 0 VOLUME
-                    channel_volume[c] = note_volume[c] = track_data.raw[1]
-
-                elif track_data.control == 0xFD:    # PULSE 0 VIBRATO
-                    vibrato_factor[c] = track_data.raw[3]
-
-                    if track_data.raw[2] < 2:
-                        # Disable vibrato if speed is less than 2
-                        vibrato_increment[c] = 0
-                        vibrato_counter[c] = 0
-                    else:
-                        vibrato_increment[c] = 0x0800 // track_data.raw[2]
-                        vibrato_counter[c] = 0x0200
-
-                elif track_data.control == 0xFF:    # PULSE 0 REWIND/END
-                    self._track_position[c] = track_data.loop_position - 1
-
-                self._track_position[c] += 1
-
-            # Note/Rest found or still playing one: generate / manipulate sound
-            if self._track_counter[c] > 1:
-                # Keep playing the current note
-
-                # Use vibrato table and counters to set the Timer Low register
-                vibrato_counter[c] += vibrato_increment[c]
-                tmp_int = (vibrato_counter[c] >> 8) & 0x07
-                reg_2[c] = vibrato_table[c][tmp_int]
-
-                # The value for timer high was written when the note event was encountered, and is not modified here
-
-                # Use instrument envelopes and channel volume to control register 0
-
-                if self._track_counter[c] >= envelope_triggers[c][1]:       # Envelope 0
-                    # Index within the envelope is: trigger - remaining note duration
-                    tmp_int = (envelope_triggers[c][0] - self._track_counter[c]) + 1
-                    if tmp_int > size_0[c]:
-                        tmp_int = size_0[c]
-                    tmp_vol = channel_instrument[c].envelope[0][tmp_int]
-
-                elif self._track_counter[c] >= envelope_triggers[c][2]:     # Envelope 1
-                    tmp_int = (envelope_triggers[c][1] - self._track_counter[c]) + 1
-                    if tmp_int > size_1[c]:
-                        tmp_int = size_1[c]
-                    tmp_vol = channel_instrument[c].envelope[1][tmp_int]
-
-                else:                                                       # Envelope 2
-                    tmp_int = (envelope_triggers[c][2] - self._track_counter[c]) + 1
-                    if tmp_int > size_2[c]:
-                        tmp_int = size_2[c]
-                    tmp_vol = channel_instrument[c].envelope[2][tmp_int]
-
-                # Now we must calculate the output based on the envelope and channel volume, but instead of doing
-                # the actual calculation, we use lookup tables
-                # tmp_vol bits 7-6 = duty, tmp_vol bits 5-1 = volume table to use, bit 0 ignored
-                reg_0[c] = (tmp_vol & 0xC0) | _ENV_TABLE[(tmp_vol & 0x1F) >> 1][note_volume[c]]
-
-                # Finally write registers
-                self.apu.pulse_0.write_reg0(reg_0[c] | reg_mask[c][0])
-                # self.apu.pulse_0.write_reg1(reg_1[c] | reg_mask[c][1]) We can skip this, it's not used
-                self.apu.pulse_0.write_reg2(reg_2[c])
-                self.apu.pulse_0.write_reg3(reg_3[c])
-
-            # ---------------------------------------- PULSE 1 ---------------------------------------------------------
-
-            c = 1
-
-            self._track_counter[c] -= 1
-
-            # Keep reading data segments until we find a rest or a note
-            while self._track_counter[c] < 1:
-                track_data = tracks[c][self._track_position[c]]
-
-                if track_data.raw[0] < 0xF0:  # PULSE 1 NOTE
-                    period_lo = self._note_period_lo[track_data.raw[0]]
-                    period_hi = self._note_period_hi[track_data.raw[0]]
-
-                    # Do the same vibrato calculations done by the game's music engine
-                    # Basically, it creates a table of 8 values for the low byte of the note period, and cycles
-                    # through them at a rate that depends on the vibrato speed ("increment" value)
-                    vibrato_value = (period_lo >> 3) | ((period_hi & 0x03) << 5)
-
-                    tmp_int = vibrato_value // vibrato_factor[c] if vibrato_factor[c] > 0 else 0
-
-                    # Timer High register value is written as-is
-                    reg_3[c] = period_hi
-
-                    # Put the low byte in the vibrato table, positions 0 and 4
-                    vibrato_table[c][0] = vibrato_table[c][4] = period_lo
-                    # Entries 1 and 3 add the offset
-                    vibrato_table[c][1] = vibrato_table[c][3] = (period_lo + tmp_int) % 256
-                    # Entry 2 adds the offset again
-                    vibrato_table[c][2] = (vibrato_table[c][3] + tmp_int) % 256
-                    # Entries 5 and 7 subtract the offset instead
-                    vibrato_table[c][5] = vibrato_table[c][7] = period_lo - tmp_int
-                    # Finally entry 6 subtracts it again
-                    vibrato_table[c][6] = (vibrato_table[c][5] - tmp_int) % 256
-
-                    # Setting the counter will end the "event reading" loop
-                    self._track_counter[c] = track_data.raw[1]
-
-                    # Now we set "trigger points" for the instrument's envelope
-
-                    # Trigger 0 is the note duration
-                    envelope_triggers[c][0] = track_data.raw[1]
-
-                    # Trigger 1 is trigger 0 - the size of envelope 0
-                    # This means just enough time to play all the values in env.0 before we switch to env.1
-                    envelope_triggers[c][1] = track_data.raw[1] - size_0[c] if track_data.raw[1] > size_0[c] else 0
-
-                    # Trigger 2
-                    tmp_int = envelope_triggers[c][1] - size_2[c] if envelope_triggers[c][1] > size_2[c] else 0
-
-                    if tmp_int > size_1[c]:
-                        tmp_int = size_1[c]
+            for address, value in sequencer.step_frame():
+                self.apu.write(address, value)
 
-                    envelope_triggers[c][2] = envelope_triggers[c][1] - tmp_int
-
-                    note_volume[c] = channel_volume[c]
-
-                elif track_data.control == 0xFE:  # PULSE 1 REST
-                    # The "data read" loop should end after setting this
-                    self._track_counter[c] = track_data.raw[1]
-
-                    # Skip all the envelope trigger stuff, it has no effect anyway...
-
-                    # This should effectively mute the channel
-                    reg_0[c] = reg_mask[c][0]
-                    reg_1[c] = reg_mask[c][1]
-                    reg_2[c] = reg_mask[c][2]
-                    reg_3[c] = reg_mask[c][3]
-
-                    envelope_triggers[c][0] = track_data.raw[1]
-                    envelope_triggers[c][1] = 0
-                    envelope_triggers[c][2] = 0
-
-                    note_volume[c] = 0
-
-                elif track_data.control == 0xFC:  # PULSE 1 INSTRUMENT
-                    channel_instrument[c] = self._instruments[track_data.raw[1]]
-
-                    # Store each envelope's size, it will be used to calculate trigger points when a note is played
-                    size_0[c] = channel_instrument[c].size(0)
-                    size_1[c] = channel_instrument[c].size(1)
-                    size_2[c] = channel_instrument[c].size(2)
-
-                elif track_data.control == 0xFB:  # PULSE 1 VOLUME
-                    channel_volume[c] = note_volume[c] = track_data.raw[1]
-
-                elif track_data.control == 0xFD:  # PULSE 1 VIBRATO
-                    vibrato_factor[c] = track_data.raw[3]
-
-                    if track_data.raw[2] < 2:
-                        # Disable vibrato if speed is less than 2
-                        vibrato_increment[c] = 0
-                        vibrato_counter[c] = 0
-                    else:
-                        vibrato_increment[c] = 0x0800 // track_data.raw[2]
-                        vibrato_counter[c] = 0x0200
-
-                elif track_data.control == 0xFF:  # PULSE 1 REWIND/END
-                    self._track_position[c] = track_data.loop_position - 1
-
-                self._track_position[c] += 1
-
-            # Note/Rest found or still playing one: generate / manipulate sound
-            if self._track_counter[c] > 1:
-                # Keep playing the current note
-
-                # Use vibrato table and counters to set the Timer Low register
-                vibrato_counter[c] += vibrato_increment[c]
-                tmp_int = (vibrato_counter[c] >> 8) & 0x07
-                reg_2[c] = vibrato_table[c][tmp_int]
-
-                # The value for timer high was written when the note event was encountered, and is not modified here
-
-                # Use instrument envelopes and channel volume to control register 0
-
-                if self._track_counter[c] >= envelope_triggers[c][1]:  # Envelope 0
-                    # Index within the envelope is: trigger - remaining note duration
-                    tmp_int = (envelope_triggers[c][0] - self._track_counter[c]) + 1
-                    if tmp_int > size_0[c]:
-                        tmp_int = size_0[c]
-                    tmp_vol = channel_instrument[c].envelope[0][tmp_int]
-
-                elif self._track_counter[c] >= envelope_triggers[c][2]:  # Envelope 1
-                    tmp_int = (envelope_triggers[c][1] - self._track_counter[c]) + 1
-                    if tmp_int > size_1[c]:
-                        tmp_int = size_1[c]
-                    tmp_vol = channel_instrument[c].envelope[1][tmp_int]
-
-                else:  # Envelope 2
-                    tmp_int = (envelope_triggers[c][2] - self._track_counter[c]) + 1
-                    if tmp_int > size_2[c]:
-                        tmp_int = size_2[c]
-                    tmp_vol = channel_instrument[c].envelope[2][tmp_int]
-
-                # Now we must calculate the output based on the envelope and channel volume, but instead of doing
-                # the actual calculation, we use lookup tables
-                # tmp_vol bits 7-6 = duty, tmp_vol bits 5-1 = volume table to use, bit 0 ignored
-                reg_0[c] = (tmp_vol & 0xC0) | _ENV_TABLE[(tmp_vol & 0x1F) >> 1][note_volume[c]]
-
-                # Finally write registers
-                self.apu.pulse_1.write_reg0(reg_0[c] | reg_mask[c][0])
-                # self.apu.pulse_1.write_reg1(reg_1[c] | reg_mask[c][1]) We can skip this, it's not used
-                self.apu.pulse_1.write_reg2(reg_2[c])
-                self.apu.pulse_1.write_reg3(reg_3[c])
-
-            # ---------------------------------------- TRIANGLE --------------------------------------------------------
-
-            c = 2
-
-            self._track_counter[c] -= 1
-
-            # Keep reading data segments until we find a rest or a note
-            while self._track_counter[c] < 1:
-                track_data = tracks[c][self._track_position[c]]
-
-                # Interpret this data
-
-                # Go from the most to least common
-                if track_data.raw[0] < 0xF0:  # TRIANGLE NOTE
-                    note_index = track_data.raw[0] + (12 if triangle_octave else 0)
-                    period_lo = self._note_period_lo[note_index]
-                    period_hi = self._note_period_hi[note_index]
-
-                    # Do the same vibrato calculations done by the game's music engine
-                    # Basically, it creates a table of 8 values for the low byte of the note period, and cycles
-                    # through them at a rate that depends on the vibrato speed ("increment" value)
-                    vibrato_value = (period_lo >> 3) | ((period_hi & 0x03) << 5)
-
-                    tmp_int = vibrato_value // vibrato_factor[c] if vibrato_factor[c] > 0 else 0
-
-                    # Timer High register value is written as-is
-                    reg_3[c] = period_hi
-
-                    # Put the low byte in the vibrato table, positions 0 and 4
-                    vibrato_table[c][0] = vibrato_table[c][4] = period_lo
-                    # Entries 1 and 3 add the offset
-                    vibrato_table[c][1] = vibrato_table[c][3] = period_lo + tmp_int
-                    # Entry 2 adds the offset again
-                    vibrato_table[c][2] = (vibrato_table[c][3] + tmp_int) % 256
-                    # Entries 5 and 7 subtract the offset instead
-                    vibrato_table[c][5] = vibrato_table[c][7] = period_lo - tmp_int
-                    # Finally entry 6 subtracts it again
-                    vibrato_table[c][6] = (vibrato_table[c][5] - tmp_int) % 256
-
-                    # Setting the counter will end the "event reading" loop
-                    self._track_counter[c] = track_data.raw[1]
-
-                    # Now we set "trigger points" for the instrument's envelope
-
-                    # Trigger 0 is the note duration
-                    envelope_triggers[c][0] = track_data.raw[1]
-
-                    # Trigger 1 is trigger 0 - the size of envelope 0
-                    # This means just enough time to play all the values in env.0 before we switch to env.1
-                    envelope_triggers[c][1] = track_data.raw[1] - size_0[c] if track_data.raw[1] > size_0[c] else 0
-
-                    # Trigger 2
-                    tmp_int = envelope_triggers[c][1] - size_2[c] if envelope_triggers[c][1] > size_2[c] else 0
-
-                    if tmp_int > size_1[c]:
-                        tmp_int = size_1[c]
-
-                    envelope_triggers[c][2] = envelope_triggers[c][1] - tmp_int
-
-                    note_volume[c] = channel_volume[c]
-
-                elif track_data.control == 0xFE:  # TRIANGLE REST
-                    # The "data read" loop should end after setting this
-                    self._track_counter[c] = track_data.raw[1]
-
-                    # Skip all the envelope trigger stuff, it has no effect anyway...
-
-                    # This should effectively mute the channel
-                    reg_0[c] = reg_mask[c][0]
-                    reg_1[c] = reg_mask[c][1]
-                    reg_2[c] = reg_mask[c][2]
-                    reg_3[c] = reg_mask[c][3]
-
-                    envelope_triggers[c][0] = track_data.raw[1]
-                    envelope_triggers[c][1] = 0
-                    envelope_triggers[c][2] = 0
-
-                    note_volume[c] = 0
-
-                elif track_data.control == 0xFC:  # TRIANGLE INSTRUMENT
-                    channel_instrument[c] = self._instruments[track_data.raw[1]]
-
-                    # Store each envelope's size, it will be used to calculate trigger points when a note is played
-                    size_0[c] = channel_instrument[c].size(0)
-                    size_1[c] = channel_instrument[c].size(1)
-                    size_2[c] = channel_instrument[c].size(2)
-
-                elif track_data.control == 0xFB:  # TRIANGLE VOLUME
-                    channel_volume[c] = note_volume[c] = track_data.raw[1]
-
-                elif track_data.control == 0xFD:  # TRIANGLE VIBRATO
-                    # +12 semitones if value is not FF
-                    triangle_octave = (track_data.raw[1] < 0xFF)
-
-                    vibrato_factor[c] = track_data.raw[3]
-
-                    if track_data.raw[2] < 2:
-                        # Disable vibrato if speed is less than 2
-                        vibrato_increment[c] = 0
-                        vibrato_counter[c] = 0
-                    else:
-                        vibrato_increment[c] = 0x0800 // track_data.raw[2]
-                        vibrato_counter[c] = 0x0200
-
-                elif track_data.control == 0xFF:  # TRIANGLE REWIND/END
-                    self._track_position[c] = track_data.loop_position - 1
-
-                self._track_position[c] += 1
-
-            # Note/Rest found or still playing one: generate / manipulate sound
-            if self._track_counter[c] > 1:
-                # Keep playing the current note
-
-                # Use vibrato table and counters to set the Timer Low register
-                vibrato_counter[c] += vibrato_increment[c]
-                tmp_int = (vibrato_counter[c] >> 8) & 0x07
-                reg_2[c] = vibrato_table[c][tmp_int]
-
-                # The value for timer high was written when the note event was encountered, and is not modified here
-
-                # Use instrument envelopes and channel volume to control register 0
-
-                if self._track_counter[c] >= envelope_triggers[c][1]:  # Envelope 0
-                    # Index within the envelope is: trigger - remaining note duration
-                    tmp_int = (envelope_triggers[c][0] - self._track_counter[c]) + 1
-                    if tmp_int > size_0[c]:
-                        tmp_int = size_0[c]
-                    tmp_vol = channel_instrument[c].envelope[0][tmp_int]
-
-                elif self._track_counter[c] >= envelope_triggers[c][2]:  # Envelope 1
-                    tmp_int = (envelope_triggers[c][1] - self._track_counter[c]) + 1
-                    if tmp_int > size_1[c]:
-                        tmp_int = size_1[c]
-                    tmp_vol = channel_instrument[c].envelope[1][tmp_int]
-
-                else:  # Envelope 2
-                    tmp_int = (envelope_triggers[c][2] - self._track_counter[c]) + 1
-                    if tmp_int > size_2[c]:
-                        tmp_int = size_2[c]
-                    tmp_vol = channel_instrument[c].envelope[2][tmp_int]
-
-                # The Triangle channel has no volume: it will be turned off unless "volume" is 15
-                reg_0[c] = tmp_vol if note_volume[c] == 0xF else 0x80
-
-                # Finally write registers
-                self.apu.triangle.write_reg0((reg_0[c] & 0x8C) | reg_mask[c][0])
-                self.apu.triangle.write_reg2(reg_2[c])
-                self.apu.triangle.write_reg3(reg_3[c])
-
-            # The triangle channel is muted on the last frame of any note
-            else:
-                reg_0[c] = 0x80
-
-                # Finally write registers
-                self.apu.triangle.write_reg0((reg_0[c] & 0x8C) | reg_mask[c][0])
-                self.apu.triangle.write_reg2(reg_2[c])
-                self.apu.triangle.write_reg3(reg_3[c])
-
-            # ----------------------------------------- NOISE ----------------------------------------------------------
-
-            c = 3
-
-            self._track_counter[c] -= 1
-
-            # Keep reading data segments until we find a rest or a note
-            while self._track_counter[c] < 1:
-                track_data = tracks[c][self._track_position[c]]
-
-                if track_data.raw[0] < 0xF0:  # NOISE "NOTE"
-                    reg_2[c] = track_data.raw[0] & 0x0F
-                    reg_0[c] = reg_mask[c][0]
-
-                    # Note: the noise channel has no vibrato
-
-                    # Setting the counter will end the "event reading" loop
-                    self._track_counter[c] = track_data.raw[1]
-
-                    # Now we set "trigger points" for the instrument's envelope
-
-                    # Trigger 0 is the note duration
-                    envelope_triggers[c][0] = track_data.raw[1]
-
-                    # Trigger 1 is trigger 0 - the size of envelope 0
-                    # This means just enough time to play all the values in env.0 before we switch to env.1
-                    envelope_triggers[c][1] = track_data.raw[1] - size_0[c] if track_data.raw[1] > size_0[c] else 0
-
-                    # Trigger 2
-                    tmp_int = envelope_triggers[c][1] - size_2[c] if envelope_triggers[c][1] > size_2[c] else 0
-
-                    if tmp_int > size_1[c]:
-                        tmp_int = size_1[c]
-
-                    envelope_triggers[c][2] = envelope_triggers[c][1] - tmp_int
-
-                    note_volume[c] = channel_volume[c]
-
-                elif track_data.control == 0xFE:  # NOISE REST
-                    # The "data read" loop should end after setting this
-                    self._track_counter[c] = track_data.raw[1]
-
-                    # Skip all the envelope trigger stuff, it has no effect anyway...
-
-                    # This should effectively mute the channel
-                    reg_0[c] = reg_mask[c][0]
-                    reg_1[c] = reg_mask[c][1]
-                    reg_2[c] = reg_mask[c][2]
-                    reg_3[c] = reg_mask[c][3]
-
-                    envelope_triggers[c][0] = track_data.raw[1]
-                    envelope_triggers[c][1] = 0
-                    envelope_triggers[c][2] = 0
-
-                    note_volume[c] = 0
-
-                elif track_data.control == 0xFC:  # NOISE INSTRUMENT
-                    channel_instrument[c] = self._instruments[track_data.raw[1]]
-
-                    # Store each envelope's size, it will be used to calculate trigger points when a note is played
-                    size_0[c] = channel_instrument[c].size(0)
-                    size_1[c] = channel_instrument[c].size(1)
-                    size_2[c] = channel_instrument[c].size(2)
-
-                elif track_data.control == 0xFB:  # NOISE VOLUME
-                    channel_volume[c] = note_volume[c] = track_data.raw[1]
+            if not clock.wait():
+                self._slow_event.set()
 
-                elif track_data.control == 0xFD:  # NOISE VIBRATO
-                    # There is no vibrato for the noise channel
-                    pass
+        # End
+        self.sound_server.stop()
 
-                elif track_data.control == 0xFF:  # NOISE REWIND/END
-                    self._track_position[c] = track_data.loop_position - 1
+    # ------------------------------------------------------------------------------------------------------------------
 
-                self._track_position[c] += 1
+    def create_sequencer(self, tracks: Optional[List[List[TrackDataEntry]]] = None) -> Optional[MusicSequencer]:
+        """
+        Creates a sequencer for the current bank's instruments and note periods
 
-            # Note/Rest found or still playing one: generate / manipulate sound
-            if self._track_counter[c] > 1:
-                # Keep playing the current note
+        Parameters
+        ----------
+        tracks: Optional[List[List[TrackDataEntry]]]
+            Data for each channel; if not specified, use the track currently being edited
 
-                # The value for timer high was written when the note event was encountered, and is not modified here
+        Returns
+        -------
+        Optional[MusicSequencer]
+            The new sequencer, or None if the current bank does not contain music
+        """
+        if tracks is None:
+            tracks = self._track_data
 
-                # Use instrument envelopes and channel volume to control register 0
+        # Read the register masks from ROM
+        if self._bank == 8:
+            address = 0x859F
+        elif self._bank == 9:
+            address = 0x85A3
+        else:
+            return None
 
-                if self._track_counter[c] >= envelope_triggers[c][1]:  # Envelope 0
-                    # Index within the envelope is: trigger - remaining note duration
-                    tmp_int = (envelope_triggers[c][0] - self._track_counter[c]) + 1
-                    if tmp_int > size_0[c]:
-                        tmp_int = size_0[c]
-                    tmp_vol = channel_instrument[c].envelope[0][tmp_int]
+        reg_mask = [self.rom.read_bytes(self._bank, address + (c << 2), 4) for c in range(4)]
 
-                elif self._track_counter[c] >= envelope_triggers[c][2]:  # Envelope 1
-                    tmp_int = (envelope_triggers[c][1] - self._track_counter[c]) + 1
-                    if tmp_int > size_1[c]:
-                        tmp_int = size_1[c]
-                    tmp_vol = channel_instrument[c].envelope[1][tmp_int]
+        return MusicSequencer(tracks, self._instruments, self._note_period_lo, self._note_period_hi, reg_mask)
 
-                else:  # Envelope 2
-                    tmp_int = (envelope_triggers[c][2] - self._track_counter[c]) + 1
-                    if tmp_int > size_2[c]:
-                        tmp_int = size_2[c]
-                    tmp_vol = channel_instrument[c].envelope[2][tmp_int]
+    # ------------------------------------------------------------------------------------------------------------------
 
-                # Now we must calculate the output based on the envelope and channel volume, but instead of doing
-                # the actual calculation, we use lookup tables
-                # tmp_vol bits 7-6 = duty, tmp_vol bits 5-1 = volume table to use, bit 0 ignored
-                reg_0[c] = (tmp_vol & 0xC0) | _ENV_TABLE[(tmp_vol & 0x1F) >> 1][note_volume[c]]
+    def _track_timeline(self, sequencer: MusicSequencer) -> TrackTimeline:
+        """
+        Returns the frame index for the sequencer's track data, re-using the previous one if nothing has changed
 
-                # Finally write registers
-                self.apu.noise.write_reg0(reg_0[c] | reg_mask[c][0])
-                self.apu.noise.write_reg2(reg_2[c])
-                self.apu.noise.write_reg3(reg_3[c])
+        Parameters
+        ----------
+        sequencer: MusicSequencer
+            The sequencer that will be used for playback
 
-            # ------------------------------------------ END -----------------------------------------------------------
-            # Restart from channel 0
-            c = 0
+        Returns
+        -------
+        TrackTimeline
+            An index of the track data, used for seeking
+        """
+        key = (self._bank,
+               tuple(tuple((bytes(e.raw), e.loop_position) for e in track) for track in sequencer.tracks),
+               tuple(bytes(envelope) for instrument in self._instruments for envelope in instrument.envelope))
 
-            interval = frame_interval - (time.time() - start_time)
-            if interval > 0:
-                time.sleep(interval)
-            else:
-                self._slow_event.set()
+        if self._timeline is None or key != self._timeline_key:
+            self._timeline = TrackTimeline(sequencer.tracks, sequencer.instruments, sequencer.period_lo,
+                                           sequencer.period_hi, sequencer.reg_mask)
+            self._timeline_key = key
 
-        # End
-        self.sound_server.stop()
+        return self._timeline
@@ -0,0 +1,590 @@
+__author__ = "Fox Cunning"
+
+import time
+from bisect import bisect_right
+from typing import List, Optional, Sequence, Tuple
+
+# NTSC frame rate: the game's music driver runs once per frame (CPU clock / CPU cycles per frame)
+FRAME_INTERVAL = 29780.5 / 1789773
+
+# Envelope lookup tables, one per envelope level (0-8) containing each one value per volume level (0-F)
+# This will be a lot quicker than calculating output levels every frame
+_ENV_TABLE = [[0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0],
+              [0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x1, 0x1, 0x1, 0x1, 0x1, 0x1, 0x1, 0x1],
+              [0x0, 0x0, 0x0, 0x0, 0x1, 0x1, 0x1, 0x1, 0x2, 0x2, 0x2, 0x2, 0x3, 0x3, 0x3, 0x3],
+              [0x0, 0x0, 0x0, 0x0, 0x1, 0x1, 0x1, 0x1, 0x3, 0x3, 0x3, 0x3, 0x4, 0x4, 0x4, 0x4],
+              [0x0, 0x0, 0x1, 0x1, 0x2, 0x2, 0x3, 0x3, 0x4, 0x4, 0x5, 0x5, 0x6, 0x6, 0x7, 0x7],
+              [0x0, 0x0, 0x1, 0x1, 0x2, 0x2, 0x3, 0x3, 0x5, 0x5, 0x6, 0x6, 0x7, 0x7, 0x8, 0x8],
+              [0x0, 0x0, 0x1, 0x1, 0x3, 0x3, 0x4, 0x4, 0x6, 0x6, 0x7, 0x7, 0x9, 0x9, 0xA, 0xA],
+              [0x0, 0x0, 0x1, 0x1, 0x3, 0x3, 0x4, 0x4, 0x7, 0x7, 0x8, 0x8, 0xA, 0xA, 0xB, 0xB],
+              [0x0, 0x1, 0x2, 0x3, 0x4, 0x5, 0x6, 0x7, 0x8, 0x9, 0xA, 0xB, 0xC, 0xD, 0xE, 0xF]]
+
+# Track data control values (see TrackDataEntry)
+_CHANNEL_VOLUME = 0xFB
+_SELECT_INSTRUMENT = 0xFC
+_SET_VIBRATO = 0xFD
+_REST = 0xFE
+_REWIND = 0xFF
+
+_PULSE_0 = 0
+_PULSE_1 = 1
+_TRIANGLE = 2
+_NOISE = 3
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+
+class MusicSequencer:
+    """
+    Interprets the track data of the four channels the same way the game's music driver does, one frame at a time.
+
+    Each call to step_frame() advances the track by one frame and returns the APU register writes for that frame, as
+    (address, value) tuples. The sequencer does not do any timing and does not talk to the APU, so the same instance
+    can be used for live playback, offline rendering or seeking.
+    """
+
+    def __init__(self, tracks: Sequence[Sequence], instruments: Sequence, period_lo: Sequence[int],
+                 period_hi: Sequence[int], reg_mask: Sequence[Sequence[int]]):
+        """
+        Parameters
+        ----------
+        tracks: Sequence[Sequence]
+            A list of TrackDataEntry for each channel
+        instruments: Sequence
+            The Instrument list for the current bank
+        period_lo: Sequence[int]
+            Low byte of the period for each note, as read from ROM
+        period_hi: Sequence[int]
+            High byte of the period for each note, as read from ROM
+        reg_mask: Sequence[Sequence[int]]
+            For each channel, the values of the four registers when the channel is silent; these bits are also set
+            every time register 0 is written
+        """
+        self.tracks = tracks
+        self.instruments = instruments
+        self.period_lo = period_lo
+        self.period_hi = period_hi
+        self.reg_mask = reg_mask
+
+        # Index of the next element to read for each channel
+        self.position: List[int] = [0, 0, 0, 0]
+        # Frames left for the current note/rest; when it reaches 0, the next elements are read
+        self.counter: List[int] = [0, 0, 0, 0]
+        # Number of frames played so far
+        self.frame: int = 0
+        # True for channels that have been silenced because their track loops without any notes or rests
+        self.parked: List[bool] = [False, False, False, False]
+
+        self.channel_volume = bytearray([0, 0, 0, 0])
+        self.note_volume = bytearray([0, 0, 0, 0])
+        self.channel_instrument: List = [None, None, None, None]
+        # Envelope sizes, three envelopes per instrument, one instrument per channel
+        self.envelope_size: List[bytearray] = [bytearray([0, 0, 0]), bytearray([0, 0, 0]),
+                                               bytearray([0, 0, 0]), bytearray([0, 0, 0])]
+        # Each channel has a set of 3 triggers that control when to switch to the next envelope
+        self.envelope_triggers: List[bytearray] = [bytearray([0, 0, 0]), bytearray([0, 0, 0]),
+                                                   bytearray([0, 0, 0]), bytearray([0, 0, 0])]
+
+        # This controls the difference between the "base" note period and each entry in the vibrato table
+        self.vibrato_factor = bytearray([0, 0, 0, 0])
+        # How much to increment the counter, affects how soon we will switch to the next period entry in the table
+        # These are 16-bit values
+        self.vibrato_increment: List[int] = [0, 0, 0, 0]
+        self.vibrato_counter: List[int] = [0, 0, 0, 0]
+        # Low byte of note period will be taken from this table at each frame
+        self.vibrato_table: List[bytearray] = [bytearray(8), bytearray(8), bytearray(8), bytearray(8)]
+
+        # Notes in the triangle channel can be played one octave higher
+        self.triangle_octave: bool = False
+
+        # Values that will be written to the four registers of each channel
+        self.registers: List[bytearray] = [bytearray(reg_mask[c][0:4]) for c in range(4)]
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def initial_writes(self) -> List[Tuple[int, int]]:
+        """
+        Returns
+        -------
+        List[Tuple[int, int]]
+            The register writes that initialise the APU before playback, i.e. the register masks
+        """
+        writes = []
+        for c in range(4):
+            for r in range(4):
+                # The triangle and noise channels do not use register 1
+                if r == 1 and c > _PULSE_1:
+                    continue
+                writes.append((0x4000 + (c << 2) + r, self.reg_mask[c][r]))
+        return writes
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def seek(self, channel: int, element: int, timeline: Optional["TrackTimeline"] = None) -> None:
+        """
+        Starts playback from the given element of a channel, keeping the other channels in sync.
+        If the element is after the end of the track (i.e. after a rewind), playback starts from the beginning.
+
+        Parameters
+        ----------
+        channel: int
+            Index of the channel
+        element: int
+            Index of the element in that channel's track
+        timeline: Optional[TrackTimeline]
+            Index of the same track data; if not specified, a new one is created
+        """
+        if timeline is None:
+            timeline = TrackTimeline(self.tracks, self.instruments, self.period_lo, self.period_hi, self.reg_mask)
+
+        target_frame = timeline.element_frame(channel, element)
+        if target_frame < 1:
+            return
+
+        discard: List[Tuple[int, int]] = []
+        for c in range(4):
+            # Start from the last checkpoint before the target, then play the rest of the note / rest
+            frame, state = timeline.checkpoint(c, target_frame)
+            self.restore_channel(c, state)
+            for _ in range(target_frame - frame):
+                self._step_channel(c, discard)
+
+        self.frame = target_frame
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def _read_elements(self, c: int) -> None:
+        """
+        Reads data elements for a channel until a note or a rest is found
+        """
+        registers = self.registers[c]
+        track = self.tracks[c]
+        count = 0
+
+        while self.counter[c] < 1:
+            count += 1
+            if count > len(track):
+                # Endless loop: there are no notes or rests after the rewind point, so just keep the channel silent
+                registers[0:4] = self.reg_mask[c][0:4]
+                self.envelope_triggers[c][0:3] = bytes(3)
+                self.note_volume[c] = 0
+                self.counter[c] = 0xFF
+                self.parked[c] = True
+                break
+
+            track_data = track[self.position[c]]
+
+            # Go from the most to least common
+            if track_data.raw[0] < 0xF0:        # NOTE
+                if c == _NOISE:
+                    registers[2] = track_data.raw[0] & 0x0F
+                    registers[0] = self.reg_mask[c][0]
+                    # Note: the noise channel has no vibrato
+
+                else:
+                    note_index = track_data.raw[0]
+                    if c == _TRIANGLE and self.triangle_octave:
+                        note_index += 12
+                    period_lo = self.period_lo[note_index]
+                    period_hi = self.period_hi[note_index]
+
+                    # Do the same vibrato calculations done by the game's music engine
+                    # Basically, it creates a table of 8 values for the low byte of the note period, and cycles
+                    # through them at a rate that depends on the vibrato speed ("increment" value)
+                    vibrato_value = (period_lo >> 3) | ((period_hi & 0x03) << 5)
+                    offset = vibrato_value // self.vibrato_factor[c] if self.vibrato_factor[c] > 0 else 0
+
+                    # Timer High register value is written as-is
+                    registers[3] = period_hi
+
+                    table = self.vibrato_table[c]
+                    # Put the low byte in the vibrato table, positions 0 and 4
+                    table[0] = table[4] = period_lo
+                    # Entries 1 and 3 add the offset
+                    table[1] = table[3] = (period_lo + offset) % 256
+                    # Entry 2 adds the offset again
+                    table[2] = (table[3] + offset) % 256
+                    # Entries 5 and 7 subtract the offset instead
+                    table[5] = table[7] = (period_lo - offset) % 256
+                    # Finally entry 6 subtracts it again
+                    table[6] = (table[5] - offset) % 256
+
+                duration = track_data.raw[1]
+                size = self.envelope_size[c]
+                triggers = self.envelope_triggers[c]
+
+                # Setting the counter will end the "event reading" loop
+                self.counter[c] = duration
+
+                # Now we set "trigger points" for the instrument's envelope
+
+                # Trigger 0 is the note duration
+                triggers[0] = duration
+
+                # Trigger 1 is trigger 0 - the size of envelope 0
+                # This means just enough time to play all the values in env.0 before we switch to env.1
+                triggers[1] = duration - size[0] if duration > size[0] else 0
+
+                # Trigger 2
+                trigger = triggers[1] - size[2] if triggers[1] > size[2] else 0
+                if trigger > size[1]:
+                    trigger = size[1]
+                triggers[2] = triggers[1] - trigger
+
+                self.note_volume[c] = self.channel_volume[c]
+
+            elif track_data.control == _REST:
+                # The "data read" loop should end after setting this
+                self.counter[c] = track_data.raw[1]
+
+                # This should effectively mute the channel
+                registers[0:4] = self.reg_mask[c][0:4]
+
+                # Skip all the envelope trigger stuff, it has no effect anyway...
+                triggers = self.envelope_triggers[c]
+                triggers[0] = track_data.raw[1]
+                triggers[1] = 0
+                triggers[2] = 0
+
+                self.note_volume[c] = 0
+
+            elif track_data.control == _SELECT_INSTRUMENT:
+                instrument = self.instruments[track_data.raw[1]]
+                self.channel_instrument[c] = instrument
+
+                # Store each envelope's size, it will be used to calculate trigger points when a note is played
+                self.envelope_size[c][0:3] = bytes([instrument.size(0), instrument.size(1), instrument.size(2)])
+
+            elif track_data.control == _CHANNEL_VOLUME:
+                self.channel_volume[c] = self.note_volume[c] = track_data.raw[1]
+
+            elif track_data.control == _SET_VIBRATO:
+                # There is no vibrato for the noise channel
+                if c != _NOISE:
+                    if c == _TRIANGLE:
+                        # +12 semitones if value is not FF
+                        self.triangle_octave = track_data.raw[1] < 0xFF
+
+                    self.vibrato_factor[c] = track_data.raw[3]
+
+                    if track_data.raw[2] < 2:
+                        # Disable vibrato if speed is less than 2
+                        self.vibrato_increment[c] = 0
+                        self.vibrato_counter[c] = 0
+                    else:
+                        self.vibrato_increment[c] = 0x0800 // track_data.raw[2]
+                        self.vibrato_counter[c] = 0x0200
+
+            elif track_data.control == _REWIND:
+                self.position[c] = track_data.loop_position - 1
+
+            self.position[c] += 1
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def _envelope_value(self, c: int) -> int:
+        """
+        Returns
+        -------
+        int
+            The value from the instrument's envelopes for the current frame of the note playing on a channel:
+            bits 7-6 = duty, bits 5-1 = volume table to use, bit 0 ignored
+        """
+        instrument = self.channel_instrument[c]
+        if instrument is None:
+            # No instrument selected yet
+            return 0
+
+        counter = self.counter[c]
+        triggers = self.envelope_triggers[c]
+        size = self.envelope_size[c]
+
+        if counter >= triggers[1]:
+            envelope = 0
+        elif counter >= triggers[2]:
+            envelope = 1
+        else:
+            envelope = 2
+
+        # Index within the envelope is: trigger - remaining note duration
+        index = (triggers[envelope] - counter) + 1
+        if index < 0:
+            # The counter is not tied to a note (e.g. a silenced channel): there is nothing to play
+            return 0
+        if index > size[envelope]:
+            index = size[envelope]
+
+        return instrument.envelope[envelope][index]
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def step_frame(self) -> List[Tuple[int, int]]:
+        """
+        Advances playback by one frame
+
+        Returns
+        -------
+        List[Tuple[int, int]]
+            The (address, value) APU register writes for this frame
+        """
+        writes: List[Tuple[int, int]] = []
+
+        for c in range(4):
+            self._step_channel(c, writes)
+
+        self.frame += 1
+
+        return writes
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def _step_channel(self, c: int, writes: List[Tuple[int, int]]) -> None:
+        """
+        Advances one channel by one frame, adding its register writes to the given list
+        """
+        if self.parked[c]:
+            return
+
+        registers = self.registers[c]
+        mask = self.reg_mask[c]
+        address = 0x4000 + (c << 2)
+
+        # Note that a counter of 0 or 1 means we immediately read the next elements
+        self.counter[c] -= 1
+        if self.counter[c] < 1:
+            self._read_elements(c)
+
+            if self.parked[c]:
+                # Silence the channel once, then stop processing it
+                writes.append((address, registers[0]))
+                writes.append((address + 2, registers[2]))
+                writes.append((address + 3, registers[3]))
+                return
+
+        # Note/Rest found or still playing one: generate / manipulate sound
+        if self.counter[c] > 1:
+            if c != _NOISE:
+                # Use vibrato table and counters to set the Timer Low register
+                # The value for timer high was written when the note was read, and is not modified here
+                self.vibrato_counter[c] += self.vibrato_increment[c]
+                registers[2] = self.vibrato_table[c][(self.vibrato_counter[c] >> 8) & 0x07]
+
+            # Use instrument envelopes and channel volume to control register 0
+            value = self._envelope_value(c)
+
+            if c == _TRIANGLE:
+                # The Triangle channel has no volume: it will be turned off unless "volume" is 15
+                registers[0] = value if self.note_volume[c] == 0xF else 0x80
+                writes.append((address, (registers[0] & 0x8C) | mask[0]))
+            else:
+                # Instead of calculating the output based on the envelope and channel volume, use lookup tables
+                registers[0] = (value & 0xC0) | _ENV_TABLE[(value & 0x1F) >> 1][self.note_volume[c]]
+                writes.append((address, registers[0] | mask[0]))
+
+            # Register 1 is not used
+            writes.append((address + 2, registers[2]))
+            writes.append((address + 3, registers[3]))
+
+        elif c == _TRIANGLE:
+            # The triangle channel is muted on the last frame of any note
+            registers[0] = 0x80
+            writes.append((address, (registers[0] & 0x8C) | mask[0]))
+            writes.append((address + 2, registers[2]))
+            writes.append((address + 3, registers[3]))
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def _skip_element(self, c: int) -> int:
+        """
+        Plays a channel until the end of its next note or rest, without producing any output.
+        Only the first and last frames are actually processed: the effect of the others on the vibrato counter is
+        calculated directly.
+
+        Returns
+        -------
+        int
+            The number of frames skipped
+        """
+        discard: List[Tuple[int, int]] = []
+
+        self._step_channel(c, discard)
+        if self.parked[c]:
+            # Nothing left to play: the channel stays silent forever
+            return self.counter[c]
+
+        duration = self.counter[c]
+
+        if duration > 2:
+            self.vibrato_counter[c] += self.vibrato_increment[c] * (duration - 3)
+            self.counter[c] = 3
+            self._step_channel(c, discard)
+        if duration > 1:
+            self._step_channel(c, discard)
+
+        return max(duration, 1)
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def save_channel(self, c: int) -> Tuple:
+        """
+        Returns
+        -------
+        Tuple
+            A copy of the playback state of a channel, which can be restored with restore_channel()
+        """
+        return (self.position[c], self.counter[c], self.channel_volume[c], self.note_volume[c],
+                self.channel_instrument[c], bytes(self.envelope_size[c]), bytes(self.envelope_triggers[c]),
+                self.vibrato_factor[c], self.vibrato_increment[c], self.vibrato_counter[c],
+                bytes(self.vibrato_table[c]), bytes(self.registers[c]),
+                self.triangle_octave if c == _TRIANGLE else None, self.parked[c])
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def restore_channel(self, c: int, state: Tuple) -> None:
+        (self.position[c], self.counter[c], self.channel_volume[c], self.note_volume[c],
+         self.channel_instrument[c], envelope_size, envelope_triggers,
+         self.vibrato_factor[c], self.vibrato_increment[c], self.vibrato_counter[c],
+         vibrato_table, registers, triangle_octave, self.parked[c]) = state
+
+        self.envelope_size[c][:] = envelope_size
+        self.envelope_triggers[c][:] = envelope_triggers
+        self.vibrato_table[c][:] = vibrato_table
+        self.registers[c][:] = registers
+        if c == _TRIANGLE:
+            self.triangle_octave = triangle_octave
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+
+class TrackTimeline:
+    """
+    Frame index of a track, used to start playback from any point without replaying everything before it.
+
+    For each channel, it stores the frame at which each element would start playing during the first pass (the sum of
+    the durations of the notes and rests before it), and a checkpoint with the channel's playback state at the start
+    of each note or rest. Checkpoints past the end of the track, i.e. after its rewind, are added only when needed.
+    The timeline must be created again if the track data or the instruments change.
+    """
+
+    def __init__(self, tracks: Sequence[Sequence], instruments: Sequence, period_lo: Sequence[int],
+                 period_hi: Sequence[int], reg_mask: Sequence[Sequence[int]]):
+        # Used to generate checkpoints, one channel at a time
+        self._sequencer = MusicSequencer(tracks, instruments, period_lo, period_hi, reg_mask)
+
+        # For each channel, the first frame of each element, -1 for elements that are only reached after a rewind
+        self._element_frames: List[List[int]] = []
+        for track in tracks:
+            frames = []
+            frame = 0
+            for e in track:
+                frames.append(frame)
+                if e.control == _REWIND:
+                    frame = -1
+                elif frame > -1 and (e.control == _REST or e.raw[0] < 0xF0):
+                    frame += e.raw[1]
+            self._element_frames.append(frames)
+
+        # For each channel: start frame of each checkpoint, and the corresponding playback state
+        self._frames: List[List[int]] = [[0], [0], [0], [0]]
+        self._states: List[List[Tuple]] = [[self._sequencer.save_channel(c)] for c in range(4)]
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def element_frame(self, channel: int, element: int) -> int:
+        """
+        Returns
+        -------
+        int
+            The frame at which an element starts during the first pass, or -1 if it is never reached before the track
+            rewinds
+        """
+        try:
+            return self._element_frames[channel][element]
+        except IndexError:
+            return -1
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def checkpoint(self, channel: int, frame: int) -> Tuple[int, Tuple]:
+        """
+        Parameters
+        ----------
+        channel: int
+            Index of the channel
+        frame: int
+            Frame that playback should start from
+
+        Returns
+        -------
+        Tuple[int, Tuple]
+            The frame of the last checkpoint at or before the given one, and the channel's state at that checkpoint
+        """
+        frames = self._frames[channel]
+        states = self._states[channel]
+
+        # Unroll the track until the requested frame
+        if frames[-1] <= frame:
+            sequencer = self._sequencer
+            sequencer.restore_channel(channel, states[-1])
+            last = frames[-1]
+            while last <= frame:
+                last += sequencer._skip_element(channel)
+                frames.append(last)
+                states.append(sequencer.save_channel(channel))
+
+        index = bisect_right(frames, frame) - 1
+        return frames[index], states[index]
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+
+class FrameClock:
+    """
+    Paces a loop at the NTSC frame rate using the monotonic clock.
+
+    Deadlines are computed from the start time, so errors in sleep() do not accumulate. If the loop falls behind, the
+    following frames are run without waiting until it catches up; if it falls too far behind, the clock restarts from
+    the current time instead of playing a burst of frames.
+    """
+
+    def __init__(self, interval: float = FRAME_INTERVAL, max_lag: int = 8):
+        """
+        Parameters
+        ----------
+        interval: float
+            Duration of a frame, in seconds
+        max_lag: int
+            Number of frames the loop can fall behind before the clock is restarted
+        """
+        self.interval: float = interval
+        self.max_lag: float = interval * max_lag
+        self._start: float = time.monotonic()
+        self._frames: int = 0
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def start(self) -> None:
+        self._start = time.monotonic()
+        self._frames = 0
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def wait(self) -> bool:
+        """
+        Waits until it is time to run the next frame
+
+        Returns
+        -------
+        bool
+            False if the loop was too far behind and some time had to be skipped, True otherwise
+        """
+        self._frames += 1
+        delay = (self._start + (self._frames * self.interval)) - time.monotonic()
+
+        if delay > 0:
+            time.sleep(delay)
+        elif -delay > self.max_lag:
+            self.start()
+            return False
+
+        return True
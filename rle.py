@@ -11,6 +11,9 @@ FF	                End of compressed data
 __author__ = "Fox Cunning"
 __credits__ = ["Fox Cunning", "Derrick Sobodash <derrick@sobodash.com>"]
 
+import re
+from typing import List, Tuple, Union
+
 
 class RLE:
 
@@ -18,43 +21,65 @@ class RLE:
         pass
 
 
+# --- find_runs() ---
+
+_RUN_PATTERN = re.compile(rb"(.)\1*", re.DOTALL)
+
+
+def find_runs(data: Union[bytes, bytearray]) -> List[Tuple[int, int]]:
+    """Splits data into runs of identical bytes
+
+    Parameters
+    ----------
+    data: Union[bytes, bytearray]
+        Data to analyse
+
+    Returns
+    -------
+    List[Tuple[int, int]]
+        A list of (start, end) positions, one per run
+    """
+    return [match.span() for match in _RUN_PATTERN.finditer(data)]
+
+
 # --- encode() ---
 
-def encode(data: bytearray) -> bytearray:
+def encode(data: bytearray, optimal: bool = False) -> bytearray:
     """Encode data into RLE compressed format
 
     Parameters
     ----------
     data: bytearray
         A bytearray containing the data to be encoded
+    optimal: bool
+        If True, choose where to use runs and literal sequences so that the output is as small as possible,
+        instead of using the default rule (runs of 3 or more bytes are always encoded as runs)
 
     Returns
     -------
     bytearray
         A bytearray containing the RLE encoded data
     """
-    output = bytearray()
-
-    run = bytearray()
+    data = bytes(data)
 
-    running = False
+    if optimal:
+        return _encode_optimal(data)
 
-    i = 0
-    while i < len(data):
-        value = data[i]
+    output = bytearray()
 
-        last = i
-        count = 0
+    # Start of the pending sequence of literals, -1 if there is none
+    literal = -1
 
-        while i < len(data) and data[i] == value:
-            count = count + 1
-            i = i + 1
+    for start, end in find_runs(data):
+        count = end - start
 
         if count > 2:
-            if running:
-                output.append(0x80 + len(run))
-                output = output + run
+            if literal > -1:
+                output.append(0x80 + start - literal)
+                output.extend(data[literal:start])
+                literal = -1
 
+            value = data[start]
             while count > 0x7F:
                 output.append(0x7F)
                 output.append(value)
@@ -63,84 +88,153 @@ def encode(data: bytearray) -> bytearray:
             output.append(count)
             output.append(value)
 
-            running = False
+        elif literal == -1:
+            literal = start
 
-        else:
-            if running is False:
-                run = bytearray(data[last:i])
-                running = True
+        elif start - literal > 0xFC - 0x80:
+            # Sequence is full: write it and start a new one with these bytes
+            output.append(0x80 + start - literal)
+            output.extend(data[literal:start])
+            literal = start
 
-            else:
-                if len(run) > 0xFC - 0x80:
-                    output.append(0x80 + len(run))
-                    output = output + run
-                    running = False
+    if literal > -1:
+        output.append(0x80 + len(data) - literal)
+        output.extend(data[literal:])
 
-                else:
-                    run = run + bytearray(data[last:i])
+    # Add terminator character
+    output.append(0xFF)
 
-    if running:
-        output.append(0x80 + len(run))
-        output = output + run
+    return output
+
+
+# --- _encode_optimal() ---
+
+def _encode_optimal(data: bytes) -> bytearray:
+    """Encodes data choosing runs and literal sequences so that the output has the minimum size
+
+    Working backwards, the cost of encoding data[i:] is the smallest of:
+    - a run from i, as long as possible (up to 127 bytes), plus the cost of what follows;
+    - a sequence of 1 to 126, or exactly 256, literals plus the cost of what follows.
+    """
+    length = len(data)
+
+    # Length of the run of identical bytes starting at each position
+    run_length = [0] * length
+    for start, end in find_runs(data):
+        for i in range(start, end):
+            run_length[i] = end - i
+
+    # cost[i] = bytes needed to encode data[i:], choice[i] = > 0 for a run, < 0 for a sequence of literals
+    cost = [0] * (length + 1)
+    # total[i] = i + cost[i], so that the cheapest sequence of literals can be found with a single min()
+    total = [length] * (length + 1)
+    choice = [0] * length
+
+    for i in range(length - 1, -1, -1):
+        count = min(run_length[i], 0x7F)
+        best = 2 + cost[i + count]
+        best_choice = count
+
+        remainder = total[i + 1:i + 0x7E + 1]
+        cheapest = min(remainder)
+        if cheapest + 1 - i < best:
+            best = cheapest + 1 - i
+            best_choice = -(remainder.index(cheapest) + 1)
+
+        if i + 256 <= length and total[i + 256] + 1 - i < best:
+            best = total[i + 256] + 1 - i
+            best_choice = -256
+
+        cost[i] = best
+        total[i] = i + best
+        choice[i] = best_choice
+
+    output = bytearray()
+    i = 0
+    while i < length:
+        if choice[i] > 0:
+            output.append(choice[i])
+            output.append(data[i])
+            i = i + choice[i]
+        else:
+            count = -choice[i]
+            output.append(0x80 + (count & 0x7F))
+            output.extend(data[i:i + count])
+            i = i + count
 
-    # Add terminator character
     output.append(0xFF)
 
     return output
 
 
-# --- decode() ---
+# --- decode_stream() ---
 
-def decode(data: bytearray) -> bytearray:
-    """Decode RLE compressed data
+def decode_stream(data: Union[bytes, bytearray, memoryview], size: int) -> Tuple[bytearray, int]:
+    """Decode RLE compressed data, stopping at the terminator or when the expected amount of data has been produced
 
     Parameters
     ----------
-    data: bytearray
-        Bytes to decode
+    data: Union[bytes, bytearray, memoryview]
+        Compressed data; this can be a view of the ROM extending past the end of the actual stream
+    size: int
+        Expected size of the uncompressed data, e.g. 2048 for maps
 
     Returns
     -------
-    bytearray
-        A bytearray containing the decompressed data
+    Tuple[bytearray, int]
+        The decompressed data (at most 'size' bytes), and the number of compressed bytes consumed, including
+        the terminator if one was found
     """
-
     output = bytearray()
+    end = len(data)
 
     i = 0
-    for _ in range(0, len(data)):
-        control = data[i] & 0xFF
+    while i < end:
+        control = data[i]
+        i = i + 1
 
-        if control < 0x80:
-            # Read next byte
-            i = i + 1
-            value = data[i] & 0xFF
+        if control == 0xFF:
+            break
 
-            # then write it to the output 'control' times
-            for o in range(0, control):
-                output.append(value)
+        if len(output) >= size:
+            # No terminator where we expected one
+            i = i - 1
+            break
 
-            i = i + 1
+        if control < 0x80:
+            if i >= end:
+                break
 
-        elif control == 0x80:
-            # Read next 256 bytes and write them to output
-            count = 256
+            # Read next byte, then write it to the output 'control' times
+            output.extend(bytes((data[i],)) * control)
             i = i + 1
-            for o in range(i, i + count):
-                value = data[o] & 0xFF
-                output.append(value)
-            i = i + count
 
-        elif control < 0xFF:
-            # Read the next 'control - 128' bytes and copy them to output
-            count = control - 128
-            i = i + 1
-            for o in range(i, i + count):
-                value = data[o] & 0xFF
-                output.append(value)
+        else:
+            # Read the next 'control - 128' bytes (or 256 if control is 0x80) and copy them to output
+            count = 256 if control == 0x80 else control - 128
+            output.extend(data[i:i + count])
             i = i + count
 
-        else:
-            break
+    if len(output) > size:
+        del output[size:]
 
-    return output
+    return output, min(i, end)
+
+
+# --- decode() ---
+
+def decode(data: bytearray) -> bytearray:
+    """Decode RLE compressed data
+
+    Parameters
+    ----------
+    data: bytearray
+        Bytes to decode
+
+    Returns
+    -------
+    bytearray
+        A bytearray containing the decompressed data
+    """
+    # Each input byte can produce at most 127 output bytes
+    return decode_stream(data, len(data) * 127)[0]
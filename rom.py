@@ -1,11 +1,13 @@
 __author__ = "Fox Cunning"
 
 # import sys
-from array import array
-from typing import Union, List
+import mmap
+import os
+from typing import Union, List, Set, Dict
 
 from PIL import Image
 
+from bank_allocator import BankAllocator
 from debug import log
 
 
@@ -22,6 +24,45 @@ feature_names = ["custom map colours",
                  "map tilesets"]
 
 
+# Granularity of the dirty-range tracking, in bytes
+_PAGE_SIZE = 4096
+
+# IPS patches can't describe records longer than this
+_IPS_MAX_RECORD = 0xFFFF
+
+# Lookup table for decoding 2bpp patterns: each bit of a bit-plane byte is spread into its own byte of a 64-bit value,
+# most significant bit first, so that a whole line of pixels can be combined with a single OR
+_SPREAD = [int.from_bytes(bytes([(b >> (7 - p)) & 1 for p in range(8)]), "big") for b in range(256)]
+
+# Used to encode 2bpp patterns: the mask isolates one bit of each pixel in a 64-bit line, and the multiplication gathers
+# those eight bits into the top byte
+_PLANE_MASK = 0x0101010101010101
+_GATHER = 0x0102040810204080
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+
+def _decode_pattern(data: Union[bytes, bytearray], start: int) -> bytes:
+    """
+    Decodes a 2bpp 8x8 pattern
+
+    Parameters
+    ----------
+    data: Union[bytes, bytearray]
+        Buffer containing the pattern
+    start: int
+        Offset of the pattern's first byte in the buffer
+
+    Returns
+    -------
+    bytes
+        64 colour indices (0-3), one per pixel
+    """
+    # Combine the two planes, one line at a time
+    return b"".join([(_SPREAD[data[start + row]] | (_SPREAD[data[start + row + 8]] << 1)).to_bytes(8, "big")
+                     for row in range(8)])
+
+
 # ----------------------------------------------------------------------------------------------------------------------
 
 class ROM:
@@ -36,15 +77,31 @@ class ROM:
         File size, in bytes
     trainer_size: int
         Size of the trainer, if any, in bytes
+    memory_mapped: bool
+        True if the ROM file is memory-mapped instead of being entirely buffered in memory
     """
     # --- constructor ---
 
     def __init__(self):
         self._romFile = None
         self.path: str = ""
-        self._buf = []
+        self._buf: Union[bytearray, mmap.mmap] = bytearray()
         self.size: int = 0
         self.trainer_size: int = 0
+        self.memory_mapped: bool = False
+
+        # Indices of the pages that have been modified since the ROM was opened or last saved to its own file
+        self._dirty_pages: Set[int] = set()
+
+        # Decoded 8x8 patterns, indexed by their offset in the ROM file
+        self._pattern_cache: Dict[int, bytes] = {}
+
+        # Number of times each bank has been written to since the ROM was opened, so that editors can tell when
+        # their own cached data (e.g. pre-rendered tiles) needs to be rebuilt
+        self._generations: Dict[int, int] = {}
+
+        # Free space management, shared by all the editors
+        self.allocator: BankAllocator = BankAllocator()
 
         self._features = {"custom map colours": False,  # True if the ROM has a table with custom map colours
                           "extra map flags": False,     # True if the ROM supports Continent and Guards flags per map
@@ -61,7 +118,7 @@ class ROM:
 
     # ------------------------------------------------------------------------------------------------------------------
 
-    def open(self, file_name: str) -> any:
+    def open(self, file_name: str, memory_map: bool = False) -> any:
         """
         Opens a ROM file
 
@@ -69,6 +126,9 @@ class ROM:
         ----------
         file_name: str
             Full path of the file
+        memory_map: bool
+            If True, map the file in memory instead of reading all of it. Changes are kept private until saved, and
+            saving to the same file will only write the pages that have been modified.
 
         Returns
         -------
@@ -78,18 +138,30 @@ class ROM:
         self.close()
         try:
             self._romFile = open(file_name, "rb+")
+
+            if memory_map:
+                # Copy-on-write mapping: edits never reach the file until save() is called
+                self._buf = mmap.mmap(self._romFile.fileno(), 0, access=mmap.ACCESS_COPY)
+            else:
+                # Buffer the whole file
+                self._buf = bytearray(self._romFile.read())
+
         except OSError as err:
+            if self._romFile is not None:
+                self._romFile.close()
             self._romFile = None
             return err
         except Exception as err:
+            if self._romFile is not None:
+                self._romFile.close()
             self._romFile = None
             return err  # sys.exc_info()[0]
 
-        # Buffer the whole file
-        self._buf = array('B', self._romFile.read())
+        self.memory_mapped = memory_map
         self.path = file_name
         self.size = len(self._buf)
         self._romFile.close()
+        self._romFile = None
 
         # Detect features
 
@@ -161,7 +233,18 @@ class ROM:
         if self._romFile is not None:
             self._romFile.close()
             self._romFile = None
-        self._buf = []
+        if self.memory_mapped:
+            try:
+                self._buf.close()
+            except BufferError:
+                # Some views are still alive: the mapping will be released when they are garbage-collected
+                pass
+        self._buf = bytearray()
+        self.memory_mapped = False
+        self._dirty_pages.clear()
+        self._pattern_cache.clear()
+        self._generations.clear()
+        self.allocator.clear()
         self.size = 0
         self.trainer_size = 0
         self.path = ""
@@ -198,9 +281,10 @@ class ROM:
             The value to write
         """
         offset = self._get_offset(bank, address)
-        value = word.to_bytes(2, "little")
-        self._buf[offset] = int(value[0])
-        self._buf[offset + 1] = int(value[1])
+        if offset > self.size - 2:
+            raise Exception("Address/ bank out of range")
+        self._buf[offset:offset + 2] = word.to_bytes(2, "little")
+        self._mark_dirty(offset, offset + 2)
 
     # ------------------------------------------------------------------------------------------------------------------
 
@@ -219,6 +303,7 @@ class ROM:
         """
         offset = self._get_offset(bank, address)
         self._buf[offset] = (byte & 0xFF)
+        self._mark_dirty(offset, offset + 1)
 
     # ------------------------------------------------------------------------------------------------------------------
 
@@ -236,8 +321,12 @@ class ROM:
             The data to be written
         """
         offset = self._get_offset(bank, address)
-        for i in range(0, len(data)):
-            self._buf[offset + i] = data[i]
+        end = offset + len(data)
+        # Check bounds once: slice assignment past the end would silently grow the buffer
+        if end > self.size:
+            raise Exception("Address/ bank out of range")
+        self._buf[offset:end] = data
+        self._mark_dirty(offset, end)
 
     # ------------------------------------------------------------------------------------------------------------------
 
@@ -284,12 +373,40 @@ class ROM:
             A byte array containing the values read from bank:address
         """
         ofs = self._get_offset(bank, address)
-        output = bytearray()
-        while ofs < self.size and count > 0:
-            output.append(self._buf[ofs])
-            ofs = ofs + 1
-            count = count - 1
-        return output
+        # Slicing gives a new, independent copy, clamped to the end of the file
+        data = self._buf[ofs:ofs + max(count, 0)]
+        # Memory-mapped files return immutable bytes
+        return bytearray(data) if self.memory_mapped else data
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def read_view(self, bank: int, address: int, count: int = -1) -> memoryview:
+        """
+        Returns a read-only view of the ROM buffer starting from the desired bank:address, without copying any data.
+        Useful for decoders and other code that only needs to scan the data once.
+
+        Note that the view reflects any subsequent writes to the ROM buffer: use read_bytes() to get a copy instead.
+
+        Parameters
+        ----------
+        bank: int
+            ROM Bank number
+        address: int
+            Address in ROM
+        count: int
+            The number of bytes to include in the view; if negative, the view will extend to the end of the bank
+
+        Returns
+        -------
+        memoryview
+            A read-only view of the requested portion of the ROM buffer
+        """
+        ofs = self._get_offset(bank, address)
+        if count < 0:
+            # Each bank is 16 KB, the last one being mapped at $C000
+            count = (0x10000 if bank == 0xF else 0xC000) - address
+
+        return memoryview(self._buf)[ofs:ofs + count].toreadonly()
 
     # ------------------------------------------------------------------------------------------------------------------
 
@@ -312,8 +429,7 @@ class ROM:
         ofs = self._get_offset(bank, address)
 
         if ofs < (self.size - 1):
-            value = bytearray([self._buf[ofs], self._buf[ofs + 1]])
-            return int.from_bytes(value, "little", signed=True)
+            return int.from_bytes(self._buf[ofs:ofs + 2], "little", signed=True)
         else:
             raise Exception("Address/ bank out of range")
 
@@ -337,39 +453,34 @@ class ROM:
         """
         ofs = self._get_offset(bank, address)
         if ofs < (self.size - 1):
-            lo = int(self._buf[ofs])
-            hi = int(self._buf[ofs + 1])
-            return (hi << 8) | (lo & 0xFF)
+            return self._buf[ofs] | (self._buf[ofs + 1] << 8)
         else:
             raise Exception("Address/ bank out of range")
 
     # ------------------------------------------------------------------------------------------------------------------
 
     def write_pattern(self, bank: int, address: int, pixels: Union[list, bytearray]) -> None:
-        # We need two offsets: one for each bit-plane
-        ofs_0 = self._get_offset(bank, address)
-        ofs_1 = ofs_0 + 8
-        if ofs_1 > self.size:
-            raise Exception("Address/ bank out of range")
-
-        plane_0 = plane_1 = count = 0
-        for c in pixels:
-            # Each entry is two bits, we put each bit into a separate 8-bit 'plane'
-            bit_0 = c & 0x1
-            bit_1 = (c >> 1) & 0x1
+        """
+        Encodes an 8x8 image into a 2bpp pattern and writes it to ROM
 
-            plane_0 = (plane_0 << 1) | bit_0
-            plane_1 = (plane_1 << 1) | bit_1
+        Parameters
+        ----------
+        bank: int
+            ROM Bank number
+        address: int
+            Address in ROM
+        pixels: Union[list, bytearray]
+            64 colour indices (0-3), one per pixel, row by row
+        """
+        planes = bytearray(16)
 
-            count += 1
-            if count == 8:
-                # We filled two 8-bit planes that make up a line of pixels
-                self._buf[ofs_0] = plane_0
-                ofs_0 += 1
-                self._buf[ofs_1] = plane_1
-                ofs_1 += 1
+        for row in range(8):
+            # Each byte of this 64-bit value is one pixel: gather bit 0 and bit 1 of each pixel into separate 'planes'
+            value = int.from_bytes(bytes(pixels[row << 3:(row << 3) + 8]), "big")
+            planes[row] = ((value & _PLANE_MASK) * _GATHER) >> 56 & 0xFF
+            planes[row + 8] = (((value >> 1) & _PLANE_MASK) * _GATHER) >> 56 & 0xFF
 
-                plane_0 = plane_1 = count = 0
+        self.write_bytes(bank, address, planes)
 
     # ------------------------------------------------------------------------------------------------------------------
 
@@ -414,26 +525,125 @@ class ROM:
         list
             Pattern data as a list of bytes
         """
-        plane_0 = []
-        plane_1 = []
-        pixels = []
-        # Read first plane (bit 0 of each pixel)
-        for _ in range(8):
-            plane_0.append(self.read_byte(bank, address))
-            address = address + 1
-        # Read second plane (bit 1 of each pixel)
-        for _ in range(8):
-            plane_1.append(self.read_byte(bank, address))
-            address = address + 1
-        # Combine the two planes
-        for index in range(8):
-            for _ in range(8):
-                bit_0 = (plane_0[index] & 0x80) != 0
-                bit_1 = (plane_1[index] & 0x80) != 0
-                plane_0[index] = plane_0[index] << 1
-                plane_1[index] = plane_1[index] << 1
-                pixels.append((bit_1 << 1) | bit_0)
-        return pixels
+        return list(self.read_patterns(bank, address, 1)[0])
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def read_patterns(self, bank: int, address: int, count: int) -> List[bytes]:
+        """
+        Reads pixel data from a sequence of consecutive 8x8 patterns stored in ROM.
+        Decoded patterns are cached until the ROM data they come from is modified.
+
+        Parameters
+        ----------
+        bank: int
+            ROM Bank number
+        address: int
+            Address of the first pattern
+        count: int
+            Number of patterns to read
+
+        Returns
+        -------
+        List[bytes]
+            One entry per pattern, each containing 64 colour indices (0-3)
+        """
+        ofs = self._get_offset(bank, address)
+        if ofs + (count << 4) > self.size:
+            raise Exception("Address/ bank out of range")
+
+        patterns = []
+        data = None
+        for p in range(count):
+            pixels = self._pattern_cache.get(ofs)
+
+            if pixels is None:
+                if data is None:
+                    data = self._buf[ofs:ofs + ((count - p) << 4)]
+                    data_ofs = ofs
+                pixels = _decode_pattern(data, ofs - data_ofs)
+                self._pattern_cache[ofs] = pixels
+
+            patterns.append(pixels)
+            ofs += 16
+
+        return patterns
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def _mark_dirty(self, start: int, end: int) -> None:
+        """
+        Records that the bytes between two offsets in the ROM file have been modified, and discards any cached data
+        that came from them
+
+        Parameters
+        ----------
+        start: int
+            Offset of the first modified byte
+        end: int
+            Offset of the byte after the last modified one
+        """
+        # Any pattern that starts within 15 bytes before the modified area overlaps it
+        cache = self._pattern_cache
+        if len(cache) > 0:
+            if end - start + 15 < len(cache):
+                for ofs in range(start - 15, end):
+                    cache.pop(ofs, None)
+            else:
+                for ofs in [o for o in cache if start - 16 < o < end]:
+                    del cache[ofs]
+
+        for bank in range(self._get_bank(start), self._get_bank(end - 1) + 1):
+            self._generations[bank] = self._generations.get(bank, 0) + 1
+
+        first = start // _PAGE_SIZE
+        last = (end - 1) // _PAGE_SIZE
+        if first == last:
+            self._dirty_pages.add(first)
+        else:
+            self._dirty_pages.update(range(first, last + 1))
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def _get_bank(self, offset: int) -> int:
+        return max(0, offset - 0x10 - self.trainer_size) >> 14
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def generation(self, bank: int) -> int:
+        """
+        Parameters
+        ----------
+        bank: int
+            ROM bank number
+
+        Returns
+        -------
+        int
+            A counter that increases every time data in the given bank is modified
+        """
+        return self._generations.get(bank, 0)
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def dirty_ranges(self) -> List[tuple]:
+        """
+        Returns
+        -------
+        List[tuple]
+            A sorted list of (start, end) offsets in the ROM file of the areas modified since the file was opened or
+            last saved; adjacent pages are merged into a single range
+        """
+        ranges = []
+        for page in sorted(self._dirty_pages):
+            start = page * _PAGE_SIZE
+            end = min(start + _PAGE_SIZE, self.size)
+            if len(ranges) > 0 and ranges[-1][1] == start:
+                ranges[-1] = (ranges[-1][0], end)
+            else:
+                ranges.append((start, end))
+
+        return ranges
 
     # ------------------------------------------------------------------------------------------------------------------
 
@@ -453,18 +663,88 @@ class ROM:
         """
         file = None
 
+        if file_name == '':
+            file_name = self.path
+
+        same_file = os.path.abspath(file_name) == os.path.abspath(self.path)
+
+        try:
+            if same_file and self.memory_mapped:
+                # Only write back the pages that have actually been modified
+                file = open(file_name, "rb+")
+
+                for start, end in self.dirty_ranges():
+                    file.seek(start)
+                    file.write(self._buf[start:end])
+
+            else:
+                file = open(file_name, "wb")
+
+                # file.write(bytes(self.header()))
+                file.write(self._buf)
+
+            file.close()
+
+        except OSError as error:
+            log(2, f"{self}", f"{error} whilst saving as '{file_name}'.")
+            if file is not None:
+                file.close()
+            return False
+
+        if same_file:
+            self._dirty_pages.clear()
+
+        return True
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def save_diff(self, file_name: str) -> bool:
+        """
+        Saves an IPS patch that restores the current ROM file to its contents on disk, using only the areas that have
+        been modified since it was last saved.
+        Call this *before* saving the ROM to its own file, to make a lightweight backup.
+
+        Parameters
+        ----------
+        file_name: str
+            Full path of the patch file to create
+
+        Returns
+        -------
+        bool
+            True on success, False otherwise
+        """
+        rom_file = None
+        file = None
+
         try:
+            rom_file = open(self.path, "rb")
             file = open(file_name, "wb")
 
-            # file.write(bytes(self.header()))
-            file.write(bytes(self._buf))
+            file.write(b"PATCH")
+
+            for start, end in self.dirty_ranges():
+                rom_file.seek(start)
+                original = rom_file.read(end - start)
+
+                # Split the range into records of the maximum allowed size
+                for offset in range(0, len(original), _IPS_MAX_RECORD):
+                    record = original[offset:offset + _IPS_MAX_RECORD]
+                    file.write((start + offset).to_bytes(3, "big"))
+                    file.write(len(record).to_bytes(2, "big"))
+                    file.write(record)
+
+            file.write(b"EOF")
 
             file.close()
+            rom_file.close()
 
         except OSError as error:
-            log(2, f"{self}", f"{error} whilst saving as '{file_name}'.")
+            log(2, f"{self}", f"{error} whilst saving patch as '{file_name}'.")
             if file is not None:
                 file.close()
+            if rom_file is not None:
+                rom_file.close()
             return False
 
         return True
@@ -509,7 +789,7 @@ class ROM:
         Image.Image
             The resulting image with colour 0 set as transparent
         """
-        pixels = bytes(bytearray(self.read_pattern(bank, address)))
+        pixels = self.read_patterns(bank, address, 1)[0]
         image = Image.frombytes('P', (8, 8), pixels)
         image.info['transparency'] = 0
         image.putpalette(colours)
@@ -3,13 +3,14 @@ __author__ = "Fox Cunning"
 import configparser
 import os
 import tkinter
-from typing import List, Union
+from typing import List, Union, Tuple
 
 from PIL import Image, ImageTk
 
 import appJar
 import colour
 from appJar import gui
+from bank_allocator import BankAllocator
 from debug import log
 from editor_settings import EditorSettings
 from rom import ROM
@@ -1119,25 +1120,43 @@ class TextEditor:
 
     class StringMemoryInfo:
         """
-        A helper class used to allocate memory for a compressed string
+        A helper class used to allocate memory for a compressed string, using two areas of the ROM's bank allocator
 
         Attributes
         ----------
-        special_first: int
-            The first available address for a special string
-        special_end: int
-            Boundary of the memory reserved to special strings
-        normal_first: int
-            The first available address for a normal string
-        normal_end: int
-            Boundary of the memory reserved to normal strings
+        allocator: BankAllocator
+            The shared allocator used to manage this memory
+        special_area: str
+            Name of the allocator area reserved to special strings
+        normal_area: str
+            Name of the allocator area reserved to normal strings
         """
 
-        def __init__(self):
-            self.special_first: int = 0x8200
-            self.special_end: int = 0x9B4F
-            self.normal_first: int = 0x9F4C
-            self.normal_end: int = 0xBBCF
+        def __init__(self, allocator: BankAllocator, bank: int = 0x5, name: str = "text",
+                     special: Tuple[int, int] = (0x8200, 0x9B4D), normal: Tuple[int, int] = (0x9F4C, 0xBBCD)):
+            """
+            Defines (or resets) the memory areas, with all their space free
+
+            Parameters
+            ----------
+            allocator: BankAllocator
+                The shared allocator
+            bank: int
+                ROM bank where the strings are stored
+            name: str
+                Prefix for the names of the two areas
+            special: Tuple[int, int]
+                First and last address of the memory reserved to special strings
+            normal: Tuple[int, int]
+                First and last address of the memory reserved to normal strings
+            """
+            self.allocator: BankAllocator = allocator
+            self.special_area: str = f"{name} special"
+            self.normal_area: str = f"{name} normal"
+
+            allocator.define_area(self.special_area, bank, [(special[0], special[1] + 1)])
+            allocator.define_area(self.normal_area, bank, [(normal[0], normal[1] + 1)])
+            self._normal_end: int = normal[1] + 1
 
         # ------------------------------------------------------------------------------------------------------------------
 
@@ -1158,71 +1177,36 @@ class TextEditor:
                 The address of the allocated area, or 0 if out of memory
             """
             if preference == "normal":
-                address = self._allocate_normal(size)
-                if address == 0:
-                    return self._allocate_special(size)
+                areas = [self.normal_area, self.special_area]
             else:
-                address = self._allocate_special(size)
-                if address == 0:
-                    return self._allocate_normal(size)
+                areas = [self.special_area, self.normal_area]
 
-            return address
+            for area in areas:
+                address = self.allocator.allocate(area, size)
+                if address > -1:
+                    return address
+
+            return 0
 
         # ------------------------------------------------------------------------------------------------------------------
 
-        def _allocate_special(self, size: int) -> int:
+        def extend_normal(self, last_address: int) -> None:
             """
-            Finds an area in ROM where a special compressed string can be stored
-
-            Parameters
-            ----------
-            size: int
-                Size in bytes of the memory area required
-
-            Returns
-            -------
-            int
-                8-bit address of the allocated memory area
+            Expands the memory reserved to normal strings up to the given address (inclusive)
             """
-            # Calculate potential end address
-            end = self.special_first + size
-            # Return 0 if out of bounds
-            if end >= self.special_end:
-                return 0
-
-            # Otherwise update first available address and return allocated address
-            address = self.special_first
-            self.special_first = end
-
-            return address
+            self.allocator.extend_area(self.normal_area, self._normal_end, last_address + 1)
+            self._normal_end = max(self._normal_end, last_address + 1)
 
         # ------------------------------------------------------------------------------------------------------------------
 
-        def _allocate_normal(self, size: int) -> int:
+        def unused_memory(self) -> List[Tuple[int, int]]:
             """
-            Finds an area in ROM where a dialogue compressed string can be stored
-
-            Parameters
-            ----------
-            size: int
-                Size in bytes of the memory area required
-
             Returns
             -------
-            int
-                8-bit address of the allocated memory area
+            List[Tuple[int, int]]
+                All the blocks that were not allocated, in both areas, as (start, end) tuples with end exclusive
             """
-            # Calculate potential end address
-            end = self.normal_first + size
-            # Return 0 if out of bounds
-            if end >= self.normal_end:
-                return 0
-
-            # Otherwise update first available address and return allocated address
-            address = self.normal_first
-            self.normal_first = end
-
-            return address
+            return self.allocator.free_blocks(self.special_area) + self.allocator.free_blocks(self.normal_area)
 
     # ------------------------------------------------------------------------------------------------------------------
 
@@ -1238,7 +1222,7 @@ class TextEditor:
         special_list = []
         dialogue_list = []
 
-        memory = TextEditor.StringMemoryInfo()
+        memory = TextEditor.StringMemoryInfo(self.rom.allocator)
 
         # Create two lists of strings to process
         for i in range(256):
@@ -1311,7 +1295,7 @@ class TextEditor:
                         return
 
                     # Try expanding the memory area
-                    memory.normal_end = 0xBC7F
+                    memory.extend_normal(0xBC7D)
                     new_address = memory.allocate_memory(len(packed_bytes), "normal")
 
                     # Check again
@@ -1363,12 +1347,11 @@ class TextEditor:
 
         # 5. Fill remaining space with 0xFF
 
-        for address in range(memory.special_first, memory.special_end + 1):
-            # Write 0xFF
-            self.rom.write_byte(0x5, address, 0xFF)
+        for start, end in memory.unused_memory():
+            self.rom.write_bytes(0x5, start, bytes([0xFF]) * (end - start))
 
-        for address in range(memory.normal_first, memory.normal_end + 1):
-            self.rom.write_byte(0x5, address, 0xFF)
+        self.info(f"Special text memory: {self.rom.allocator.fragmentation(memory.special_area)}.")
+        self.info(f"Dialogue text memory: {self.rom.allocator.fragmentation(memory.normal_area)}.")
 
         # --- Uncompressed text ---
 
@@ -1569,11 +1552,8 @@ class TextEditor:
 
         # The hacked ROM has some space reserved to pre-made character data, so it needs to use
         # our helper class
-        string_memory = TextEditor.StringMemoryInfo()
-        string_memory.normal_first = 0xA6C7
-        string_memory.normal_end = 0xA940
-        string_memory.special_first = 0xAA9A
-        string_memory.special_end = 0xAEC1
+        string_memory = TextEditor.StringMemoryInfo(self.rom.allocator, 0xC, "menu text",
+                                                    special=(0xAA9A, 0xAEBF), normal=(0xA6C7, 0xA93E))
 
         for i in range(41):
             # Convert text to nametable indices
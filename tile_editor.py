@@ -47,16 +47,11 @@ class TileEditor:
 
         # Undo / Redo
 
-        # We keep track of how many tiles are modified with a single operation, for the undo/redo manager
-        self._modified_pixels: int = 0
-
         # Last modified pixel, used to prevent unnecessary actions when drag-drawing
         self._last_edited: int = -1
 
+        # Pixels modified with a single operation are grouped into one undo/redo entry
         self._undo_redo: Optional[UndoRedo] = None
-        # These keep count of how many actions to process in each single undo/redo
-        self._undo_actions: List[int] = []
-        self._redo_actions: List[int] = []
 
     # ------------------------------------------------------------------------------------------------------------------
 
@@ -86,8 +81,6 @@ class TileEditor:
         self._colours = []
 
         self._undo_redo = None
-        self._undo_actions = []
-        self._redo_actions = []
 
     # ------------------------------------------------------------------------------------------------------------------
 
@@ -199,26 +192,18 @@ class TileEditor:
 
         elif widget == "TL_Move_Left":  # ------------------------------------------------------------------------------
             self._undo_redo(self._move_pixels, (7, 0), (1, 0), text="Move Image Left")
-            self._undo_actions.append(1)
-            self._redo_actions = []
             self._update_undo_buttons()
 
         elif widget == "TL_Move_Right":     # --------------------------------------------------------------------------
             self._undo_redo(self._move_pixels, (1, 0), (7, 0), text="Move Image Right")
-            self._undo_actions.append(1)
-            self._redo_actions = []
             self._update_undo_buttons()
 
         elif widget == "TL_Move_Up":    # ------------------------------------------------------------------------------
             self._undo_redo(self._move_pixels, (0, 7), (0, 1), text="Move Image Up")
-            self._undo_actions.append(1)
-            self._redo_actions = []
             self._update_undo_buttons()
 
         elif widget == "TL_Move_Down":  # ------------------------------------------------------------------------------
             self._undo_redo(self._move_pixels, (0, 1), (0, 7), text="Move Image Down")
-            self._undo_actions.append(1)
-            self._redo_actions = []
             self._update_undo_buttons()
 
         else:   # ------------------------------------------------------------------------------------------------------
@@ -296,8 +281,8 @@ class TileEditor:
 
         old_colour = self._pixels[pixel_index]
 
-        self._modified_pixels += 1
-
+        # Everything drawn until the button is released will be undone in one step
+        self._undo_redo.begin("Draw")
         self._undo_redo(self._change_pixel, (event.x, event.y, self._selected_colour),
                         (event.x, event.y, old_colour), text="Draw")
 
@@ -308,9 +293,7 @@ class TileEditor:
             self._flood_fill(event.x, event.y, self._selected_colour)
             return
 
-        self._undo_actions.append(self._modified_pixels)
-        self._redo_actions = []
-        self._modified_pixels = 0
+        self._undo_redo.commit()
         self._update_undo_buttons()
 
     # ------------------------------------------------------------------------------------------------------------------
@@ -332,7 +315,6 @@ class TileEditor:
 
         self._undo_redo(self._change_pixel, (event.x, event.y, self._selected_colour),
                         (event.x, event.y, old_colour), text="Draw")
-        self._modified_pixels += 1
 
     # ------------------------------------------------------------------------------------------------------------------
 
@@ -435,8 +417,9 @@ class TileEditor:
         index = x + (y << 3)
         old_clr = self._pixels[index]
 
+        # The whole area will be undone in one step
+        self._undo_redo.begin("Fill Area")
         self._undo_redo(self._change_pixel, (x << 4, y << 4, c), (x << 4, y << 4, old_clr), text="Fill Area")
-        self._modified_pixels += 1
 
         # Four-direction non-recursive flood-fill algorithm in a single non-nested loop
 
@@ -451,7 +434,6 @@ class TileEditor:
             if node_x >= 0 and self._pixels[index] == old_clr:
                 self._undo_redo(self._change_pixel, (node_x << 4, node_y << 4, c),
                                 (node_x << 4, node_y << 4, old_clr), text="Fill Area")
-                self._modified_pixels += 1
                 queue.append((node_x, node_y))
 
             # 1 Pixel to the right
@@ -462,7 +444,6 @@ class TileEditor:
             if node_x < 8 and self._pixels[index] == old_clr:
                 self._undo_redo(self._change_pixel, (node_x << 4, node_y << 4, c),
                                 (node_x << 4, node_y << 4, old_clr), text="Fill Area")
-                self._modified_pixels += 1
                 queue.append((node_x, node_y))
 
             # 1 Pixel down
@@ -473,7 +454,6 @@ class TileEditor:
             if node_y < 8 and self._pixels[index] == old_clr:
                 self._undo_redo(self._change_pixel, (node_x << 4, node_y << 4, c),
                                 (node_x << 4, node_y << 4, old_clr), text="Fill Area")
-                self._modified_pixels += 1
                 queue.append((node_x, node_y))
 
             # 1 Pixel up
@@ -484,38 +464,27 @@ class TileEditor:
             if node_y >= 0 and self._pixels[index] == old_clr:
                 self._undo_redo(self._change_pixel, (node_x << 4, node_y << 4, c),
                                 (node_x << 4, node_y << 4, old_clr), text="Fill Area")
-                self._modified_pixels += 1
                 queue.append((node_x, node_y))
 
-        self._undo_actions.append(self._modified_pixels)
-        self._redo_actions = []
-        self._modified_pixels = 0
+        self._undo_redo.commit()
         self._update_undo_buttons()
 
     # ------------------------------------------------------------------------------------------------------------------
 
     def _undo(self, _event=None) -> None:
-        try:
-            count = self._undo_actions.pop()
-        except IndexError:
+        if not self._undo_redo.can_undo():
             return
 
-        self._undo_redo.undo(count)
-
-        self._redo_actions.append(count)
+        self._undo_redo.undo()
         self._update_undo_buttons()
 
     # ------------------------------------------------------------------------------------------------------------------
 
     def _redo(self, _event=None) -> None:
-        try:
-            count = self._redo_actions.pop()
-        except IndexError:
+        if not self._undo_redo.can_redo():
             return
 
-        self._undo_redo.redo(count)
-
-        self._undo_actions.append(count)
+        self._undo_redo.redo()
         self._update_undo_buttons()
 
     # ------------------------------------------------------------------------------------------------------------------
@@ -590,14 +559,14 @@ class TileEditor:
     # ------------------------------------------------------------------------------------------------------------------
 
     def _update_undo_buttons(self) -> None:
-        if len(self._undo_actions) < 1:
+        if not self._undo_redo.can_undo():
             self.app.disableButton("TL_Undo")
             self.app.setButtonTooltip("TL_Undo", "Nothing to Undo")
         else:
             self.app.enableButton("TL_Undo")
             self.app.setButtonTooltip("TL_Undo", "Undo " + self._undo_redo.get_undo_text())
 
-        if len(self._redo_actions) < 1:
+        if not self._undo_redo.can_redo():
             self.app.disableButton("TL_Redo")
             self.app.setButtonTooltip("TL_Redo", "Nothing to Redo")
         else:
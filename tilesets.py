@@ -0,0 +1,117 @@
+__author__ = "Fox Cunning"
+
+from typing import Dict, List, Tuple
+
+from rom import ROM
+
+# Each entry in the substitution tables at $0A:B600 and $0B:B868 has the format:
+# source address (in the table's own bank), destination address in PPU, number of bytes to copy
+# Tile index is: (PPU address - $1A40) / 64
+# Number of tiles in this entry: (bytes to copy) / 64
+
+# Table entries applied for each map tileset, in order, as done by the subroutine at $0A:9D90
+_MAP_SUBSTITUTIONS: Dict[int, List[Tuple[int, int]]] = {
+    0: [(0xA, 0xB606), (0xA, 0xB60C), (0xA, 0xB636), (0xA, 0xB63C)],                # Continent 1 (e.g. Sosaria)
+    1: [(0xA, 0xB612), (0xA, 0xB618), (0xA, 0xB636), (0xA, 0xB63C),
+        (0xA, 0xB654), (0xA, 0xB630)],                                              # Continent 2 (e.g. Ambrosia)
+    2: [(0xA, 0xB61E), (0xA, 0xB64E), (0xA, 0xB624), (0xA, 0xB642)],                # Castle 1 (e.g. Castle British)
+    3: [(0xA, 0xB61E), (0xA, 0xB65A), (0xA, 0xB64E), (0xA, 0xB642)],                # Castle 2 (e.g. Castle Exodus)
+}
+
+# Towns, and any other tileset index
+_DEFAULT_SUBSTITUTIONS: List[Tuple[int, int]] = [(0xA, 0xB642)]
+
+# Battlefields use the same substitutions as towns, then further ones from bank $0B
+_BATTLEFIELD_SUBSTITUTIONS: List[Tuple[int, int]] = [(0xA, 0xB642), (0xB, 0xB868), (0xB, 0xB86E), (0xB, 0xB874),
+                                                     (0xB, 0xB87A)]
+
+# Index used to look up the battlefield tiles
+BATTLEFIELD_TILESET = -1
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+
+class TilesetResolver:
+    """
+    Works out where the patterns for the 16 map tiles come from, for each tileset.
+
+    The substitution tables are parsed once, and parsed again only if the banks containing them are modified.
+    Sources are (bank, address) tuples, each one pointing to the four 8x8 patterns of a tile, in the order: top-left,
+    bottom-left, top-right, bottom-right.
+    """
+
+    def __init__(self, rom: ROM):
+        self.rom = rom
+        self._sources: Dict[int, List[Tuple[int, int]]] = {}
+        # Generation of banks $0A and $0B when the tables were last parsed
+        self._generation: Tuple[int, int] = (-1, -1)
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def sources(self, tileset: int) -> List[Tuple[int, int]]:
+        """
+        Parameters
+        ----------
+        tileset: int
+            Index of the tileset, as found in the map tileset table, or BATTLEFIELD_TILESET
+
+        Returns
+        -------
+        List[Tuple[int, int]]
+            Bank and address of the patterns of each of the 16 tiles
+        """
+        generation = (self.rom.generation(0xA), self.rom.generation(0xB))
+        if generation != self._generation:
+            self._parse_tables()
+            self._generation = generation
+
+        tiles = self._sources.get(tileset)
+        if tiles is None:
+            tiles = self._sources[0xFF]
+
+        return tiles
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def _parse_tables(self) -> None:
+        """
+        Applies the substitutions for all the tilesets, starting from the default tiles each time
+        """
+        self._sources.clear()
+
+        for tileset, entries in _MAP_SUBSTITUTIONS.items():
+            self._sources[tileset] = self._substitute(entries)
+
+        self._sources[0xFF] = self._substitute(_DEFAULT_SUBSTITUTIONS)
+        self._sources[BATTLEFIELD_TILESET] = self._substitute(_BATTLEFIELD_SUBSTITUTIONS)
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def _substitute(self, entries: List[Tuple[int, int]]) -> List[Tuple[int, int]]:
+        """
+        Parameters
+        ----------
+        entries: List[Tuple[int, int]]
+            Bank and address of each entry of the substitution tables to apply
+
+        Returns
+        -------
+        List[Tuple[int, int]]
+            Bank and address of the patterns of each of the 16 tiles
+        """
+        # Default tiles: each 2x2 tile is 64 bytes long
+        tiles = [(0xA, 0x8A40 + (t * 64)) for t in range(16)]
+
+        for bank, address in entries:
+            pattern_address = self.rom.read_word(bank, address)
+            tile_index = (self.rom.read_word(bank, address + 2) - 0x1A40) >> 6
+            tile_count = self.rom.read_word(bank, address + 4) >> 6
+
+            for _ in range(tile_count):
+                # Ignore anything that would be copied outside the map tiles area in the PPU
+                if 0 <= tile_index < 16:
+                    tiles[tile_index] = (bank, pattern_address)
+                pattern_address = pattern_address + 64
+                tile_index = tile_index + 1
+
+        return tiles
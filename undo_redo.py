@@ -2,11 +2,50 @@ __author__ = "Fox Cunning"
 # noinspection SpellCheckingInspection
 __credits__ = ["jcuster", "Fox Cunning"]
 
-from typing import Tuple, List
+import sys
+from array import array
+from collections import deque
+from typing import Deque, Iterable, List, MutableSequence, Optional, Sequence, Tuple, Union
 
-# Default value for maximum number of actions in the undo stack
-_MAX_UNDO = 8192
+# Default memory budget for the undo history, in bytes
+_MAX_UNDO_BYTES = 8 * 1024 * 1024
 
+# Approximate size of an action object, not counting its arguments
+_ACTION_OVERHEAD = 200
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+
+def _estimate_size(args: Tuple) -> int:
+    """
+    Roughly estimates the memory used by a tuple of arguments, looking one level deep into lists and tuples
+    """
+    size = sys.getsizeof(args)
+    for arg in args:
+        size = size + sys.getsizeof(arg)
+        if isinstance(arg, (list, tuple)):
+            size = size + sum([sys.getsizeof(item) for item in arg])
+    return size
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+
+def _pack_values(values: Sequence) -> Union[bytes, array, Tuple]:
+    """
+    Stores a sequence of values in the most compact container that can hold them
+    """
+    try:
+        return bytes(values)
+    except (TypeError, ValueError):
+        pass
+
+    try:
+        return array("q", values)
+    except (TypeError, OverflowError):
+        return tuple(values)
+
+
+# ----------------------------------------------------------------------------------------------------------------------
 
 class UndoRedo:
     """
@@ -19,6 +58,12 @@ class UndoRedo:
     - Instead of directly performing such actions, call self._undo_redo()
     - Example: self._undo_redo(self._make_something, (make_params), (unmake_params), self._unmake_something)
     - Then you can undo with self._undo_redo.undo() and self._undo_redo.redo()
+
+    Actions performed between begin() and commit() are grouped together, and will be undone/redone as a single entry,
+    e.g. all the tiles changed while dragging the mouse.
+    Changes to the items of a list or bytearray can be recorded compactly with apply_delta().
+
+    The history is limited by its (estimated) size in memory: the oldest entries are discarded when it grows too large.
     """
 
     # ------------------------------------------------------------------------------------------------------------------
@@ -35,6 +80,8 @@ class UndoRedo:
 
             self.text = kwargs.get("text", "")
 
+            self.size = _ACTION_OVERHEAD + _estimate_size(do_args) + _estimate_size(undo_args)
+
         def __call__(self):
             self._last_done = not self._last_done
 
@@ -45,10 +92,78 @@ class UndoRedo:
 
     # ------------------------------------------------------------------------------------------------------------------
 
-    def __init__(self, max_undo: int = _MAX_UNDO):
-        self._undo_buf: List[UndoRedo.UndoRedoAction] = []
-        self._redo_buf: List[UndoRedo.UndoRedoAction] = []
-        self._max_undo = max_undo
+    class DeltaAction:
+        """
+        Changes to some of the items of a mutable sequence, stored as indices and old/new values
+        """
+
+        def __init__(self, target: MutableSequence, indices: Iterable[int], old_values: Sequence,
+                     new_values: Sequence, callback: callable = None, **kwargs):
+            self.target = target
+            self.indices = array("L", indices)
+            self.old_values = _pack_values(old_values)
+            self.new_values = _pack_values(new_values)
+            self.callback = callback
+
+            self._last_done = False
+
+            self.text = kwargs.get("text", "")
+
+            self.size = (_ACTION_OVERHEAD + sys.getsizeof(self.indices) + sys.getsizeof(self.old_values) +
+                         sys.getsizeof(self.new_values))
+
+        def __call__(self):
+            self._last_done = not self._last_done
+
+            values = self.new_values if self._last_done else self.old_values
+            target = self.target
+            for index, value in zip(self.indices, values):
+                target[index] = value
+
+            if self.callback is not None:
+                return self.callback(self.indices)
+            return None
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    class CompoundAction:
+        """
+        A group of actions that are undone / redone together
+        """
+
+        def __init__(self, text: str = ""):
+            self.actions: List = []
+            self.text = text
+            self.size = _ACTION_OVERHEAD
+
+            # Sub-actions are performed as soon as they are added
+            self._last_done = True
+
+        def add(self, action) -> None:
+            self.actions.append(action)
+            self.size = self.size + action.size
+            if self.text == "":
+                self.text = action.text
+
+        def __call__(self) -> List:
+            self._last_done = not self._last_done
+
+            if self._last_done:
+                return [action() for action in self.actions]
+            else:
+                return [action() for action in reversed(self.actions)]
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def __init__(self, max_bytes: int = _MAX_UNDO_BYTES):
+        self._undo_buf: Deque = deque()
+        self._redo_buf: Deque = deque()
+        self._max_bytes = max_bytes
+        # Estimated memory used by the actions in the undo stack
+        self._undo_bytes: int = 0
+
+        # Group of actions being recorded between begin() and commit()
+        self._transaction: Optional[UndoRedo.CompoundAction] = None
 
     # ------------------------------------------------------------------------------------------------------------------
 
@@ -56,17 +171,111 @@ class UndoRedo:
         # Create undoable action
         action = UndoRedo.UndoRedoAction(do_func, do_args, undo_args, undo_func, **kwargs)
 
+        self._record(action)
+
+        # Perform the action
+        return action()
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def apply_delta(self, target: MutableSequence, indices: Sequence[int], values: Union[int, Sequence],
+                    callback: callable = None, **kwargs):
+        """
+        Changes items of a list / bytearray as an undoable action, storing only indices and values.
+
+        Parameters
+        ----------
+        target: MutableSequence
+            The list or bytearray that is being edited
+        indices: Sequence[int]
+            Indices of the items to change
+        values
+            New value for all the items, or a sequence containing one value for each index
+        callback: callable
+            Optional function called with the array of indices after the change is done/undone, e.g. to update the UI
+
+        Returns
+        -------
+        any
+            The value returned by the callback, if any
+        """
+        if isinstance(values, int):
+            values = [values] * len(indices)
+
+        action = UndoRedo.DeltaAction(target, indices, [target[index] for index in indices], values, callback,
+                                      **kwargs)
+
+        self._record(action)
+
+        return action()
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def begin(self, text: str = "") -> None:
+        """
+        Starts grouping actions together: everything done until commit() will be undone in a single step.
+        Calling this again before commit() has no effect: the actions will be added to the group already open.
+
+        Parameters
+        ----------
+        text: str
+            Description of the whole group; if empty, the description of its first action is used
+        """
+        if self._transaction is None:
+            self._transaction = UndoRedo.CompoundAction(text)
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def commit(self) -> bool:
+        """
+        Ends a group of actions started with begin()
+
+        Returns
+        -------
+        bool
+            True if a new entry was added to the undo stack, False if there was no group open, or it was empty
+        """
+        if self._transaction is None:
+            return False
+
+        transaction = self._transaction
+        self._transaction = None
+
+        if len(transaction.actions) == 0:
+            return False
+
+        self._push(transaction)
+        return True
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def in_transaction(self) -> bool:
+        return self._transaction is not None
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def _record(self, action) -> None:
+        """
+        Adds a new action to the current group if there is one, otherwise to the undo stack
+        """
+        if self._transaction is not None:
+            self._transaction.add(action)
+            self._redo_buf.clear()
+        else:
+            self._push(action)
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def _push(self, action) -> None:
         # Add it to our undo stack
         self._undo_buf.append(action)
+        self._undo_bytes = self._undo_bytes + action.size
         # ...and clear the redo stack (this will only be filled when something has just been undone)
-        self._redo_buf = []
+        self._redo_buf.clear()
 
-        # If there are too many actions in the undo stack, eliminate the bottom ones
-        while len(self._undo_buf) > self._max_undo:
-            self._undo_buf.pop(0)
-
-        # Perform the action
-        return action()
+        # If the undo stack is too large, eliminate the bottom entries, but always keep the latest one
+        while self._undo_bytes > self._max_bytes and len(self._undo_buf) > 1:
+            self._undo_bytes = self._undo_bytes - self._undo_buf.popleft().size
 
     # ------------------------------------------------------------------------------------------------------------------
 
@@ -102,58 +311,68 @@ class UndoRedo:
     # ------------------------------------------------------------------------------------------------------------------
 
     @staticmethod
-    def _perform_actions(actions: List[UndoRedoAction]) -> List:
+    def _perform_action(action, results: List) -> None:
         """
-        Internal method to perform actions from a list.
+        Internal method to perform an action and collect its results.
 
         Parameters
         ----------
-        actions: List[UndoRedoAction]
-            The list of actions to be performed.
-
-        Returns
-        -------
-        List:
-            A list of results for each performed action.
+        action
+            The action to perform
+        results: List
+            Results will be appended to this list: one for a simple action, one for each sub-action of a group
         """
-        results = [a() for a in reversed(actions)]
-
-        return results
+        if isinstance(action, UndoRedo.CompoundAction):
+            results.extend(action())
+        else:
+            results.append(action())
 
     # ------------------------------------------------------------------------------------------------------------------
 
     def undo(self, count: int = 1) -> List:
+        # Close any group still open (e.g. undo pressed while drawing), so it stays consistent with the stacks
+        self.commit()
+
         if not self.can_undo(count):
             raise ValueError(f"Can't undo {count} actions.")
 
-        first = len(self._undo_buf) - count
-        actions = self._undo_buf[first:]
-        # Pop the requested actions out of the undo stack...
-        self._undo_buf = self._undo_buf[:first]
-        # ...and push them onto the redo stack
-        self._redo_buf += actions
-        # Perform actions
-        return UndoRedo._perform_actions(actions)
+        results = []
+        for _ in range(count):
+            # Pop the action out of the undo stack...
+            action = self._undo_buf.pop()
+            self._undo_bytes = self._undo_bytes - action.size
+            # ...push it onto the redo stack...
+            self._redo_buf.append(action)
+            # ...and reverse it
+            UndoRedo._perform_action(action, results)
+
+        return results
 
     # ------------------------------------------------------------------------------------------------------------------
 
     def redo(self, count: int = 1) -> List:
+        # Close any group still open (e.g. redo pressed while drawing), so it stays consistent with the stacks
+        self.commit()
+
         if not self.can_redo(count):
             raise ValueError(f"Can't redo {count} actions.")
 
-        first = len(self._redo_buf) - count
-        actions = self._redo_buf[first:]
-        self._redo_buf = self._redo_buf[:first]
-        self._undo_buf += actions
+        results = []
+        for _ in range(count):
+            action = self._redo_buf.pop()
+            self._undo_buf.append(action)
+            self._undo_bytes = self._undo_bytes + action.size
+            UndoRedo._perform_action(action, results)
 
-        actions.reverse()
-        return UndoRedo._perform_actions(actions)
+        return results
 
     # ------------------------------------------------------------------------------------------------------------------
 
     def clear(self):
-        self._undo_buf = []
-        self._redo_buf = []
+        self._undo_buf.clear()
+        self._redo_buf.clear()
+        self._undo_bytes = 0
+        self._transaction = None
 
     # ------------------------------------------------------------------------------------------------------------------
 
@@ -0,0 +1,49 @@
+"""
+Tests for the UndoRedo history.
+Run them from the editor's folder with: python -m pytest undo_redo_test.py
+"""
+
+from undo_redo import UndoRedo
+
+
+def test_undo_during_transaction():
+    data = bytearray(4)
+    undo_redo = UndoRedo()
+
+    # An older, complete entry
+    undo_redo.apply_delta(data, [0], 1)
+
+    # Undo pressed while the mouse is still being dragged
+    undo_redo.begin("Draw")
+    undo_redo.apply_delta(data, [1], 2)
+    undo_redo.apply_delta(data, [2], 3)
+    undo_redo.undo()
+
+    # The partial stroke is undone as a whole, and the older entry is untouched
+    assert data == bytearray([1, 0, 0, 0])
+    assert not undo_redo.in_transaction()
+    assert undo_redo.undo_count() == 1
+
+    # Mouse released: nothing left to commit, and the undone stroke can still be redone
+    assert undo_redo.commit() is False
+    assert undo_redo.can_redo()
+
+    undo_redo.redo()
+    assert data == bytearray([1, 2, 3, 0])
+    assert undo_redo.get_undo_text() == "Draw"
+
+
+def test_redo_during_transaction():
+    data = bytearray(4)
+    undo_redo = UndoRedo()
+
+    undo_redo.apply_delta(data, [0], 1)
+    undo_redo.undo()
+
+    undo_redo.begin()
+    undo_redo.redo()
+
+    # An empty group is simply discarded
+    assert data == bytearray([1, 0, 0, 0])
+    assert not undo_redo.in_transaction()
+    assert undo_redo.undo_count() == 1